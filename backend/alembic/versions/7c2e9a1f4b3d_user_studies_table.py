@@ -0,0 +1,73 @@
+"""Move User.studies JSON column into an indexed user_studies table
+
+Revision ID: 7c2e9a1f4b3d
+Revises: 484852f689d1
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2e9a1f4b3d'
+down_revision: Union[str, None] = '484852f689d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _has_user_studies_column() -> bool:
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table("user"):
+        # Fresh database: init_db.py creates both tables from the models
+        return False
+    return any(c["name"] == "studies" for c in inspector.get_columns("user"))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if not _has_user_studies_column():
+        return
+
+    op.create_table(
+        "user_studies",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("user.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("study_id", sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "study_id"),
+    )
+    op.create_index("ix_user_studies_study_id", "user_studies", ["study_id"])
+
+    # Same normalization the API applies: trimmed, non-empty, de-duplicated
+    op.execute(
+        """
+        INSERT INTO user_studies (user_id, study_id)
+        SELECT DISTINCT u.id, btrim(s.study_id)
+        FROM "user" u
+        CROSS JOIN LATERAL json_array_elements_text(u.studies) AS s(study_id)
+        WHERE u.studies IS NOT NULL
+          AND json_typeof(u.studies) = 'array'
+          AND btrim(s.study_id) <> ''
+        ON CONFLICT DO NOTHING
+        """
+    )
+
+    op.drop_column("user", "studies")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column("user", sa.Column("studies", sa.JSON(), nullable=True))
+    op.execute(
+        """
+        UPDATE "user" u
+        SET studies = COALESCE(
+            (SELECT json_agg(us.study_id ORDER BY us.study_id)
+             FROM user_studies us WHERE us.user_id = u.id),
+            '[]'::json
+        )
+        """
+    )
+    op.drop_index("ix_user_studies_study_id", table_name="user_studies")
+    op.drop_table("user_studies")
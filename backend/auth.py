@@ -5,10 +5,22 @@ from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from database import get_db
+from database import get_db, get_session_factory
 from models import User
-from crud import get_user_by_username, pwd_context, delete_user
-from schemas import UserCreate  # Pydantic model with: username, password, name, surname, email, role
+from crud import (
+    get_user_by_username,
+    delete_user,
+    clean_study_ids,
+    get_user_studies,
+    get_studies_by_user,
+    get_study_user_ids,
+    grant_studies,
+    revoke_studies,
+    set_user_studies,
+)
+from services.passwords import hash_password, verify_password
+from services.principal_cache import Principal, principal_cache
+from schemas import StudyAccessUpdate, UserCreate  # UserCreate: username, password, name, surname, email, role
 import os
 from dotenv import load_dotenv
 from pydantic import BaseModel
@@ -46,7 +58,7 @@ async def login(
     db: AsyncSession = Depends(get_db)
 ):
     user = await get_user_by_username(db, form_data.username)
-    if not user or not pwd_context.verify(form_data.password, user.hashed_password):
+    if not user or not await verify_password(form_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     access_token = create_access_token(
         data={"sub": user.username, "role": user.role},
@@ -93,9 +105,7 @@ async def create_user_endpoint(
     # Convert the request to a dict, then remove the plain password and hash it.
     user_data = request.dict()
     plain_password = user_data.pop("password")
-    user_data["hashed_password"] = pwd_context.hash(plain_password)
-    # Ensure studies field is set (will default to an empty list)
-    user_data["studies"] = []
+    user_data["hashed_password"] = await hash_password(plain_password)
     
     # Create the new user using dynamic fields from the schema.
     new_user = User(**user_data)
@@ -116,7 +126,8 @@ async def list_users(
 ):
     result = await db.execute(select(User))
     users = result.scalars().all()
-    return users
+    studies = await get_studies_by_user(db, [u.id for u in users])
+    return [{**u.dict(), "studies": studies[u.id]} for u in users]
 
 @router.delete("/auth/users/{user_id}")
 async def delete_user_endpoint(
@@ -132,6 +143,7 @@ async def delete_user_endpoint(
     if user.username.lower() == "admin":
         raise HTTPException(status_code=403, detail="Cannot delete the primary admin user")
     await delete_user(db, user)
+    principal_cache.invalidate(user.username)
     return {"message": f"User {user.username} deleted"}
 
 @router.patch("/auth/users/{user_id}")
@@ -159,6 +171,7 @@ async def update_user_details(
     
     await db.commit()
     await db.refresh(user)
+    principal_cache.invalidate(user.username)
     
     return {"message": f"User {user.username} updated", "user": user}
 
@@ -179,19 +192,14 @@ async def reset_user_password(
     if not __import__("re").match(regex, new_password):
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters long and include uppercase, lowercase, and a number.")
     # Hash and update password
-    hashed_password = pwd_context.hash(new_password)
+    hashed_password = await hash_password(new_password)
     user.hashed_password = hashed_password
     await db.commit()
     await db.refresh(user)
+    principal_cache.invalidate(user.username)
     return {"message": f"Password for user {user.username} has been reset"}
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db),
-) -> User:
-    """
-    Validates the bearer token and returns the corresponding User row.
-    """
+def _token_subject(token: str) -> str:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str | None = payload.get("sub")
@@ -199,6 +207,18 @@ async def get_current_user(
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     except JWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    return username
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+) -> User:
+    """
+    Validates the bearer token and returns the corresponding User row.
+    Use this only where the row itself is needed (e.g. to modify it);
+    authorization checks should depend on get_current_principal.
+    """
+    username = _token_subject(token)
 
     user = await get_user_by_username(db, username)
     if not user:
@@ -206,31 +226,46 @@ async def get_current_user(
 
     return user
 
+async def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    sessions=Depends(get_session_factory),
+) -> Principal:
+    """
+    Validates the bearer token and returns the user's cached Principal.
+    Only a cache miss (or expiry) opens a database session.
+    """
+    username = _token_subject(token)
+
+    principal = principal_cache.get(username)
+    if principal is None:
+        async with sessions() as db:
+            user = await get_user_by_username(db, username)
+            if not user:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+            principal = Principal.from_user(user, await get_user_studies(db, user.id))
+        principal_cache.put(principal)
+
+    return principal
 
-from fastapi import HTTPException, Depends, status
-from models import User
 
 async def require_study_access(
     study_id: str,
-    user: User = Depends(get_current_user),
-) -> User:
+    principal: Principal = Depends(get_current_principal),
+) -> Principal:
     """
     Enforces study-level authorization.
 
     - Admin users: full access
-    - Regular users: study_id must be present in user.studies
+    - Regular users: study_id must be in the principal's study set, loaded
+      from user_studies on a cache miss
     """
-    if user.role == "admin":
-        return user
-
-    allowed = user.studies or []
-    if study_id not in allowed:
+    if not principal.can_access(study_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Not allowed to access this study",
         )
 
-    return user
+    return principal
 
 @router.patch("/auth/change-password")
 async def change_my_password(
@@ -239,7 +274,7 @@ async def change_my_password(
     db: AsyncSession = Depends(get_db),
 ):
     # Verify current password
-    if not pwd_context.verify(payload.current_password, user.hashed_password):
+    if not await verify_password(payload.current_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Current password is incorrect")
 
     # Validate new password
@@ -250,10 +285,10 @@ async def change_my_password(
             detail="Password must be at least 8 characters long and include uppercase, lowercase, and a number.",
         )
 
-    if pwd_context.verify(payload.new_password, user.hashed_password):
+    if await verify_password(payload.new_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="New password must be different")
 
-    user.hashed_password = pwd_context.hash(payload.new_password)
+    user.hashed_password = await hash_password(payload.new_password)
     await db.commit()
     return {"message": "Password updated"}
 
@@ -271,20 +306,10 @@ async def update_user_studies(
         raise HTTPException(status_code=404, detail="User not found")
 
     # Normalize: trim, drop empty, de-duplicate while preserving order
-    cleaned: list[str] = []
-    seen = set()
-    for s in payload.studies:
-        sid = (s or "").strip()
-        if not sid:
-            continue
-        if sid in seen:
-            continue
-        seen.add(sid)
-        cleaned.append(sid)
-
-    user.studies = cleaned
-    await db.commit()
-    await db.refresh(user)
+    cleaned = clean_study_ids(payload.studies)
+
+    await set_user_studies(db, user.id, cleaned)
+    principal_cache.invalidate(user.username)
 
     return {
         "message": f"Studies updated for user {user.username}",
@@ -292,6 +317,58 @@ async def update_user_studies(
             "id": user.id,
             "username": user.username,
             "role": user.role,
-            "studies": user.studies or [],
+            "studies": sorted(cleaned),
         },
-    }
\ No newline at end of file
+    }
+
+async def _usernames(db: AsyncSession, user_ids: List[int]) -> dict:
+    result = await db.execute(select(User.id, User.username).where(User.id.in_(user_ids)))
+    found = dict(result.all())
+    missing = sorted(set(user_ids) - found.keys())
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Users not found: {missing}")
+    return found
+
+@router.post("/auth/studies/assign")
+async def assign_studies(
+    payload: StudyAccessUpdate,
+    token: str = Depends(admin_required),
+    db: AsyncSession = Depends(get_db),
+):
+    study_ids = clean_study_ids(payload.study_ids)
+    user_ids = list(dict.fromkeys(payload.user_ids))
+    if not study_ids or not user_ids:
+        raise HTTPException(status_code=400, detail="user_ids and study_ids must not be empty")
+
+    usernames = await _usernames(db, user_ids)
+    granted = await grant_studies(db, user_ids, study_ids)
+    for username in usernames.values():
+        principal_cache.invalidate(username)
+
+    return {"granted": granted, "user_ids": user_ids, "study_ids": study_ids}
+
+@router.post("/auth/studies/revoke")
+async def revoke_studies_endpoint(
+    payload: StudyAccessUpdate,
+    token: str = Depends(admin_required),
+    db: AsyncSession = Depends(get_db),
+):
+    study_ids = clean_study_ids(payload.study_ids)
+    user_ids = list(dict.fromkeys(payload.user_ids))
+    if not study_ids or not user_ids:
+        raise HTTPException(status_code=400, detail="user_ids and study_ids must not be empty")
+
+    usernames = await _usernames(db, user_ids)
+    revoked = await revoke_studies(db, user_ids, study_ids)
+    for username in usernames.values():
+        principal_cache.invalidate(username)
+
+    return {"revoked": revoked, "user_ids": user_ids, "study_ids": study_ids}
+
+@router.get("/auth/studies/{study_id}/users")
+async def list_study_users(
+    study_id: str,
+    token: str = Depends(admin_required),
+    db: AsyncSession = Depends(get_db),
+):
+    return {"study_id": study_id, "user_ids": await get_study_user_ids(db, study_id)}
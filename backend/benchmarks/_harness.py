@@ -0,0 +1,93 @@
+"""
+Shared driver for the HTTP benchmarks: fire ``requests`` calls at an ASGI
+app in-process (``httpx.ASGITransport``) with at most ``concurrency`` in
+flight, optionally polling a cheap probe route meanwhile to show how long
+other requests queue behind the load (probe latency counts from when the
+probe was due, so a blocked event loop shows up in it).
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+
+import httpx
+from fastapi import FastAPI
+
+Request = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * q) - 1))]
+
+
+@dataclass
+class LoadResult:
+    requests: int
+    elapsed_s: float
+    latencies_ms: List[float] = field(default_factory=list)
+    probe_ms: List[float] = field(default_factory=list)
+
+    @property
+    def rps(self) -> float:
+        return self.requests / self.elapsed_s
+
+    def line(self, label: str) -> str:
+        out = (
+            f"{label:>6}: {self.rps:8.1f} req/s  total {self.elapsed_s:.2f}s  "
+            f"p50 {percentile(self.latencies_ms, 0.5):.1f} ms  p99 {percentile(self.latencies_ms, 0.99):.1f} ms"
+        )
+        if self.probe_ms:
+            out += (
+                f"  probe p50 {percentile(self.probe_ms, 0.5):.1f} ms"
+                f"  p99 {percentile(self.probe_ms, 0.99):.1f} ms"
+            )
+        return out
+
+
+async def run_load(
+    app: FastAPI,
+    request: Request,
+    *,
+    requests: int,
+    concurrency: int,
+    probe_path: Optional[str] = None,
+) -> LoadResult:
+    """Issue ``request(client, i)`` for i in range(requests); every response must be 2xx."""
+    sem = asyncio.Semaphore(concurrency)
+    result = LoadResult(requests=requests, elapsed_s=0.0)
+    done = asyncio.Event()
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def one(i: int) -> None:
+            async with sem:
+                t0 = time.perf_counter()
+                r = await request(client, i)
+                result.latencies_ms.append((time.perf_counter() - t0) * 1000.0)
+                r.raise_for_status()
+
+        async def prober() -> None:
+            # Measured from when the probe was due, so time spent waiting for a
+            # blocked event loop counts (that is the stall users see)
+            while not done.is_set():
+                due = time.perf_counter() + 0.01
+                await asyncio.sleep(0.01)
+                await client.get(probe_path)
+                result.probe_ms.append((time.perf_counter() - due) * 1000.0)
+
+        probe_task = asyncio.create_task(prober()) if probe_path else None
+        t0 = time.perf_counter()
+        try:
+            await asyncio.gather(*(one(i) for i in range(requests)))
+            result.elapsed_s = time.perf_counter() - t0
+        finally:
+            done.set()
+            if probe_task is not None:
+                await probe_task
+
+    return result
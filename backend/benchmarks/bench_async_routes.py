@@ -0,0 +1,135 @@
+"""
+Concurrent-request throughput of a study export: sync (threadpool) vs the
+async Mongo route, against a real MongoDB.
+
+* ``before`` -- the old handler shape: a plain ``def`` route reading the
+  same documents through a blocking ``MongoClient``, which FastAPI runs on
+  AnyIO's 40-thread pool.
+* ``after``  -- the app's own ``GET /api/studies/{id}/responses``
+  (``main.app`` with its real routers on ``AsyncMongoClient``); only
+  ``require_study_access`` is overridden.
+
+Both build the same ``SurveyResponseOut`` rows. While the exports run, the
+app's plain-``def`` ``/api/hello`` is polled to show queueing behind the
+threadpool.
+
+``--docs`` synthetic responses are written to a scratch database
+(``--db``, dropped afterwards -- don't point it at real data).
+
+Usage (from backend/, with requirements-dev.txt installed and a MongoDB):
+
+    python -m benchmarks.bench_async_routes --mongo-url mongodb://localhost:27017 --docs 2000
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from fastapi import FastAPI, HTTPException
+from pymongo import DESCENDING, MongoClient
+
+from benchmarks._harness import run_load
+
+STUDY_ID = "bench-study"
+
+
+def _configure(args: argparse.Namespace) -> None:
+    # Read by the app's modules at import time; auth/database are imported but not used
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["MONGO_DB"] = args.db
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://bench@localhost/bench")
+
+
+def _seed(args: argparse.Namespace) -> None:
+    col = MongoClient(args.mongo_url)[args.db]["responses"]
+    t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    col.insert_many([
+        {
+            "data_type": "survey_response", "study_id": STUDY_ID, "user_id": f"user{i % 50}",
+            "module_id": "m1", "module_name": "Daily", "module_index": 0, "platform": "ios",
+            "responses": {f"q{q}": q * i % 7 for q in range(10)},
+            "response_time": t0 + timedelta(minutes=i), "alert_time": t0 + timedelta(minutes=i),
+        }
+        for i in range(args.docs)
+    ])
+    col.create_index([("study_id", 1), ("response_time", 1), ("_id", 1)])
+
+
+def _before_app(args: argparse.Namespace) -> FastAPI:
+    from routers.studies_responses_v2 import _RESPONSE_PROJECTION, _response_row
+    from schemas import SurveyResponseOut
+
+    app = FastAPI()
+    col = MongoClient(args.mongo_url, maxPoolSize=50, tz_aware=True)[args.db]["responses"]
+
+    @app.get("/api/studies/{study_id}/responses")
+    def list_study_responses(study_id: str):
+        docs = col.find({"study_id": study_id}, projection=_RESPONSE_PROJECTION).sort([("response_time", DESCENDING)])
+        out: List[SurveyResponseOut] = [SurveyResponseOut(**_response_row(d)) for d in docs]
+        if not out:
+            raise HTTPException(status_code=404)
+        return out
+
+    @app.get("/api/hello")
+    def hello():
+        return {"message": "Hello from FastAPI"}
+
+    return app
+
+
+def _after_app() -> FastAPI:
+    from auth import require_study_access
+    from main import app
+    from services.principal_cache import Principal
+
+    admin = Principal(id=0, username="bench", role="admin", studies=frozenset())
+    app.dependency_overrides[require_study_access] = lambda: admin
+    return app
+
+
+async def _run(mode: str, args: argparse.Namespace):
+    from core.mongo import close_mongo, connect_mongo
+
+    async def export(client, i):
+        return await client.get(f"/api/studies/{STUDY_ID}/responses")
+
+    if mode == "before":
+        app = _before_app(args)
+    else:
+        await connect_mongo()
+        app = _after_app()
+    try:
+        return await run_load(
+            app, export, requests=args.requests, concurrency=args.concurrency, probe_path="/api/hello"
+        )
+    finally:
+        if mode == "after":
+            await close_mongo()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    ap.add_argument("--db", default="bench_async_routes", help="scratch database, dropped afterwards")
+    ap.add_argument("--docs", type=int, default=2000, help="responses in the exported study")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=100)
+    args = ap.parse_args()
+
+    _configure(args)
+    if MongoClient(args.mongo_url)[args.db].list_collection_names():
+        raise SystemExit(f"Database {args.db!r} is not empty; pick a scratch --db")
+    _seed(args)
+    try:
+        for mode in ("before", "after"):
+            print(asyncio.run(_run(mode, args)).line(mode))
+    finally:
+        MongoClient(args.mongo_url).drop_database(args.db)
+
+
+if __name__ == "__main__":
+    main()
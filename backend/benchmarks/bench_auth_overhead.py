@@ -0,0 +1,145 @@
+"""
+Per-request cost of authentication: DB lookup vs cached principal.
+
+Drives the real dependencies from ``auth`` in-process; only the database
+session is replaced (through ``app.dependency_overrides``) by an
+``AsyncSession`` stand-in that answers the user and user_studies queries
+after ``--db-latency-ms`` of awaited I/O per statement.
+
+* ``before`` -- ``auth.get_current_user`` plus ``crud.get_user_studies``
+  on every request (the old path: a session and two queries per request).
+* ``after``  -- ``auth.require_study_access`` on ``get_current_principal``;
+  only the first request per user (and one per TTL) opens a session.
+
+Both guard a trivial ``/studies/{study_id}/ping`` route, so the numbers are
+the auth overhead itself. ``--users`` distinct tokens are cycled.
+
+Usage (from backend/, with requirements-dev.txt and ``python-jose`` installed):
+
+    python -m benchmarks.bench_auth_overhead --requests 5000 --concurrency 50
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+from datetime import timedelta
+from typing import Any, List
+
+from fastapi import Depends, FastAPI, HTTPException
+
+from benchmarks._harness import run_load
+
+# auth and database read these at import time; the engine is never connected
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://bench@localhost/bench")
+
+import auth  # noqa: E402
+from crud import get_user_studies  # noqa: E402
+from database import get_db, get_session_factory  # noqa: E402
+from models import User, UserStudy  # noqa: E402
+from services.principal_cache import Principal, principal_cache  # noqa: E402
+
+STUDIES = ["s1", "s2"]
+
+
+class _Result:
+    def __init__(self, rows: List[Any]):
+        self._rows = rows
+
+    def scalars(self) -> "_Result":
+        return self
+
+    def first(self) -> Any:
+        return self._rows[0] if self._rows else None
+
+    def all(self) -> List[Any]:
+        return list(self._rows)
+
+
+class BenchSession:
+    """Answers ``select(User)`` by username and ``select(UserStudy.study_id)`` by user id."""
+
+    def __init__(self, latency_s: float):
+        self.latency_s = latency_s
+
+    async def execute(self, stmt: Any) -> _Result:
+        await asyncio.sleep(self.latency_s)
+        entity = stmt.column_descriptions[0]["entity"]
+        value = next(iter(stmt.compile().params.values()))
+        if entity is User:
+            uid = int(value.removeprefix("user"))
+            return _Result([User(
+                id=uid, username=value, hashed_password="x", name="Bench", surname=str(uid),
+                email=f"{value}@bench.invalid", role="user",
+            )])
+        if entity is UserStudy:
+            return _Result(STUDIES)
+        raise NotImplementedError(str(stmt))
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "BenchSession":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+
+def build_app(mode: str, db_latency_s: float) -> FastAPI:
+    app = FastAPI()
+
+    async def bench_db():
+        async with BenchSession(db_latency_s) as session:
+            yield session
+
+    app.dependency_overrides[get_db] = bench_db
+    app.dependency_overrides[get_session_factory] = lambda: (lambda: BenchSession(db_latency_s))
+
+    if mode == "before":
+        @app.get("/studies/{study_id}/ping")
+        async def ping(study_id: str, user: User = Depends(auth.get_current_user), db=Depends(get_db)):
+            if not Principal.from_user(user, await get_user_studies(db, user.id)).can_access(study_id):
+                raise HTTPException(status_code=403)
+            return {"ok": True}
+    else:
+        @app.get("/studies/{study_id}/ping")
+        async def ping(study_id: str, _user: Principal = Depends(auth.require_study_access)):
+            return {"ok": True}
+
+    return app
+
+
+async def _run(mode: str, args: argparse.Namespace):
+    principal_cache.invalidate()
+    app = build_app(mode, args.db_latency_ms / 1000.0)
+    tokens = [
+        auth.create_access_token({"sub": f"user{i}"}, timedelta(hours=1)) for i in range(args.users)
+    ]
+
+    async def ping(client, i):
+        headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+        return await client.get("/studies/s1/ping", headers=headers)
+
+    return await run_load(app, ping, requests=args.requests, concurrency=args.concurrency)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--users", type=int, default=20, help="distinct tokens")
+    ap.add_argument("--db-latency-ms", type=float, default=2.0, help="simulated round trip per statement")
+    args = ap.parse_args()
+
+    for mode in ("before", "after"):
+        line = asyncio.run(_run(mode, args)).line(mode)
+        if mode == "after":
+            stats = principal_cache.snapshot()
+            line += f"  (cache hits {stats['hits']}, misses {stats['misses']})"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Size and load time of a study export: JSON vs Parquet vs Arrow IPC.
+
+Builds ``--rows`` synthetic responses to a ``--questions``-question module
+and encodes them three ways, without a database:
+
+* ``json``    -- the ``/studies/{id}/responses`` body (list of rows with a
+  ``responses`` dict), loaded with ``json.loads`` and flattened into a
+  DataFrame the way analysts do it today.
+* ``parquet`` / ``arrow`` -- ``services.columnar_export`` output, loaded
+  with pyarrow (``to_pandas`` when pandas is installed).
+
+Usage (from backend/, needs ``pyarrow``; ``pandas`` optional):
+
+    python -m benchmarks.bench_columnar_export --rows 100000 --questions 20
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from services.columnar_export import ResponseTableLayout, export_body
+from services.question_catalog import QuestionCatalog
+
+try:
+    import pandas as pd
+except ImportError:  # pragma: no cover
+    pd = None
+
+
+def _module(n_questions: int) -> Dict[str, Any]:
+    questions = []
+    for i in range(n_questions):
+        if i % 3 == 0:
+            questions.append({"id": f"q{i}", "type": "multi", "text": f"Q{i}", "options": ["1 low", "2 mid", "3 high"]})
+        elif i % 3 == 1:
+            questions.append({"id": f"q{i}", "type": "number", "text": f"Q{i}"})
+        else:
+            questions.append({"id": f"q{i}", "type": "text", "text": f"Q{i}"})
+    return {"id": "m1", "name": "Daily", "params": {"sections": [{"name": "S", "questions": questions}]}}
+
+
+def _docs(rows: int, n_questions: int) -> List[Dict[str, Any]]:
+    rnd = random.Random(0)
+    t0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    out = []
+    for i in range(rows):
+        responses: Dict[str, Any] = {}
+        for q in range(n_questions):
+            if q % 3 == 0:
+                responses[f"q{q}"] = rnd.choice(["1 low", "2 mid", "3 high"])
+            elif q % 3 == 1:
+                responses[f"q{q}"] = rnd.randint(0, 100)
+            else:
+                responses[f"q{q}"] = rnd.choice(["ok", "tired", "busy day", ""])
+        t = t0 + timedelta(minutes=i)
+        out.append({
+            "user_id": f"user{i % 50}", "module_id": "m1", "module_name": "Daily", "module_index": 0,
+            "platform": "ios", "responses": responses, "response_time": t, "alert_time": t,
+        })
+    return out
+
+
+async def _encode(layout: ResponseTableLayout, fmt: str, docs: List[Dict[str, Any]]) -> bytes:
+    async def it():
+        for d in docs:
+            yield d
+
+    return b"".join([chunk async for chunk in export_body(layout, fmt, it())])
+
+
+def _timed(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--questions", type=int, default=20)
+    args = ap.parse_args()
+
+    module = _module(args.questions)
+    layout = ResponseTableLayout(QuestionCatalog([module], {"m1": module}))
+    docs = _docs(args.rows, args.questions)
+
+    json_body = json.dumps(
+        [{**d, "study_id": "s", "data_type": "survey_response"} for d in docs],
+        default=lambda v: v.isoformat(),
+    ).encode()
+
+    def load_json():
+        rows = json.loads(json_body)
+        flat = [{**{k: v for k, v in r.items() if k != "responses"}, **r["responses"]} for r in rows]
+        if pd is not None:
+            pd.DataFrame(flat)
+
+    bodies = {fmt: asyncio.run(_encode(layout, fmt, docs)) for fmt in ("parquet", "arrow")}
+
+    def load_parquet():
+        t = pq.read_table(io.BytesIO(bodies["parquet"]))
+        if pd is not None:
+            t.to_pandas()
+
+    def load_arrow():
+        t = pa.ipc.open_stream(bodies["arrow"]).read_all()
+        if pd is not None:
+            t.to_pandas()
+
+    target = "DataFrame" if pd is not None else "pyarrow/python objects"
+    print(f"{args.rows} rows x {args.questions} questions, load into {target}")
+    for name, body, load in (
+        ("json", json_body, load_json),
+        ("parquet", bodies["parquet"], load_parquet),
+        ("arrow", bodies["arrow"], load_arrow),
+    ):
+        ms = min(_timed(load) for _ in range(3))
+        print(f"{name:>8}: {len(body) / 1e6:8.2f} MB  ({len(body) / len(json_body):5.1%} of json)  load {ms:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
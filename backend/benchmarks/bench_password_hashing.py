@@ -0,0 +1,82 @@
+"""
+Latency of unrelated endpoints while logins are running: inline bcrypt vs
+the worker pool in ``services.passwords``.
+
+* ``before`` -- ``/login`` calls ``pwd_context.verify`` directly in an
+  ``async def`` handler (the old ``auth.login`` path).
+* ``after``  -- ``/login`` awaits ``verify_password``.
+
+``--logins`` login requests are fired with ``--concurrency`` in flight
+while an ``async def`` probe route (like ``/api/hello``) is polled through
+``benchmarks._harness``; a blocked event loop shows up in the probe
+latency as the stall every other request on the worker sees.
+Uses the real bcrypt backend and cost factor from ``crud.pwd_context``.
+
+Usage (from backend/, with requirements-dev.txt installed):
+
+    python -m benchmarks.bench_password_hashing --logins 40 --concurrency 8
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+from benchmarks._harness import LoadResult, run_load
+from crud import pwd_context
+from services.passwords import HasherBusy, verify_password
+
+PASSWORD = "Correct-Horse-1"
+
+
+def build_app(mode: str, hashed: str) -> FastAPI:
+    app = FastAPI()
+
+    if mode == "before":
+        @app.post("/login")
+        async def login():
+            if not pwd_context.verify(PASSWORD, hashed):
+                raise HTTPException(status_code=401)
+            return {"ok": True}
+    else:
+        @app.post("/login")
+        async def login():
+            try:
+                ok = await verify_password(PASSWORD, hashed)
+            except HasherBusy:
+                raise HTTPException(status_code=503)
+            if not ok:
+                raise HTTPException(status_code=401)
+            return {"ok": True}
+
+    @app.get("/probe")
+    async def probe():
+        return {"ok": True}
+
+    return app
+
+
+async def _run(mode: str, hashed: str, args: argparse.Namespace) -> LoadResult:
+    async def login(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        return await client.post("/login")
+
+    return await run_load(
+        build_app(mode, hashed), login, requests=args.logins, concurrency=args.concurrency, probe_path="/probe"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--logins", type=int, default=40)
+    ap.add_argument("--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    hashed = pwd_context.hash(PASSWORD)
+    for mode in ("before", "after"):
+        print(asyncio.run(_run(mode, hashed, args)).line(mode))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Shared MongoDB access for the whole backend.
+
+One ``AsyncMongoClient`` per process, opened and closed by the FastAPI
+lifespan in ``main.py``. Routers get collections through the
+``get_responses_col`` / ``get_studies_col`` dependencies instead of
+building their own clients at import time.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, AsyncIterator, Dict, Optional
+
+from pymongo import AsyncMongoClient
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.asynchronous.cursor import AsyncCursor
+from pymongo.asynchronous.database import AsyncDatabase
+
+MONGO_URL = os.getenv("MONGO_URL")
+MONGO_DB = os.getenv("MONGO_DB")
+if not MONGO_URL or not MONGO_DB:
+    raise RuntimeError("MongoDB connection details are missing (MONGO_URL/MONGO_DB).")
+
+# Pool tuning (per worker process)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+# Documents per getMore; also how often long scans hand control back to the loop
+MONGO_BATCH_SIZE = int(os.getenv("MONGO_BATCH_SIZE", "500"))
+
+RESPONSES_COLLECTION = "responses"
+STUDIES_COLLECTION = "studies"
+
+_client: Optional[AsyncMongoClient] = None
+
+
+async def connect_mongo() -> AsyncMongoClient:
+    """Create the process-wide client (idempotent)."""
+    global _client
+    if _client is None:
+        _client = AsyncMongoClient(
+            MONGO_URL,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            # BSON dates come back as aware UTC datetimes and serialise with an offset
+            tz_aware=True,
+            appname="momentum-dashboard",
+        )
+        await _client.aconnect()
+    return _client
+
+
+async def close_mongo() -> None:
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def get_client() -> AsyncMongoClient:
+    if _client is None:
+        raise RuntimeError("MongoDB client is not initialised (app lifespan not running?)")
+    return _client
+
+
+def get_mongo_db() -> AsyncDatabase:
+    return get_client()[MONGO_DB]
+
+
+# FastAPI dependencies
+def get_responses_col() -> AsyncCollection:
+    return get_mongo_db()[RESPONSES_COLLECTION]
+
+
+def get_studies_col() -> AsyncCollection:
+    return get_mongo_db()[STUDIES_COLLECTION]
+
+
+async def iter_docs(cursor: AsyncCursor, batch_size: int = MONGO_BATCH_SIZE) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Iterate a cursor in ``batch_size`` chunks, yielding to the event loop
+    after every chunk so that long scans don't starve other requests.
+    """
+    cursor.batch_size(batch_size)
+    n = 0
+    async for doc in cursor:
+        yield doc
+        n += 1
+        if n % batch_size == 0:
+            await asyncio.sleep(0)
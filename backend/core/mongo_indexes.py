@@ -0,0 +1,222 @@
+"""
+Declared MongoDB indexes and the query plans they are meant to serve.
+
+``INDEXES`` is the single source of truth for what the backend expects to
+exist; ``ensure_indexes`` applies it idempotently (startup, or
+``python manage_indexes.py``). ``CANONICAL_QUERIES`` mirrors the filters
+and sorts the routers actually issue, ``find`` queries and the leading
+``$match`` of aggregations alike, and ``verify_query_plans`` explains
+each one and reports any that would fall back to a collection scan, plus
+declared indexes whose keys exist under another name (Mongo refuses to
+create a second index on the same keys, so ours would never appear).
+"""
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.asynchronous.database import AsyncDatabase
+
+from core.mongo import RESPONSES_COLLECTION, STUDIES_COLLECTION
+from services.response_docs import legacy_study_filter, time_range_filter
+from services.study_versions import STUDY_VERSION_INDEX
+
+logger = logging.getLogger(__name__)
+
+# strict: refuse to start on a COLLSCAN or a misnamed index; warn: log it; off: skip the check
+MONGO_INDEX_CHECK = os.getenv("MONGO_INDEX_CHECK", "strict").lower()
+
+Keys = List[Tuple[str, int]]
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    name: str
+    keys: Keys
+
+
+INDEXES: List[IndexSpec] = [
+    # responses:labeled / streaming list; _id makes the keyset cursor an index seek
+    IndexSpec(RESPONSES_COLLECTION, "study_response_time", [
+        ("study_id", ASCENDING), ("response_time", ASCENDING), ("_id", ASCENDING),
+    ]),
+    # per-user baselines and adherence
+    IndexSpec(RESPONSES_COLLECTION, "study_user_alert_time", [
+        ("study_id", ASCENDING), ("user_id", ASCENDING), ("alert_time", ASCENDING),
+    ]),
+    # user mapping and per-module views
+    IndexSpec(RESPONSES_COLLECTION, "study_module_user_response_time", [
+        ("study_id", ASCENDING), ("module_id", ASCENDING), ("user_id", ASCENDING), ("response_time", ASCENDING),
+    ]),
+    IndexSpec(STUDIES_COLLECTION, "study_id_timestamp", STUDY_VERSION_INDEX),
+]
+
+
+@dataclass(frozen=True)
+class CanonicalQuery:
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[Keys] = None
+    # Set for aggregations: the stages after ``{"$match": filter}``
+    pipeline: Optional[List[Dict[str, Any]]] = None
+
+
+_SID = "__explain__"
+_RANGE = time_range_filter("response_time", "2024-01-01T00:00:00Z", "2024-02-01T00:00:00Z") or {}
+_COUNT = [{"$group": {"_id": "$user_id", "n": {"$sum": 1}}}]
+
+CANONICAL_QUERIES: List[CanonicalQuery] = [
+    CanonicalQuery("responses list", RESPONSES_COLLECTION,
+                   {"study_id": _SID}, [("response_time", DESCENDING)]),
+    CanonicalQuery("responses:labeled page", RESPONSES_COLLECTION,
+                   {"study_id": _SID}, [("response_time", DESCENDING), ("_id", DESCENDING)]),
+    CanonicalQuery("responses:labeled by user", RESPONSES_COLLECTION,
+                   {"study_id": _SID, "user_id": {"$in": ["a", "b"]}}, [("response_time", DESCENDING), ("_id", DESCENDING)]),
+    CanonicalQuery("responses:labeled by module", RESPONSES_COLLECTION,
+                   {"study_id": _SID, "module_id": {"$in": ["m"]}}, [("response_time", DESCENDING), ("_id", DESCENDING)]),
+    CanonicalQuery("user baseline", RESPONSES_COLLECTION,
+                   {"study_id": _SID, "user_id": "u"}, [("alert_time", ASCENDING), ("response_time", ASCENDING)]),
+    # raw-only documents: the study_id index's null range, then the regex on raw
+    CanonicalQuery("raw-only lookup", RESPONSES_COLLECTION, legacy_study_filter(_SID)),
+    CanonicalQuery("grouped responses", RESPONSES_COLLECTION,
+                   {"study_id": _SID}, [("user_id", ASCENDING), ("alert_time", ASCENDING)]),
+    CanonicalQuery("user mapping", RESPONSES_COLLECTION,
+                   {"study_id": _SID, "module_id": "m"}, [("user_id", ASCENDING), ("response_time", ASCENDING)]),
+    CanonicalQuery("user mapping fallback", RESPONSES_COLLECTION,
+                   {"study_id": _SID, "module_id": "m",
+                    "$or": [{"responses": {"$type": "string"}}, {"response_time": {"$type": ["string", "number"]}}]}),
+    CanonicalQuery("study versions", STUDIES_COLLECTION, {"properties.study_id": _SID}),
+    # Aggregations
+    CanonicalQuery("responses:facets", RESPONSES_COLLECTION,
+                   {"study_id": _SID}, pipeline=[{"$facet": {"users": _COUNT, "total": [{"$count": "n"}]}}]),
+    CanonicalQuery("responses:facets by time", RESPONSES_COLLECTION,
+                   {"study_id": _SID, **_RANGE}, pipeline=[{"$facet": {"users": _COUNT, "total": [{"$count": "n"}]}}]),
+    CanonicalQuery("adherence baselines", RESPONSES_COLLECTION,
+                   {"study_id": _SID, "user_id": {"$in": ["a", "b"]}}, pipeline=_COUNT),
+    CanonicalQuery("adherence actual times", RESPONSES_COLLECTION,
+                   {"study_id": _SID, "user_id": {"$in": ["a", "b"]}, **_RANGE}, pipeline=_COUNT),
+    CanonicalQuery("user mapping pipeline", RESPONSES_COLLECTION,
+                   {"study_id": _SID, "module_id": "m", "responses.q": {"$exists": True},
+                    "response_time": {"$type": "date"}},
+                   pipeline=[{"$sort": {"user_id": 1, "response_time": 1}}] + _COUNT),
+]
+
+
+async def _existing_indexes(db: AsyncDatabase, collection: str) -> Dict[Tuple[Tuple[str, int], ...], str]:
+    """Key pattern -> name of every index on ``collection``."""
+    out: Dict[Tuple[Tuple[str, int], ...], str] = {}
+    async for ix in await db[collection].list_indexes():
+        keys = tuple((k, int(v) if isinstance(v, (int, float)) else v) for k, v in ix["key"].items())
+        out[keys] = ix["name"]
+    return out
+
+
+async def _misnamed(db: AsyncDatabase) -> List[Tuple[IndexSpec, str]]:
+    """Declared specs whose key pattern already exists under a different name, with that name."""
+    out: List[Tuple[IndexSpec, str]] = []
+    existing: Dict[str, Dict[Tuple[Tuple[str, int], ...], str]] = {}
+    for spec in INDEXES:
+        if spec.collection not in existing:
+            existing[spec.collection] = await _existing_indexes(db, spec.collection)
+        name = existing[spec.collection].get(tuple(spec.keys))
+        if name is not None and name != spec.name:
+            out.append((spec, name))
+    return out
+
+
+async def index_name_conflicts(db: AsyncDatabase) -> List[str]:
+    """Declared indexes whose key pattern already exists under a different name."""
+    return [f"{spec.collection}.{spec.name} exists as {name!r}" for spec, name in await _misnamed(db)]
+
+
+async def ensure_indexes(db: AsyncDatabase) -> List[str]:
+    """
+    Create every declared index (no-op for ones that already exist). Specs
+    whose keys exist under another name are skipped -- Mongo would reject
+    the whole batch -- and reported by ``verify_query_plans``.
+    """
+    skip = {spec.name for spec, _ in await _misnamed(db)}
+    created: List[str] = []
+    by_collection: Dict[str, List[IndexModel]] = {}
+    for spec in INDEXES:
+        if spec.name not in skip:
+            by_collection.setdefault(spec.collection, []).append(IndexModel(spec.keys, name=spec.name))
+    for coll, models in by_collection.items():
+        created.extend(await db[coll].create_indexes(models))
+    return created
+
+
+def _winning_plans(explained: Any) -> Iterator[Any]:
+    # find: queryPlanner.winningPlan; aggregate: the same under a $cursor stage or per shard
+    if isinstance(explained, dict):
+        for k, v in explained.items():
+            if k == "winningPlan":
+                yield v
+            else:
+                yield from _winning_plans(v)
+    elif isinstance(explained, list):
+        for v in explained:
+            yield from _winning_plans(v)
+
+
+def _stages(plan: Any) -> Iterator[str]:
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for v in plan.values():
+            yield from _stages(v)
+    elif isinstance(plan, list):
+        for v in plan:
+            yield from _stages(v)
+
+
+async def verify_query_plans(db: AsyncDatabase) -> Dict[str, Any]:
+    """
+    Winning-plan stages per canonical query, the names of those that
+    COLLSCAN, and ``index_name_conflicts``.
+    """
+    plans: Dict[str, List[str]] = {}
+    collscans: List[str] = []
+    for cq in CANONICAL_QUERIES:
+        if cq.pipeline is not None:
+            explained = await db.command(
+                "aggregate", cq.collection, pipeline=[{"$match": cq.filter}, *cq.pipeline], explain=True
+            )
+        else:
+            cursor = db[cq.collection].find(cq.filter)
+            if cq.sort:
+                cursor = cursor.sort(cq.sort)
+            explained = await cursor.explain()
+        stages = list(_stages(list(_winning_plans(explained))))
+        plans[cq.name] = stages
+        if "COLLSCAN" in stages:
+            collscans.append(cq.name)
+    return {"plans": plans, "collscans": collscans, "name_conflicts": await index_name_conflicts(db)}
+
+
+async def apply_and_verify(db: AsyncDatabase) -> None:
+    """Startup hook: ensure the index set, then check plans per ``MONGO_INDEX_CHECK``."""
+    try:
+        created = await ensure_indexes(db)
+        logger.info("Mongo indexes ensured: %s", ", ".join(created))
+    except Exception as e:  # read-only users etc.; the plan check below still tells the truth
+        logger.warning("Could not ensure Mongo indexes: %s", e)
+
+    if MONGO_INDEX_CHECK == "off":
+        return
+    result = await verify_query_plans(db)
+    problems = []
+    if result["collscans"]:
+        problems.append(f"Queries planned as COLLSCAN: {', '.join(result['collscans'])}")
+    if result["name_conflicts"]:
+        problems.append(f"Indexes present under another name: {'; '.join(result['name_conflicts'])}")
+    if problems:
+        msg = ". ".join(problems)
+        if MONGO_INDEX_CHECK == "strict":
+            raise RuntimeError(msg)
+        logger.warning(msg)
@@ -0,0 +1,52 @@
+"""
+Optional shared Redis connection.
+
+Set ``REDIS_URL`` (the compose files point it at the ``redis`` service) to
+enable cross-worker caching. Without it -- or while Redis is unreachable --
+``get_redis()`` returns ``None`` / callers fall back to computing locally;
+nothing in the request path *requires* Redis.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Optional
+
+from redis.asyncio import Redis
+
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_SOCKET_TIMEOUT_S = float(os.getenv("REDIS_SOCKET_TIMEOUT_S", "0.5"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[Redis] = None
+
+
+async def connect_redis() -> Optional[Redis]:
+    """Create the process-wide client if ``REDIS_URL`` is set (idempotent)."""
+    global _client
+    if _client is None and REDIS_URL:
+        _client = Redis.from_url(
+            REDIS_URL,
+            socket_timeout=REDIS_SOCKET_TIMEOUT_S,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT_S,
+            max_connections=REDIS_MAX_CONNECTIONS,
+        )
+        try:
+            await _client.ping()
+        except Exception as exc:
+            # Keep the client: redis-py reconnects on the next command
+            logger.warning("Redis at %s not reachable yet: %s", REDIS_URL, exc)
+    return _client
+
+
+async def close_redis() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_redis() -> Optional[Redis]:
+    return _client
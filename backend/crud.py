@@ -1,6 +1,10 @@
+from typing import Dict, Iterable, List
+
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import User
+from models import User, UserStudy
 from passlib.context import CryptContext
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -11,7 +15,7 @@ async def get_user_by_username(db: AsyncSession, username: str):
 
 async def create_user(db: AsyncSession, username: str, password: str, role: str = "user"):
     hashed_password = pwd_context.hash(password)
-    user = User(username=username, hashed_password=hashed_password, role=role, studies=[])
+    user = User(username=username, hashed_password=hashed_password, role=role)
     db.add(user)
     await db.commit()
     await db.refresh(user)
@@ -21,3 +25,70 @@ async def delete_user(db: AsyncSession, user: User):
     await db.delete(user)
     await db.commit()
     return user
+
+def clean_study_ids(study_ids: Iterable[str]) -> List[str]:
+    """Trim, drop empty and de-duplicate, preserving order."""
+    return list(dict.fromkeys(s.strip() for s in study_ids if s and s.strip()))
+
+async def get_user_studies(db: AsyncSession, user_id: int) -> List[str]:
+    result = await db.execute(
+        select(UserStudy.study_id).where(UserStudy.user_id == user_id).order_by(UserStudy.study_id)
+    )
+    return list(result.scalars().all())
+
+async def get_studies_by_user(db: AsyncSession, user_ids: Iterable[int]) -> Dict[int, List[str]]:
+    """Study lists for many users in one query; users without grants map to []."""
+    ids = list(user_ids)
+    out: Dict[int, List[str]] = {uid: [] for uid in ids}
+    if not ids:
+        return out
+    result = await db.execute(
+        select(UserStudy.user_id, func.array_agg(UserStudy.study_id))
+        .where(UserStudy.user_id.in_(ids))
+        .group_by(UserStudy.user_id)
+    )
+    for uid, studies in result.all():
+        out[uid] = sorted(studies)
+    return out
+
+async def get_study_user_ids(db: AsyncSession, study_id: str) -> List[int]:
+    result = await db.execute(
+        select(UserStudy.user_id).where(UserStudy.study_id == study_id).order_by(UserStudy.user_id)
+    )
+    return list(result.scalars().all())
+
+async def grant_studies(db: AsyncSession, user_ids: Iterable[int], study_ids: Iterable[str]) -> int:
+    """Grant every study to every user in one statement; existing grants are left alone."""
+    rows = [{"user_id": uid, "study_id": sid} for uid in user_ids for sid in study_ids]
+    if not rows:
+        return 0
+    stmt = pg_insert(UserStudy).values(rows).on_conflict_do_nothing(
+        index_elements=[UserStudy.user_id, UserStudy.study_id]
+    )
+    result = await db.execute(stmt)
+    await db.commit()
+    return result.rowcount or 0
+
+async def revoke_studies(db: AsyncSession, user_ids: Iterable[int], study_ids: Iterable[str]) -> int:
+    uids, sids = list(user_ids), list(study_ids)
+    if not uids or not sids:
+        return 0
+    result = await db.execute(
+        delete(UserStudy).where(UserStudy.user_id.in_(uids), UserStudy.study_id.in_(sids))
+    )
+    await db.commit()
+    return result.rowcount or 0
+
+async def set_user_studies(db: AsyncSession, user_id: int, study_ids: List[str]) -> None:
+    """Replace a user's grants with exactly ``study_ids`` in one transaction."""
+    stmt = delete(UserStudy).where(UserStudy.user_id == user_id)
+    if study_ids:
+        stmt = stmt.where(UserStudy.study_id.not_in(study_ids))
+    await db.execute(stmt)
+    if study_ids:
+        await db.execute(
+            pg_insert(UserStudy)
+            .values([{"user_id": user_id, "study_id": sid} for sid in study_ids])
+            .on_conflict_do_nothing(index_elements=[UserStudy.user_id, UserStudy.study_id])
+        )
+    await db.commit()
@@ -12,3 +12,8 @@ async_session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False
 async def get_db():
     async with async_session() as session:
         yield session
+
+
+def get_session_factory():
+    """The session factory, for dependencies that open a session only when they need one."""
+    return async_session
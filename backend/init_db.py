@@ -36,7 +36,6 @@ async def init_admin():
                 name=ADMIN_NAME,
                 surname=ADMIN_SURNAME,
                 email=ADMIN_EMAIL,
-                studies=[]  # Initially no associated studies
             )
             db.add(new_admin)
             await db.commit()
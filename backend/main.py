@@ -1,12 +1,26 @@
-from fastapi import FastAPI, Depends, Body, HTTPException
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Depends, Body, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from pymongo import MongoClient
-import os
+from pymongo.asynchronous.collection import AsyncCollection
 import logging
 
-from auth import router as auth_router, get_current_user
+from auth import router as auth_router, get_current_principal, admin_required
+from crud import clean_study_ids, get_user_studies, grant_studies, revoke_studies
 from database import get_db
-from models import User
+from core.mongo import connect_mongo, close_mongo, get_mongo_db, get_studies_col
+from core.mongo_indexes import apply_and_verify
+from core.redis import connect_redis, close_redis
+from services.facet_cache import facet_cache
+from services.passwords import HasherBusy
+from services.principal_cache import Principal, principal_cache
+from services.response_cache import response_cache
+from services.single_flight import single_flight
+from services.study_catalog import study_catalog
+from services.study_cache import study_cache
+from services.study_search import study_search
 from studies_test import router as studies_test_router
 from studies_responses_grouped import router as responses_grouped
 from partial_search import router as partial_search_studies
@@ -16,7 +30,29 @@ from routers.adherence import router as adherence_router
 
 logging.basicConfig(level=logging.INFO)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await connect_mongo()
+    await connect_redis()
+    try:
+        await apply_and_verify(get_mongo_db())
+        yield
+    finally:
+        await close_redis()
+        await close_mongo()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.exception_handler(HasherBusy)
+async def hasher_busy_handler(request: Request, exc: HasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many concurrent logins, please retry"},
+        headers={"Retry-After": "1"},
+    )
 
 # Routers
 app.include_router(auth_router, prefix="/api")
@@ -27,29 +63,39 @@ app.include_router(responses_v2_router, prefix="/api")
 app.include_router(responses_labeled_router, prefix="/api")
 app.include_router(adherence_router, prefix="/api")
 
-# MongoDB (used for /api/studies)
-MONGO_URL = os.getenv("MONGO_URL")
-MONGO_DB = os.getenv("MONGO_DB")
-if not MONGO_URL or not MONGO_DB:
-    raise RuntimeError("MongoDB connection details are missing (MONGO_URL/MONGO_DB).")
-
-client = MongoClient(MONGO_URL)
-db_mongo = client[MONGO_DB]
-studies_collection = db_mongo["studies"]
-
-
 @app.get("/api/hello")
 def read_root():
     return {"message": "Hello from FastAPI"}
 
 
+@app.get("/api/admin/cache-stats")
+async def get_cache_stats(_token: None = Depends(admin_required)):
+    return {
+        "studies": study_cache.snapshot(),
+        "facets": facet_cache.snapshot(),
+        "study_search": study_search.snapshot(),
+        "principals": principal_cache.snapshot(),
+        "responses": response_cache.snapshot(),
+        "single_flight": single_flight.snapshot(),
+    }
+
+
+@app.post("/api/admin/cache/invalidate")
+async def invalidate_study_cache(
+    study_id: str = Body(..., embed=True),
+    _token: None = Depends(admin_required),
+):
+    # For out-of-band data fixes; new responses and protocol versions are picked up automatically
+    await response_cache.invalidate(study_id)
+    return {"invalidated": study_id}
+
+
 @app.get("/api/dashboard")
 async def get_dashboard_data(
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_current_principal),
 ):
-    user_study_ids = user.studies or []
     return {
-        "surveys": user_study_ids,
+        "surveys": sorted(principal.studies),
         "user_stats": {
             "last_login": "2025-02-24T15:30:00Z",
             "notifications": 2,
@@ -59,55 +105,47 @@ async def get_dashboard_data(
 
 
 @app.get("/api/studies")
-def get_all_studies(
-    _user: User = Depends(get_current_user),
+async def get_all_studies(
+    request: Request,
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    _user: Principal = Depends(get_current_principal),
+    studies_collection: AsyncCollection = Depends(get_studies_col),
 ):
-    studies = list(studies_collection.find({}))
+    # Memory-served within the catalog TTL: a matching If-None-Match never reaches Mongo
+    await study_catalog.refresh(studies_collection)
+    etag = study_catalog.etag(skip, limit)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
 
-    def convert_doc(doc):
-        return {
-            "id": doc.get("id", ""),
-            "title": doc.get("title", "Untitled Study"),
-            "description": doc.get("description", ""),
-        }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or etag in (t.strip() for t in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
 
-    return [convert_doc(s) for s in studies]
+    response.headers.update(headers)
+    return study_catalog.page(skip, limit)
 
 
 @app.post("/api/user/studies")
 async def add_user_studies(
     study_ids: list[str] = Body(..., embed=True),
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
-    current_studies = user.studies or []
+    await grant_studies(db, [principal.id], clean_study_ids(study_ids))
+    principal_cache.invalidate(principal.username)
 
-    for study_id in study_ids:
-        if study_id not in current_studies:
-            current_studies.append(study_id)
-
-    user.studies = current_studies
-    await db.commit()
-    await db.refresh(user)
-
-    return {"username": user.username, "studies": user.studies}
+    return {"username": principal.username, "studies": await get_user_studies(db, principal.id)}
 
 
 @app.delete("/api/user/studies")
 async def delete_user_study(
     study_id: str = Body(..., embed=True),
-    user: User = Depends(get_current_user),
+    principal: Principal = Depends(get_current_principal),
     db: AsyncSession = Depends(get_db),
 ):
-    current_studies = user.studies or []
-
-    if study_id not in current_studies:
+    if not await revoke_studies(db, [principal.id], [study_id]):
         raise HTTPException(status_code=404, detail="Study not found in profile")
+    principal_cache.invalidate(principal.username)
 
-    current_studies.remove(study_id)
-    user.studies = current_studies
-
-    await db.commit()
-    await db.refresh(user)
-
-    return {"username": user.username, "studies": user.studies}
\ No newline at end of file
+    return {"username": principal.username, "studies": await get_user_studies(db, principal.id)}
@@ -0,0 +1,50 @@
+"""
+Apply the declared Mongo index set and check the canonical query plans.
+
+    python manage_indexes.py            # ensure indexes, then verify
+    python manage_indexes.py --verify   # verify only
+
+Exits non-zero if any canonical query is planned as a COLLSCAN or a
+declared index exists under a different name.
+"""
+import argparse
+import asyncio
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from core.mongo import close_mongo, connect_mongo, get_mongo_db  # noqa: E402
+from core.mongo_indexes import ensure_indexes, verify_query_plans  # noqa: E402
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--verify", action="store_true", help="only explain the canonical queries")
+    args = parser.parse_args()
+
+    await connect_mongo()
+    try:
+        db = get_mongo_db()
+        if not args.verify:
+            for name in await ensure_indexes(db):
+                print(f"ensured {name}")
+        result = await verify_query_plans(db)
+    finally:
+        await close_mongo()
+
+    for name, stages in result["plans"].items():
+        print(f"{name:32} {' > '.join(stages)}")
+    status = 0
+    if result["collscans"]:
+        print(f"COLLSCAN: {', '.join(result['collscans'])}", file=sys.stderr)
+        status = 1
+    for conflict in result["name_conflicts"]:
+        print(f"NAME CONFLICT: {conflict}", file=sys.stderr)
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
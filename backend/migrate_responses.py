@@ -0,0 +1,117 @@
+"""
+Normalise legacy documents in the ``responses`` collection.
+
+Copies fields out of ``raw`` JSON payloads, turns string ``responses`` into
+subdocuments and ISO-string/epoch times into BSON dates, in ``_id`` order
+with one unordered bulk write per batch. Progress is checkpointed in the
+``migrations`` collection after every batch, so an interrupted run picks
+up where it stopped; ``--restart`` discards the checkpoint.
+
+Runs as its own one-off job (the ``response-backfill`` compose service),
+not before the API starts; ``--wait`` gives Mongo that long to come up.
+
+    python migrate_responses.py [--batch-size N] [--dry-run] [--restart] [--wait SECONDS]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import PyMongoError
+
+load_dotenv()
+
+from core.mongo import close_mongo, connect_mongo, get_client, get_mongo_db, get_responses_col  # noqa: E402
+from services.response_docs import LEGACY_FILTER, MIGRATION_ID, normalize_update  # noqa: E402
+
+
+async def migrate(batch_size: int, dry_run: bool, restart: bool) -> None:
+    responses = get_responses_col()
+    checkpoints = get_mongo_db()["migrations"]
+
+    if restart and not dry_run:
+        await checkpoints.delete_one({"_id": MIGRATION_ID})
+    state = await checkpoints.find_one({"_id": MIGRATION_ID}) or {}
+    last_id = None if restart else state.get("last_id")
+    scanned = 0 if restart else int(state.get("scanned", 0))
+    updated = 0 if restart else int(state.get("updated", 0))
+    if last_id is not None:
+        print(f"Resuming after _id {last_id} ({scanned} scanned, {updated} updated so far)")
+
+    started = time.monotonic()
+    while True:
+        q = LEGACY_FILTER if last_id is None else {"$and": [LEGACY_FILTER, {"_id": {"$gt": last_id}}]}
+        batch = await responses.find(q).sort("_id", ASCENDING).limit(batch_size).to_list(None)
+        if not batch:
+            break
+
+        ops = []
+        for doc in batch:
+            update = normalize_update(doc)
+            if update:
+                ops.append(UpdateOne({"_id": doc["_id"]}, update))
+
+        if ops and not dry_run:
+            result = await responses.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+        elif dry_run:
+            updated += len(ops)
+        scanned += len(batch)
+        last_id = batch[-1]["_id"]
+
+        if not dry_run:
+            await checkpoints.update_one(
+                {"_id": MIGRATION_ID},
+                {"$set": {
+                    "last_id": last_id,
+                    "scanned": scanned,
+                    "updated": updated,
+                    "updated_at": datetime.now(timezone.utc),
+                }},
+                upsert=True,
+            )
+        rate = scanned / max(time.monotonic() - started, 1e-6)
+        print(f"{scanned} scanned, {updated} {'would be ' if dry_run else ''}updated ({rate:.0f} docs/s)")
+
+    if not dry_run:
+        await checkpoints.update_one(
+            {"_id": MIGRATION_ID},
+            {"$set": {"completed_at": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    print(f"Done: {scanned} scanned, {updated} {'would be ' if dry_run else ''}updated.")
+
+
+async def wait_for_mongo(timeout_s: float) -> None:
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            await get_client().admin.command("ping")
+            return
+        except PyMongoError as e:
+            if time.monotonic() >= deadline:
+                raise
+            print(f"Waiting for MongoDB... ({e.__class__.__name__})")
+            await asyncio.sleep(2)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="count changes without writing")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    parser.add_argument("--wait", type=float, default=0, help="seconds to wait for MongoDB to be reachable")
+    args = parser.parse_args()
+
+    await connect_mongo()
+    try:
+        await wait_for_mongo(args.wait)
+        await migrate(max(1, args.batch_size), args.dry_run, args.restart)
+    finally:
+        await close_mongo()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
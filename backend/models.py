@@ -1,7 +1,6 @@
 from sqlmodel import SQLModel, Field, Column
-from sqlalchemy import JSON
-from sqlalchemy.ext.mutable import MutableList
-from typing import List, Optional
+from sqlalchemy import ForeignKey, Integer, String
+from typing import Optional
 
 Base = SQLModel  # Define Base as SQLModel
 
@@ -13,7 +12,15 @@ class User(Base, table=True):
     surname: str = Field(nullable=False)
     email: str = Field(nullable=False, unique=True, index=True)
     role: str = Field(default="user", nullable=False)
-    studies: List[str] = Field(
-        default_factory=list,
-        sa_column=Column(MutableList.as_mutable(JSON))
-    )
\ No newline at end of file
+
+class UserStudy(Base, table=True):
+    """One row per study a user may access (replaces the old JSON ``User.studies``)."""
+    __tablename__ = "user_studies"
+
+    # (user_id, study_id) primary key serves per-user lookups; study_id index serves "who can see X"
+    user_id: int = Field(
+        sa_column=Column(Integer, ForeignKey("user.id", ondelete="CASCADE"), primary_key=True)
+    )
+    study_id: str = Field(
+        sa_column=Column(String, primary_key=True, index=True)
+    )
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
-import os
-from datetime import datetime, date
-from typing import List, Optional, Dict, Any
+from datetime import datetime, date, timedelta
+from typing import List, Optional, Dict, Any, Tuple
 
+import numpy as np
 from fastapi import APIRouter, HTTPException, Query, Depends
 from pydantic import BaseModel
-from pymongo import MongoClient, ASCENDING
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
 
 try:
     from zoneinfo import ZoneInfo
@@ -14,20 +15,21 @@ except Exception:  # pragma: no cover
     from backports.zoneinfo import ZoneInfo  # type: ignore
 
 from auth import require_study_access
-from models import User
-from services.adherence_schedule import expand_study_schedule
+from core.mongo import get_responses_col, get_studies_col
+from services.response_cache import response_cache
+from services.response_docs import time_range_filter
+from services.study_cache import study_cache
+from services.principal_cache import Principal
+from services.adherence_schedule import (
+    CompiledSchedule,
+    expand_study_schedule,
+    expand_study_schedule_blocks,
+    get_compiled_schedule,
+)
 
 router = APIRouter(prefix="/v2/adherence", tags=["adherence"])
 
-MONGO_URL = os.getenv("MONGO_URL")
-MONGO_DB = os.getenv("MONGO_DB")
-if not MONGO_URL or not MONGO_DB:
-    raise RuntimeError("Missing MONGO_URL/MONGO_DB")
-
-client = MongoClient(MONGO_URL)
-db = client[MONGO_DB]
-studies_col = db["studies"]
-responses_col = db["responses"]
+_UTC = ZoneInfo("UTC")
 
 
 class OccurrenceOut(BaseModel):
@@ -53,6 +55,25 @@ class StructureCountOut(BaseModel):
     max_offset_days: int
 
 
+class ModuleAdherenceOut(BaseModel):
+    module_name: str
+    expected: int
+    completed: int
+
+
+class UserAdherenceOut(BaseModel):
+    user_id: str
+    expected: int
+    completed: int
+    per_module: Dict[str, ModuleAdherenceOut]
+
+
+class AdherenceSummaryOut(BaseModel):
+    study_id: str
+    tz: str
+    users: List[UserAdherenceOut]
+
+
 def _to_date(s: str, tz: ZoneInfo) -> date:
     try:
         if len(s) == 10 and s[4] == "-" and s[7] == "-":
@@ -63,6 +84,13 @@ def _to_date(s: str, tz: ZoneInfo) -> date:
         raise HTTPException(400, f"Bad date: {s}")
 
 
+def _split_ids(csv: Optional[str]) -> Optional[set[str]]:
+    if not csv:
+        return None
+    out = {s.strip() for s in csv.split(",") if s.strip()}
+    return out or None
+
+
 def _ensure_tz(tz_name: Optional[str]) -> ZoneInfo:
     try:
         return ZoneInfo(tz_name) if tz_name else ZoneInfo("UTC")
@@ -70,8 +98,8 @@ def _ensure_tz(tz_name: Optional[str]) -> ZoneInfo:
         raise HTTPException(400, f"Unknown timezone: {tz_name}")
 
 
-def _fetch_study(study_id: str) -> Dict[str, Any]:
-    doc = studies_col.find_one({"properties.study_id": study_id})
+async def _fetch_study(studies_col: AsyncCollection, study_id: str) -> Dict[str, Any]:
+    doc = await study_cache.get_study(studies_col, study_id)
     if not doc:
         raise HTTPException(404, f"Study '{study_id}' not found")
     return doc
@@ -91,14 +119,16 @@ def _parse_dt(v: Any) -> Optional[datetime]:
     return None
 
 
-def _earliest_baseline_dt_for_user(study_id: str, user_id: str) -> Optional[datetime]:
+async def _earliest_baseline_dt_for_user(
+    responses_col: AsyncCollection, study_id: str, user_id: str
+) -> Optional[datetime]:
     cur = responses_col.find(
         {"study_id": study_id, "user_id": user_id},
         projection={"_id": 0, "alert_time": 1, "response_time": 1},
     ).sort([("alert_time", ASCENDING), ("response_time", ASCENDING)]).limit(50)
 
     best: Optional[datetime] = None
-    for doc in cur:
+    async for doc in cur:
         cand = _parse_dt(doc.get("alert_time")) or _parse_dt(doc.get("response_time"))
         if cand is None:
             continue
@@ -107,50 +137,16 @@ def _earliest_baseline_dt_for_user(study_id: str, user_id: str) -> Optional[date
     return best
 
 
-def _infer_study_days_from_structure(study: Dict[str, Any]) -> int:
-    daily_days: list[int] = []
-    for m in study.get("modules") or []:
-        alerts = m.get("alerts") or {}
-        if (alerts.get("repeat") or "").lower() != "daily":
-            continue
-        rc = alerts.get("repeatCount", None)
-        if rc is None:
-            continue
-        try:
-            rc_int = int(rc)
-        except Exception:
-            continue
-        daily_days.append(max(1, rc_int + 1))
-    return max(daily_days) if daily_days else 7
-
-
-def _times_len(alerts: Dict[str, Any]) -> int:
-    ts = alerts.get("times") or ["12:00:00"]
-    return len(ts)
-
-
-def _daily_occurrences_per_day(alerts: Dict[str, Any]) -> int:
-    times = alerts.get("times") or []
-    offset_time = alerts.get("offsetTime")
-
-    def norm(x: Any) -> str:
-        return str(x).strip()
-
-    uniq = {norm(t) for t in times if norm(t)}
-    if offset_time:
-        uniq.add(norm(offset_time))
-
-    return len(uniq) if uniq else 1
-
-
 @router.get("/expected", response_model=List[OccurrenceOut])
-def expected_windows(
+async def expected_windows(
     study_id: str = Query(...),
     from_: str = Query(..., alias="from"),
     to: str = Query(...),
     tz: Optional[str] = Query("UTC"),
     user_id: Optional[str] = Query(None),
-    _user: User = Depends(require_study_access),
+    _user: Principal = Depends(require_study_access),
+    studies_col: AsyncCollection = Depends(get_studies_col),
+    responses_col: AsyncCollection = Depends(get_responses_col),
 ):
     zone = _ensure_tz(tz)
     start_date = _to_date(from_, zone)
@@ -158,16 +154,16 @@ def expected_windows(
     if end_date < start_date:
         raise HTTPException(400, "'to' must be >= 'from'")
 
-    study = _fetch_study(study_id)
+    plan = get_compiled_schedule(await _fetch_study(studies_col, study_id))
 
     baseline_local_date: Optional[date] = None
     if user_id:
-        baseline_dt = _earliest_baseline_dt_for_user(study_id, user_id)
+        baseline_dt = await _earliest_baseline_dt_for_user(responses_col, study_id, user_id)
         if baseline_dt:
             baseline_local_date = baseline_dt.astimezone(zone).date()
 
     occs = expand_study_schedule(
-        study,
+        plan,
         start_date,
         end_date,
         zone,
@@ -176,62 +172,277 @@ def expected_windows(
     return [OccurrenceOut(**o.__dict__) for o in occs]
 
 
-@router.get("/structure-count", response_model=StructureCountOut)
-def structure_count(
-    study_id: str = Query(...),
-    include_one_off: bool = Query(True),
-    exclude_module_ids: Optional[str] = Query(None),
-    _user: User = Depends(require_study_access),
-):
-    study = _fetch_study(study_id)
-    study_days = _infer_study_days_from_structure(study)
-
-    exclude: set[str] = set()
-    if exclude_module_ids:
-        exclude = {s.strip() for s in exclude_module_ids.split(",") if s.strip()}
-
+def _structure_counts(
+    plan: CompiledSchedule,
+    include_one_off: bool = True,
+    exclude: Optional[set[str]] = None,
+) -> Tuple[Dict[str, int], Dict[str, ModuleMeta], int]:
     per_module: Dict[str, int] = {}
     per_module_meta: Dict[str, ModuleMeta] = {}
-    total = 0
-
     max_offset_days = 0
 
-    for mod in study.get("modules") or []:
-        mid = mod.get("id")
-        if not mid or mid in exclude:
+    for cm in plan.modules:
+        mid = cm.module_id
+        if exclude and mid in exclude:
             continue
 
-        name = (mod.get("name") or mid).strip()
-        alerts = mod.get("alerts") or {}
-        try:
-            od = int(alerts.get("offsetDays", 0))
-        except Exception:
-            od = 0
-        if od > max_offset_days:
-            max_offset_days = od
-        repeat = (alerts.get("repeat") or "").lower()
-        sticky = bool(alerts.get("sticky", False))
-
-        if repeat == "daily":
-            count = study_days * (1 if sticky else _daily_occurrences_per_day(alerts))
-        elif repeat == "never":
-            count = (1 if sticky else _times_len(alerts)) if include_one_off else 0
+        if cm.offset_days > max_offset_days:
+            max_offset_days = cm.offset_days
+
+        if cm.repeat == "daily":
+            count = plan.study_days * (1 if cm.sticky else len(cm.times))
+        elif cm.repeat == "never":
+            count = (1 if cm.sticky else cm.raw_times_len) if include_one_off else 0
         else:
             count = 0
 
         per_module[mid] = count
         per_module_meta[mid] = ModuleMeta(
             module_id=mid,
-            module_name=name,
-            repeat=repeat,
-            sticky=sticky,
+            module_name=cm.module_name.strip(),
+            repeat=cm.repeat,
+            sticky=cm.sticky,
+        )
+
+    return per_module, per_module_meta, max_offset_days
+
+
+@router.get("/structure-count", response_model=StructureCountOut)
+async def structure_count(
+    study_id: str = Query(...),
+    include_one_off: bool = Query(True),
+    exclude_module_ids: Optional[str] = Query(None),
+    _user: Principal = Depends(require_study_access),
+    studies_col: AsyncCollection = Depends(get_studies_col),
+):
+    exclude = _split_ids(exclude_module_ids) or set()
+
+    async def compute():
+        plan = get_compiled_schedule(await _fetch_study(studies_col, study_id))
+        per_module, per_module_meta, max_offset_days = _structure_counts(plan, include_one_off, exclude)
+
+        return StructureCountOut(
+            study_days=plan.study_days,
+            per_module=per_module,
+            per_module_meta=per_module_meta,
+            total=sum(per_module.values()),
+            max_offset_days=max_offset_days,
+        )
+
+    params = {"include_one_off": include_one_off, "exclude_module_ids": exclude}
+    return await response_cache.respond("structure-count", study_id, params, compute, studies_col=studies_col)
+
+
+async def _baselines_by_user(
+    responses_col: AsyncCollection,
+    study_id: str,
+    user_ids: Optional[set[str]],
+) -> Dict[str, datetime]:
+    """
+    Per user, the earliest ``alert_time ?? response_time`` over *all* their
+    responses (like ``_earliest_baseline_dt_for_user``, for the whole cohort
+    at once). Date and legacy ISO-string times are reduced separately
+    because ``$min`` across BSON types would always prefer the string.
+    """
+    match: Dict[str, Any] = {"study_id": study_id}
+    if user_ids:
+        match["user_id"] = {"$in": sorted(user_ids)}
+
+    t = {"$ifNull": ["$alert_time", "$response_time"]}
+    pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": "$user_id",
+                "first_date": {"$min": {"$cond": [{"$eq": [{"$type": t}, "date"]}, t, None]}},
+                "first_str": {"$min": {"$cond": [{"$eq": [{"$type": t}, "string"]}, t, None]}},
+            }
+        },
+    ]
+
+    out: Dict[str, datetime] = {}
+    async for row in await responses_col.aggregate(pipeline):
+        uid = row.get("_id")
+        cands = [dt for dt in (_parse_dt(row.get("first_date")), _parse_dt(row.get("first_str"))) if dt]
+        if uid and cands:
+            out[uid] = min(cands)
+    return out
+
+
+async def _actual_times_by_user(
+    responses_col: AsyncCollection,
+    study_id: str,
+    user_ids: Optional[set[str]],
+    from_: Optional[str],
+    to: Optional[str],
+) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    One aggregation for the whole cohort: per user, the sorted
+    ``alert_time ?? response_time`` of every response in the
+    ``from``/``to`` range (UTC ``datetime64[ms]``), grouped by module.
+    """
+    match: Dict[str, Any] = {"study_id": study_id}
+    if user_ids:
+        match["user_id"] = {"$in": sorted(user_ids)}
+    time_q = time_range_filter("response_time", from_, to)
+    if time_q:
+        match.update(time_q)
+
+    pipeline = [
+        {"$match": match},
+        {
+            "$group": {
+                "_id": {"u": "$user_id", "m": "$module_id"},
+                "times": {"$push": {"$ifNull": ["$alert_time", "$response_time"]}},
+            }
+        },
+        {
+            "$group": {
+                "_id": "$_id.u",
+                "modules": {"$push": {"module_id": "$_id.m", "times": "$times"}},
+            }
+        },
+    ]
+
+    out: Dict[str, Dict[str, np.ndarray]] = {}
+    async for row in await responses_col.aggregate(pipeline):
+        uid = row.get("_id")
+        if not uid:
+            continue
+        per_mod: Dict[str, np.ndarray] = {}
+        for m in row.get("modules") or []:
+            parsed = [
+                dt.astimezone(_UTC).replace(tzinfo=None)
+                for dt in (_parse_dt(t) for t in m.get("times") or [])
+                if dt
+            ]
+            if parsed:
+                per_mod[m.get("module_id") or "unknown_module"] = np.sort(
+                    np.array(parsed, dtype="datetime64[ms]")
+                )
+        if per_mod:
+            out[uid] = per_mod
+    return out
+
+
+def _summarize_user(
+    plan: CompiledSchedule,
+    zone: ZoneInfo,
+    baseline: datetime,
+    actual: Dict[str, np.ndarray],
+    per_module_structure: Dict[str, int],
+    per_module_meta: Dict[str, ModuleMeta],
+    module_filter: Optional[set[str]],
+) -> Dict[str, ModuleAdherenceOut]:
+    baseline_local_date = baseline.astimezone(zone).date()
+    end_date = baseline_local_date + timedelta(
+        days=max(1, plan.study_days) - 1 + max(0, plan.max_offset_days)
+    )
+
+    blocks = expand_study_schedule_blocks(
+        plan,
+        baseline_local_date,
+        end_date,
+        zone,
+        baseline_local_date=baseline_local_date,
+    )
+    if module_filter:
+        blocks = [b for b in blocks if b.module_id in module_filter]
+
+    def repeat_of(mid: str) -> str:
+        meta = per_module_meta.get(mid)
+        return meta.repeat if meta else ""
+
+    def name_of(mid: str) -> str:
+        meta = per_module_meta.get(mid)
+        return meta.module_name if meta else mid
+
+    # Seed with structure counts; one-off modules complete on any response
+    per_module: Dict[str, ModuleAdherenceOut] = {}
+    for mid, exp in per_module_structure.items():
+        if module_filter and mid not in module_filter:
+            continue
+        completed = 0
+        if repeat_of(mid) == "never" and mid in actual:
+            completed = min(1, exp or 1)
+        per_module[mid] = ModuleAdherenceOut(module_name=name_of(mid), expected=exp, completed=completed)
+
+    # Daily modules: expected = expanded occurrences, completed = greedy window match
+    for block in blocks:
+        mid = block.module_id
+        if repeat_of(mid) == "never":
+            continue
+        if mid in per_module:
+            per_module[mid].expected = len(block)
+        else:
+            per_module[mid] = ModuleAdherenceOut(module_name=name_of(mid), expected=len(block), completed=0)
+
+        times = actual.get(mid)
+        if times is None:
+            continue
+        first_at_or_after = np.searchsorted(times, block.starts_utc, side="left")
+        ends = block.ends_utc
+        used = 0
+        completed = 0
+        for k in range(len(block)):
+            i = max(used, int(first_at_or_after[k]))
+            if i < times.size and times[i] <= ends[k]:
+                used = i + 1
+                completed += 1
+        per_module[mid].completed += completed
+
+    for v in per_module.values():
+        if v.completed > v.expected:
+            v.completed = v.expected
+    return per_module
+
+
+@router.get("/summary", response_model=AdherenceSummaryOut)
+async def adherence_summary(
+    study_id: str = Query(...),
+    tz: Optional[str] = Query("UTC"),
+    user_ids: Optional[str] = Query(None, description="comma-separated; default all users"),
+    module_ids: Optional[str] = Query(None, description="comma-separated; default all modules"),
+    from_: Optional[str] = Query(None, alias="from", description="ISO datetime (response_time)"),
+    to: Optional[str] = Query(None, description="ISO datetime (response_time)"),
+    _user: Principal = Depends(require_study_access),
+    studies_col: AsyncCollection = Depends(get_studies_col),
+    responses_col: AsyncCollection = Depends(get_responses_col),
+):
+    """
+    Cohort adherence in one request: baselines, expected occurrences and
+    completed counts for every participant, instead of one
+    ``/expected`` call per user.
+    """
+    zone = _ensure_tz(tz)
+    plan = get_compiled_schedule(await _fetch_study(studies_col, study_id))
+    per_module_structure, per_module_meta, _ = _structure_counts(plan)
+
+    module_filter = _split_ids(module_ids)
+    user_filter = _split_ids(user_ids)
+    # Schedules are anchored on each user's first response ever; from/to
+    # only limits which completions count
+    baselines = await _baselines_by_user(responses_col, study_id, user_filter)
+    actual_by_user = await _actual_times_by_user(responses_col, study_id, user_filter, from_, to)
+
+    users: List[UserAdherenceOut] = []
+    for uid in sorted(baselines):
+        per_module = _summarize_user(
+            plan,
+            zone,
+            baselines[uid],
+            actual_by_user.get(uid, {}),
+            per_module_structure,
+            per_module_meta,
+            module_filter,
         )
-        total += count
-
-    return StructureCountOut(
-        study_days=study_days,
-        per_module=per_module,
-        per_module_meta=per_module_meta,
-        total=total,
-        max_offset_days=max_offset_days,
-    )
\ No newline at end of file
+        users.append(
+            UserAdherenceOut(
+                user_id=uid,
+                expected=sum(v.expected for v in per_module.values()),
+                completed=sum(v.completed for v in per_module.values()),
+                per_module=per_module,
+            )
+        )
+
+    return AdherenceSummaryOut(study_id=study_id, tz=str(zone), users=users)
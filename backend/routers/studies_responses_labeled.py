@@ -1,31 +1,27 @@
 from __future__ import annotations
 
-import os, json
+import json
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
 from fastapi import APIRouter, HTTPException, Query
-from pymongo import MongoClient, DESCENDING, ASCENDING
+from pymongo import DESCENDING, ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
 from fastapi import Depends
 from auth import require_study_access
-from models import User
+from core.mongo import MONGO_BATCH_SIZE, get_responses_col, get_studies_col
+from services.facet_cache import facet_cache
+from services.response_cache import normalize_params, response_cache
+from services.response_docs import time_range_filter
+from services.response_query import after_cursor, answer_filter, answer_matches, decode_cursor, encode_cursor
+from services.single_flight import single_flight
+from services.study_cache import study_cache
+from services.principal_cache import Principal
 
-from schemas import LabeledSurveyResponseOut, QuestionAnswer
+from schemas import LabeledResponsesPage, LabeledSurveyResponseOut, QuestionAnswer
 
 router = APIRouter()
 
-# Mongo
-MONGO_URL = os.getenv("MONGO_URL")
-MONGO_DB = os.getenv("MONGO_DB")
-if not MONGO_URL or not MONGO_DB:
-    raise RuntimeError("Missing MONGO_URL/MONGO_DB")
-
-client = MongoClient(MONGO_URL)
-db = client[MONGO_DB]
-responses_col = db["responses"]
-studies_col = db["studies"]
-
-
 # Helpers
 def _dt(v: Any) -> Optional[datetime]:
     if isinstance(v, datetime):
@@ -49,25 +45,6 @@ def _parse_responses(v: Any) -> Dict[str, Any]:
             return {}
     return {}
 
-def _index_questions(study_doc: Optional[dict]) -> Dict[str, Dict[str, str]]:
-    out: Dict[str, Dict[str, str]] = {}
-    if not study_doc:
-        return out
-    for m in (study_doc.get("modules") or []):
-        mid = m.get("id")
-        if not mid:
-            continue
-        qmap: Dict[str, str] = {}
-        params = m.get("params") or {}
-        sections = params.get("sections") or []
-        for sec in sections:
-            for q in (sec.get("questions") or []):
-                qid = q.get("id")
-                if qid:
-                    qmap[qid] = q.get("text")
-        out[mid] = qmap
-    return out
-
 def _explode(values: Optional[List[str]]) -> Optional[List[str]]:
     if not values:
         return None
@@ -86,15 +63,36 @@ def _parse_pairs(pairs: List[str]) -> List[Tuple[str, str]]:
                 out.append((k, v))
     return out
 
-
 # Facets (for filters)
+def _facet_pipeline(q: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # One scan of the match for all facets
+    return [
+        {"$match": q},
+        {
+            "$facet": {
+                "users": [
+                    {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+                    {"$sort": {"_id": 1}},
+                ],
+                "modules": [
+                    {"$group": {"_id": {"id": "$module_id", "name": "$module_name"}, "count": {"$sum": 1}}},
+                    {"$project": {"_id": 0, "id": "$_id.id", "name": "$_id.name", "count": 1}},
+                ],
+                "total": [{"$count": "n"}],
+            }
+        },
+    ]
+
+
 @router.get("/studies/{study_id}/responses:facets")
-def list_response_facets(
+async def list_response_facets(
     study_id: str,
     user_id: List[str] | None = Query(default=None),
     module_id: List[str] | None = Query(default=None),
     from_: str | None = Query(default=None, alias="from"),
     to: str | None = Query(default=None),
+    _user: Principal = Depends(require_study_access),
+    responses_col: AsyncCollection = Depends(get_responses_col),
 ):
     users = _explode(user_id)
     modules = _explode(module_id)
@@ -104,35 +102,57 @@ def list_response_facets(
         q["user_id"] = {"$in": users}
     if modules:
         q["module_id"] = {"$in": modules}
-    if from_ or to:
-        dr: Dict[str, Any] = {}
-        if from_:
-            dt = _dt(from_)
-            if dt:
-                dr["$gte"] = dt.isoformat()
-        if to:
-            dt = _dt(to)
-            if dt:
-                dr["$lte"] = dt.isoformat()
-        if dr:
-            q["response_time"] = dr
-
-    users_out = sorted(set(responses_col.distinct("user_id", q)))
-
-    pipeline = [
-        {"$match": q},
-        {"$group": {"_id": {"id": "$module_id", "name": "$module_name"}}},
-        {"$project": {"_id": 0, "id": "$_id.id", "name": "$_id.name"}},
-    ]
-    mods_out = list(responses_col.aggregate(pipeline))
-    mods_out.sort(key=lambda m: (m.get("name") or "", m.get("id") or ""))
+    time_q = time_range_filter("response_time", from_, to)
+    if time_q:
+        q.update(time_q)
+
+    async def compute():
+        unfiltered = len(q) == 1
+        fingerprint = None
+        if unfiltered:
+            cached, fingerprint = await facet_cache.lookup(responses_col, study_id)
+            if cached is not None:
+                return cached
+
+        rows = await (await responses_col.aggregate(_facet_pipeline(q))).to_list(1)
+        facets = rows[0] if rows else {}
+
+        user_rows = [u for u in facets.get("users") or [] if u.get("_id") is not None]
+        mods_out = facets.get("modules") or []
+        mods_out.sort(key=lambda m: (m.get("name") or "", m.get("id") or ""))
+        total = facets.get("total") or []
+
+        out = {
+            "users": [u["_id"] for u in user_rows],
+            "modules": mods_out,
+            "user_counts": {u["_id"]: u["count"] for u in user_rows},
+            "total": total[0]["n"] if total else 0,
+        }
+        if unfiltered and fingerprint is not None:
+            facet_cache.store(study_id, out, fingerprint)
+        return out
 
-    return {"users": users_out, "modules": mods_out}
+    params = {"user_id": users, "module_id": modules, "from": from_, "to": to}
+    return await response_cache.respond("facets", study_id, params, compute, responses_col=responses_col)
 
 
 # Labeled responses + filters + paging
-@router.get("/studies/{study_id}/responses:labeled", response_model=List[LabeledSurveyResponseOut])
-def list_study_responses_labeled(
+_LABELED_PROJECTION = {
+    "data_type": 1,
+    "user_id": 1,
+    "study_id": 1,
+    "module_index": 1,
+    "platform": 1,
+    "module_id": 1,
+    "module_name": 1,
+    "responses": 1,
+    "response_time": 1,
+    "alert_time": 1,
+}
+
+
+@router.get("/studies/{study_id}/responses:labeled", response_model=LabeledResponsesPage)
+async def list_study_responses_labeled(
     study_id: str,
     user_id: Optional[List[str]] = Query(default=None, description="repeatable or comma-separated"),
     module_id: Optional[List[str]] = Query(default=None, description="repeatable or comma-separated"),
@@ -141,9 +161,12 @@ def list_study_responses_labeled(
     match: List[str] = Query(default=[], description="repeat qid:value for exact match"),
     contains: List[str] = Query(default=[], description="repeat qid:substring"),
     sort: str = Query(default="desc", regex="^(asc|desc)$"),
-    skip: int = 0,
+    skip: int = Query(default=0, description="offset paging; ignored when cursor is given"),
     limit: int = 100,
-    _user: User = Depends(require_study_access),
+    cursor: Optional[str] = Query(default=None, description="next_cursor from the previous page"),
+    _user: Principal = Depends(require_study_access),
+    responses_col: AsyncCollection = Depends(get_responses_col),
+    studies_col: AsyncCollection = Depends(get_studies_col),
 ):
     users = _explode(user_id)
     modules = _explode(module_id)
@@ -153,89 +176,117 @@ def list_study_responses_labeled(
         q["user_id"] = {"$in": users}
     if modules:
         q["module_id"] = {"$in": modules}
-    if from_ or to:
-        dr: Dict[str, Any] = {}
-        if from_:
-            dfrom = _dt(from_)
-            if dfrom:
-                dr["$gte"] = dfrom.isoformat()
-        if to:
-            dto = _dt(to)
-            if dto:
-                dr["$lte"] = dto.isoformat()
-        if dr:
-            q["response_time"] = dr
+    time_q = time_range_filter("response_time", from_, to)
+    if time_q:
+        q.update(time_q)
 
     sort_dir = DESCENDING if sort == "desc" else ASCENDING
     _skip = max(0, skip)
     _limit = max(1, min(1000, limit))
 
-    docs = list(
-        responses_col.find(
-            q,
-            projection={
-                "_id": 0,
-                "data_type": 1,
-                "user_id": 1,
-                "study_id": 1,
-                "module_index": 1,
-                "platform": 1,
-                "module_id": 1,
-                "module_name": 1,
-                "responses": 1,
-                "response_time": 1,
-                "alert_time": 1,
-            },
-        )
-        .sort([("response_time", sort_dir)])
-        .skip(_skip)
-        .limit(_limit)
-    )
-
-    if not docs:
-        return []
-
-    study_doc = studies_col.find_one(
-        {"properties.study_id": study_id},
-        projection={"_id": 0, "modules": 1},
-    )
-    q_index = _index_questions(study_doc)
-
     exact_pairs = _parse_pairs(match)
     contains_pairs = _parse_pairs(contains)
 
-    out: List[LabeledSurveyResponseOut] = []
-    for d in docs:
-        resp_map = _parse_responses(d.get("responses"))
-
-        if exact_pairs and any(str(resp_map.get(qid, "")) != v for qid, v in exact_pairs):
-            continue
-        if contains_pairs and any(substr not in str(resp_map.get(qid, "")) for qid, substr in contains_pairs):
-            continue
-
-        mid = d.get("module_id") or "unknown_module"
-        rt = _dt(d.get("response_time")) or datetime.utcnow()
-        qmap = q_index.get(mid, {})
-
-        answers = [
-            QuestionAnswer(question_id=qid, question_text=qmap.get(qid), answer=ans)
-            for qid, ans in resp_map.items()
-        ]
-
-        out.append(
-            LabeledSurveyResponseOut(
-                data_type=d.get("data_type", "survey_response"),
-                user_id=d["user_id"],
-                study_id=d["study_id"],
-                module_index=d.get("module_index"),
-                platform=d.get("platform"),
-                module_id=mid,
-                module_name=d.get("module_name") or "Unknown Module",
-                responses=resp_map,
-                response_time=rt,
-                alert_time=_dt(d.get("alert_time")),
-                answers=answers,
+    clauses: List[Dict[str, Any]] = [q]
+    answer_q = answer_filter(exact_pairs, contains_pairs)
+    if answer_q:
+        clauses.append(answer_q)
+    # (response_time, _id) is unique, so a page boundary is an index range seek
+    if cursor:
+        try:
+            rt, oid = decode_cursor(cursor, sort)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        clauses.append(after_cursor(rt, oid, sort_dir))
+        _skip = 0
+    if len(clauses) > 1:
+        q = {"$and": clauses}
+
+    order = [("response_time", sort_dir), ("_id", sort_dir)]
+
+    def find(query: Dict[str, Any], n: int):
+        return responses_col.find(query, projection=_LABELED_PROJECTION).sort(order).limit(n)
+
+    async def matching_rows() -> Tuple[List[Tuple[Dict[str, Any], Dict[str, Any]]], bool]:
+        # answer_q (if any) only narrows the scan, answer_matches decides: keep
+        # reading batches, continuing after the last document read, until the
+        # page is full. skip counts matching rows, so it can't be left to Mongo.
+        rows: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        to_skip = _skip
+        batch_size = max(_limit, MONGO_BATCH_SIZE)
+        batch_q = q
+        while True:
+            batch = await find(batch_q, batch_size).to_list(None)
+            for d in batch:
+                resp_map = _parse_responses(d.get("responses"))
+                if not answer_matches(resp_map, exact_pairs, contains_pairs):
+                    continue
+                if to_skip:
+                    to_skip -= 1
+                    continue
+                rows.append((d, resp_map))
+                if len(rows) == _limit:
+                    return rows, True
+            if len(batch) < batch_size:
+                return rows, False
+            last = batch[-1]
+            batch_q = {"$and": [q, after_cursor(last.get("response_time"), last["_id"], sort_dir)]}
+
+    async def compute() -> LabeledResponsesPage:
+        if exact_pairs or contains_pairs:
+            rows, full = await matching_rows()
+        else:
+            docs = await find(q, _limit).skip(_skip).to_list(None)
+            rows, full = [(d, _parse_responses(d.get("responses"))) for d in docs], len(docs) == _limit
+
+        if not rows:
+            return LabeledResponsesPage(items=[])
+
+        # The last row served, so the next page starts right after it
+        next_cursor = encode_cursor(rows[-1][0], sort) if full else None
+
+        # Each response labeled from the study version active when it was recorded
+        versions = await study_cache.get_resolver(studies_col, study_id)
+
+        out: List[LabeledSurveyResponseOut] = []
+        for d, resp_map in rows:
+            mid = d.get("module_id") or "unknown_module"
+            rt = _dt(d.get("response_time")) or datetime.utcnow()
+            qmap = versions.questions_at(mid, d.get("response_time"))
+
+            answers = [
+                QuestionAnswer(
+                    question_id=qid,
+                    question_text=qmap[qid].raw_text if qid in qmap else None,
+                    answer=ans,
+                )
+                for qid, ans in resp_map.items()
+            ]
+
+            out.append(
+                LabeledSurveyResponseOut(
+                    data_type=d.get("data_type", "survey_response"),
+                    user_id=d["user_id"],
+                    study_id=d["study_id"],
+                    module_index=d.get("module_index"),
+                    platform=d.get("platform"),
+                    module_id=mid,
+                    module_name=d.get("module_name") or "Unknown Module",
+                    responses=resp_map,
+                    response_time=rt,
+                    alert_time=_dt(d.get("alert_time")),
+                    answers=answers,
+                )
             )
-        )
 
-    return out
\ No newline at end of file
+        return LabeledResponsesPage(items=out, next_cursor=next_cursor)
+
+    # Identical concurrent page requests (e.g. a whole team opening the same
+    # dashboard) run one query; access was already checked per caller
+    key = ("labeled", study_id, normalize_params({
+        "user_id": users, "module_id": modules, "from": from_, "to": to,
+        "match": match, "contains": contains, "sort": sort,
+        "skip": _skip, "limit": _limit, "cursor": cursor,
+    }))
+    page, _ = await single_flight.do(key, compute)
+    return page
@@ -1,31 +1,32 @@
 from __future__ import annotations
 
-import os
 import json
 import re
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
-from fastapi import APIRouter, HTTPException, Query, Depends
-from pymongo import MongoClient, DESCENDING
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from fastapi.responses import StreamingResponse
+from pymongo import DESCENDING
+from pymongo.asynchronous.collection import AsyncCollection
 
 from auth import require_study_access
-from models import User
+from core.mongo import MONGO_BATCH_SIZE, get_responses_col, get_studies_col, iter_docs
+from services.columnar_export import (
+    ARROW_STREAM_MEDIA_TYPE,
+    EXPORT_PROJECTION,
+    PARQUET_MEDIA_TYPE,
+    ResponseTableLayout,
+    export_body,
+)
+from services.response_cache import response_cache
+from services.response_docs import json_default, parse_time
+from services.study_cache import study_cache
+from services.principal_cache import Principal
 from schemas import SurveyResponseOut
 
 router = APIRouter()
 
-# MongoDB setup
-MONGO_URL = os.getenv("MONGO_URL")
-MONGO_DB = os.getenv("MONGO_DB")
-if not MONGO_URL or not MONGO_DB:
-    raise RuntimeError("Missing MONGO_URL/MONGO_DB")
-
-client = MongoClient(MONGO_URL)
-db = client[MONGO_DB]
-responses_col = db["responses"]
-studies_col = db["studies"]
-
 _NUM_RE = re.compile(r"[-+]?\d+(\.\d+)?")
 _INT_RE = re.compile(r"[-+]?\d+")
 
@@ -54,179 +55,205 @@ def _parse_responses(val: Any) -> Dict[str, Any]:
     return {}
 
 
+_RESPONSE_PROJECTION = {
+    "_id": 0,
+    "data_type": 1,
+    "user_id": 1,
+    "study_id": 1,
+    "module_index": 1,
+    "platform": 1,
+    "module_id": 1,
+    "module_name": 1,
+    "responses": 1,
+    "response_time": 1,
+    "alert_time": 1,
+}
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _response_row(d: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "data_type": d.get("data_type"),
+        "user_id": d["user_id"],
+        "study_id": d["study_id"],
+        "module_index": d.get("module_index"),
+        "platform": d.get("platform"),
+        "module_id": d.get("module_id"),
+        "module_name": d.get("module_name"),
+        "responses": _parse_responses(d.get("responses")),
+        "response_time": _ensure_dt(d.get("response_time")),
+        "alert_time": _ensure_dt(d.get("alert_time")),
+    }
+
+
+def _ndjson_line(d: Dict[str, Any]) -> str:
+    return json.dumps(_response_row(d), default=json_default, separators=(",", ":"))
+
+
+async def _ndjson_body(first: Dict[str, Any], rest: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    # One chunk per cursor batch: memory stays at one batch regardless of study size
+    buf = [_ndjson_line(first)]
+    async for d in rest:
+        buf.append(_ndjson_line(d))
+        if len(buf) >= MONGO_BATCH_SIZE:
+            yield ("\n".join(buf) + "\n").encode()
+            buf = []
+    if buf:
+        yield ("\n".join(buf) + "\n").encode()
+
+
 @router.get("/studies/{study_id}/responses", response_model=List[SurveyResponseOut])
-def list_study_responses(
+async def list_study_responses(
     study_id: str,
-    _user: User = Depends(require_study_access),
+    request: Request,
+    stream: bool = Query(False, description="stream rows as NDJSON (same as Accept: application/x-ndjson)"),
+    _user: Principal = Depends(require_study_access),
+    responses_col: AsyncCollection = Depends(get_responses_col),
 ):
-    docs = list(
-        responses_col.find(
-            {"study_id": study_id},
-            projection={
-                "_id": 0,
-                "data_type": 1,
-                "user_id": 1,
-                "study_id": 1,
-                "module_index": 1,
-                "platform": 1,
-                "module_id": 1,
-                "module_name": 1,
-                "responses": 1,
-                "response_time": 1,
-                "alert_time": 1,
-            },
-        ).sort([("response_time", DESCENDING)])
-    )
+    cursor = responses_col.find(
+        {"study_id": study_id},
+        projection=_RESPONSE_PROJECTION,
+    ).sort([("response_time", DESCENDING)])
+    rows = iter_docs(cursor)
 
-    if not docs:
-        raise HTTPException(status_code=404, detail=f"No responses for '{study_id}'")
+    if stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        first = await anext(rows, None)
+        if first is None:
+            raise HTTPException(status_code=404, detail=f"No responses for '{study_id}'")
+        return StreamingResponse(_ndjson_body(first, rows), media_type=NDJSON_MEDIA_TYPE)
 
     out: List[SurveyResponseOut] = []
-    for d in docs:
-        out.append(
-            SurveyResponseOut(
-                data_type=d.get("data_type"),
-                user_id=d["user_id"],
-                study_id=d["study_id"],
-                module_index=d.get("module_index"),
-                platform=d.get("platform"),
-                module_id=d.get("module_id"),
-                module_name=d.get("module_name"),
-                responses=_parse_responses(d.get("responses")),
-                response_time=_ensure_dt(d.get("response_time")),
-                alert_time=_ensure_dt(d.get("alert_time")),
-            )
-        )
+    async for d in rows:
+        out.append(SurveyResponseOut(**_response_row(d)))
+
+    if not out:
+        raise HTTPException(status_code=404, detail=f"No responses for '{study_id}'")
 
     return out
 
 
-@router.get("/studies/{study_id}/questions")
-def list_study_questions(
-    study_id: str,
-    _user: User = Depends(require_study_access),
-):
-    study_doc = studies_col.find_one(
-        {"properties.study_id": study_id},
-        projection={"_id": 0, "modules": 1},
+async def _columnar_export(
+    study_id: str, fmt: str, media_type: str, suffix: str,
+    responses_col: AsyncCollection, studies_col: AsyncCollection,
+) -> StreamingResponse:
+    # Same order as /responses; the (study_id, response_time, _id) index serves it
+    cursor = responses_col.find({"study_id": study_id}, projection=EXPORT_PROJECTION).sort(
+        [("response_time", DESCENDING), ("_id", DESCENDING)]
     )
+    rows = iter_docs(cursor)
+    first = await anext(rows, None)
+    if first is None:
+        raise HTTPException(status_code=404, detail=f"No responses for '{study_id}'")
+
+    versions = await study_cache.get_resolver(studies_col, study_id)
+    layout = ResponseTableLayout(versions.question_catalog if versions else None)
 
-    if not study_doc:
-        return []
+    async def docs():
+        yield first
+        async for d in rows:
+            yield d
 
-    tag_re = re.compile(r"<[^>]+>")
-    num_re = re.compile(r"([-+]?\d+(\.\d+)?)")
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", study_id)
+    return StreamingResponse(
+        export_body(layout, fmt, docs()),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{safe_name}_responses.{suffix}"'},
+    )
 
-    def strip_html(s: str) -> str:
-        return tag_re.sub("", s).strip()
 
-    def infer_multi_numeric(options: list) -> Optional[Dict[str, float]]:
-        if not options:
-            return None
+@router.get("/studies/{study_id}/responses.parquet")
+async def export_study_responses_parquet(
+    study_id: str,
+    _user: Principal = Depends(require_study_access),
+    responses_col: AsyncCollection = Depends(get_responses_col),
+    studies_col: AsyncCollection = Depends(get_studies_col),
+):
+    """Responses as a Parquet file, one column per question."""
+    return await _columnar_export(study_id, "parquet", PARQUET_MEDIA_TYPE, "parquet", responses_col, studies_col)
 
-        parsed: List[Optional[float]] = []
-        labels: List[str] = []
 
-        for opt in options:
-            txt = strip_html(str(opt))
-            labels.append(txt)
-            m = num_re.search(txt)
-            parsed.append(float(m.group(1)) if m else None)
+@router.get("/studies/{study_id}/responses.arrow")
+async def export_study_responses_arrow(
+    study_id: str,
+    _user: Principal = Depends(require_study_access),
+    responses_col: AsyncCollection = Depends(get_responses_col),
+    studies_col: AsyncCollection = Depends(get_studies_col),
+):
+    """Same table as ``responses.parquet``, as an Arrow IPC stream."""
+    return await _columnar_export(study_id, "arrow", ARROW_STREAM_MEDIA_TYPE, "arrows", responses_col, studies_col)
 
-        if all(v is None for v in parsed):
-            return None
 
-        mapping: Dict[str, float] = {}
-        for idx, (val, lbl) in enumerate(zip(parsed, labels)):
-            score = float(idx) if val is None else float(val)
-            mapping[str(idx)] = score
-            mapping[lbl] = score
-            mapping[str(int(score))] = score
-            if not score.is_integer():
-                mapping[str(score)] = score
-
-        return mapping
-
-    out = []
-    for m in study_doc.get("modules") or []:
-        mid = m.get("id")
-        mname = m.get("name") or m.get("title") or "Unnamed module"
-        params = m.get("params") or {}
-
-        for sec in params.get("sections") or []:
-            for q in sec.get("questions") or []:
-                qid = q.get("id")
-                if not qid:
-                    continue
-
-                qtype = q.get("type")
-                subtype = q.get("subtype")
-                qtext = q.get("text") or q.get("label") or qid
-
-                is_schema_numeric = (
-                    qtype == "number" or (qtype == "text" and subtype == "numeric")
-                )
-
-                option_map = None
-                if qtype == "multi":
-                    option_map = infer_multi_numeric(q.get("options") or [])
-
-                out.append(
-                    {
-                        "module_id": mid,
-                        "module_name": mname,
-                        "question_id": qid,
-                        "question_text": qtext,
-                        "type": qtype,
-                        "subtype": subtype,
-                        "is_numeric": bool(is_schema_numeric or option_map),
-                        "option_map": option_map or {},
-                    }
-                )
-
-    out.sort(
-        key=lambda x: (
-            x.get("module_name") or "",
-            x.get("question_text") or "",
-            x.get("module_id") or "",
-            x.get("question_id") or "",
-        )
-    )
+@router.get("/studies/{study_id}/questions")
+async def list_study_questions(
+    study_id: str,
+    _user: Principal = Depends(require_study_access),
+    studies_col: AsyncCollection = Depends(get_studies_col),
+):
+    async def compute():
+        versions = await study_cache.get_resolver(studies_col, study_id)
+        return [q.to_out() for q in versions.question_catalog.questions]
 
-    return out
+    return await response_cache.respond("questions", study_id, {}, compute, studies_col=studies_col)
 
 
 @router.get("/studies/{study_id}/user-mapping")
-def user_mapping(
+async def user_mapping(
     study_id: str,
     module_id: str = Query(...),
     question_id: str = Query(...),
     mode: str = Query("latest", regex="^(latest|earliest)$"),
-    _user: User = Depends(require_study_access),
+    _user: Principal = Depends(require_study_access),
+    responses_col: AsyncCollection = Depends(get_responses_col),
 ):
-    cursor = responses_col.find(
-        {"study_id": study_id, "module_id": module_id},
-        projection={"_id": 0, "user_id": 1, "responses": 1, "response_time": 1},
-    )
-
+    # Ids that can't be used as a field path ("." / leading "$") are looked up in Python
+    as_path = not question_id.startswith("$") and "." not in question_id
     by_user: Dict[str, Dict[str, Any]] = {}
 
-    for d in cursor:
+    if as_path:
+        field = f"responses.{question_id}"
+        pick = "$last" if mode == "latest" else "$first"
+        # Equality on (study_id, module_id) + sort on (user_id, response_time) walks
+        # the (study_id, module_id, user_id, response_time) index in order. Only BSON
+        # dates: strings would sort below them and may not even parse.
+        pipeline = [
+            {"$match": {
+                "study_id": study_id,
+                "module_id": module_id,
+                field: {"$exists": True},
+                "response_time": {"$type": "date"},
+            }},
+            {"$sort": {"user_id": 1, "response_time": 1}},
+            {"$group": {"_id": "$user_id", "val": {pick: f"${field}"}, "rt": {pick: "$response_time"}}},
+        ]
+        async for row in await responses_col.aggregate(pipeline):
+            by_user[row["_id"]] = {"rt": parse_time(row.get("rt")), "val": row.get("val")}
+
+    # Whatever the pipeline can't read: not-yet-migrated documents (JSON-string
+    # `responses`, string/epoch times), or every document for non-path ids
+    fallback_q: Dict[str, Any] = {"study_id": study_id, "module_id": module_id}
+    if as_path:
+        fallback_q["$or"] = [
+            {"responses": {"$type": "string"}},
+            {"response_time": {"$type": ["string", "number"]}},
+        ]
+    legacy = responses_col.find(
+        fallback_q, projection={"_id": 0, "user_id": 1, "responses": 1, "response_time": 1}
+    )
+    async for d in iter_docs(legacy):
         resp_map = _parse_responses(d.get("responses"))
         if question_id not in resp_map:
             continue
-
-        rt = _ensure_dt(d.get("response_time"))
+        rt = parse_time(d.get("response_time"))
         if not rt:
             continue
-
         current = by_user.get(d["user_id"])
-        if not current:
+        if (
+            not current
+            or current["rt"] is None
+            or (mode == "latest" and rt > current["rt"])
+            or (mode == "earliest" and rt < current["rt"])
+        ):
             by_user[d["user_id"]] = {"rt": rt, "val": resp_map[question_id]}
-        else:
-            if mode == "latest" and rt > current["rt"]:
-                current.update(rt=rt, val=resp_map[question_id])
-            elif mode == "earliest" and rt < current["rt"]:
-                current.update(rt=rt, val=resp_map[question_id])
 
-    return {uid: data["val"] for uid, data in by_user.items()}
\ No newline at end of file
+    return {uid: data["val"] for uid, data in by_user.items()}
@@ -1,5 +1,6 @@
-from .user import UserCreate
+from .user import StudyAccessUpdate, UserCreate
 from .responses import (
+    LabeledResponsesPage,
     LabeledSurveyResponseOut,
     QuestionAnswer,
     SurveyResponseOut, 
@@ -7,7 +8,9 @@ from .responses import (
 
 __all__ = [
     "UserCreate",
+    "StudyAccessUpdate",
     "SurveyResponseOut",
     "QuestionAnswer",
     "LabeledSurveyResponseOut",
+    "LabeledResponsesPage",
 ]
\ No newline at end of file
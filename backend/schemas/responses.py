@@ -32,4 +32,9 @@ class LabeledSurveyResponseOut(BaseModel):
     response_time: datetime
     alert_time: Optional[datetime] = None
     responses: Dict[str, Any]
-    answers: List[QuestionAnswer]
\ No newline at end of file
+    answers: List[QuestionAnswer]
+
+class LabeledResponsesPage(BaseModel):
+    items: List[LabeledSurveyResponseOut]
+    # Opaque token for the next page; None once the result set is exhausted
+    next_cursor: Optional[str] = None
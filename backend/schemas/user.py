@@ -1,4 +1,6 @@
 # schemas/user.py
+from typing import List
+
 from pydantic_sqlalchemy import sqlalchemy_to_pydantic
 from pydantic import BaseModel, EmailStr
 from models import User
@@ -6,8 +8,13 @@ from models import User
 # Base schema derived from the SQLAlchemy model
 BaseUserCreate = sqlalchemy_to_pydantic(
     User,
-    exclude=["id", "hashed_password", "studies"],
+    exclude=["id", "hashed_password"],
 )
 
 class UserCreate(BaseUserCreate):
-    password: str
\ No newline at end of file
+    password: str
+
+class StudyAccessUpdate(BaseModel):
+    """Bulk grant/revoke: every listed user gets (or loses) every listed study."""
+    user_ids: List[int]
+    study_ids: List[str]
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import os
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta, time
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple, Union
+
+import numpy as np
 
 try:
     from zoneinfo import ZoneInfo  # py3.9+
@@ -19,10 +23,6 @@ class Occurrence:
     end: str
 
 
-def _ymd(d: date) -> str:
-    return d.strftime("%Y-%m-%d")
-
-
 def _parse_hms(hms: str) -> time:
     parts = str(hms).strip().split(":")
     hh = int(parts[0]) if len(parts) >= 1 and parts[0] else 0
@@ -31,10 +31,6 @@ def _parse_hms(hms: str) -> time:
     return time(hh, mm, ss)
 
 
-def _localize(dt_naive: datetime, tz: ZoneInfo) -> datetime:
-    return dt_naive.replace(tzinfo=tz)
-
-
 def _norm_time_str(x: Any) -> Optional[str]:
     if x is None:
         return None
@@ -59,165 +55,401 @@ def _unique_times(alerts: Dict[str, Any]) -> List[str]:
     if not uniq:
         return ["12:00:00"]
 
-    return sorted(uniq.keys(), key=lambda s: (_parse_hms(s).hour, _parse_hms(s).minute, _parse_hms(s).second))
+    return sorted(uniq.keys(), key=_tod_seconds)
 
 
-def _end_dt(start_dt: datetime, tz: ZoneInfo, timeout_enabled: bool, timeout_after_ms: int) -> datetime:
-    if timeout_enabled and timeout_after_ms > 0:
-        return start_dt + timedelta(milliseconds=timeout_after_ms)
-    return _localize(datetime(start_dt.year, start_dt.month, start_dt.day, 23, 59, 59), tz)
+def _tod_seconds(hms: str) -> int:
+    tt = _parse_hms(hms)
+    return tt.hour * 3600 + tt.minute * 60 + tt.second
 
 
-def expand_module_daily(
-    module: Dict,
-    start_date: date,
-    end_date: date,
-    tz: ZoneInfo,
-    baseline_local_date: Optional[date],
-) -> List[Occurrence]:
-    out: List[Occurrence] = []
-    alerts = module.get("alerts") or {}
-    if (alerts.get("repeat") or "").lower() != "daily":
-        return out
+_DAY_END_S = 23 * 3600 + 59 * 60 + 59
+# ZoneInfo transitions are weeks apart; probe at this step, bisect between probes
+_TZ_PROBE_STEP = np.timedelta64(7 * 24 * 3600, "s")
+_ONE_SECOND = np.timedelta64(1, "s")
 
-    anchor = baseline_local_date or start_date
 
-    try:
-        offset_days = int(alerts.get("offsetDays", 0))
-    except Exception:
-        offset_days = 0
+def _utcoffset_s(local_s: np.datetime64, tz: ZoneInfo) -> int:
+    naive = local_s.astype("datetime64[s]").astype(datetime)
+    off = naive.replace(tzinfo=tz).utcoffset()
+    return int(off.total_seconds()) if off is not None else 0
+
+
+def _tz_offsets(local: np.ndarray, tz: ZoneInfo) -> np.ndarray:
+    """
+    UTC offset in seconds for each local wall time in ``local``
+    (``datetime64``), with the same fold=0 semantics as ``replace(tzinfo=tz)``.
 
+    Only the transitions inside [min, max] are located (probe + bisect),
+    then every element is mapped with one ``searchsorted``.
+    """
+    if local.size == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    secs = local.astype("datetime64[s]")
+    lo, hi = secs.min(), secs.max()
+    probes = np.arange(lo, hi + _TZ_PROBE_STEP, _TZ_PROBE_STEP)
+    probe_offs = [_utcoffset_s(p, tz) for p in probes]
+
+    edges: List[np.datetime64] = []
+    values: List[int] = [probe_offs[0]]
+    for i in range(1, len(probes)):
+        if probe_offs[i] == probe_offs[i - 1]:
+            continue
+        a, b = probes[i - 1], probes[i]
+        off_a = probe_offs[i - 1]
+        while b - a > _ONE_SECOND:
+            mid = a + (b - a) // 2
+            if _utcoffset_s(mid, tz) == off_a:
+                a = mid
+            else:
+                b = mid
+        edges.append(b)
+        values.append(probe_offs[i])
+
+    if not edges:
+        return np.full(local.shape, values[0], dtype=np.int64)
+
+    idx = np.searchsorted(np.array(edges, dtype="datetime64[s]"), secs, side="right")
+    return np.array(values, dtype=np.int64)[idx]
+
+
+def _offset_str(offset_s: int) -> str:
+    sign = "+" if offset_s >= 0 else "-"
+    hh, rem = divmod(abs(int(offset_s)), 3600)
+    mm, ss = divmod(rem, 60)
+    return f"{sign}{hh:02d}:{mm:02d}:{ss:02d}" if ss else f"{sign}{hh:02d}:{mm:02d}"
+
+
+def _iso_strings(local: np.ndarray, offsets: np.ndarray) -> List[str]:
+    # Matches datetime.isoformat(): seconds, plus microseconds only when non-zero
+    whole = np.datetime_as_string(local.astype("datetime64[s]"), unit="s")
+    frac_ms = (local.astype("datetime64[ms]") - local.astype("datetime64[s]")).astype(np.int64)
+    tz_str = {int(o): _offset_str(int(o)) for o in np.unique(offsets)}
+    return [
+        f"{w}.{int(f):03d}000{tz_str[int(o)]}" if f else f"{w}{tz_str[int(o)]}"
+        for w, f, o in zip(whole, frac_ms, offsets)
+    ]
+
+
+@dataclass
+class OccurrenceBlock:
+    """
+    All occurrences of one module as parallel arrays.
+
+    ``starts``/``ends`` are local wall times (``datetime64[ms]``) and
+    ``start_offsets``/``end_offsets`` their UTC offsets in seconds, so
+    absolute instants are ``starts_utc``/``ends_utc``. Strings are only
+    produced by ``to_occurrences``.
+    """
+
+    module_id: str
+    module_name: str
+    dates: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+    start_offsets: np.ndarray
+    end_offsets: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.starts.size)
+
+    @property
+    def starts_utc(self) -> np.ndarray:
+        return self.starts - self.start_offsets.astype("timedelta64[s]")
+
+    @property
+    def ends_utc(self) -> np.ndarray:
+        return self.ends - self.end_offsets.astype("timedelta64[s]")
+
+    def to_occurrences(self) -> List[Occurrence]:
+        dates = np.datetime_as_string(self.dates, unit="D")
+        starts = _iso_strings(self.starts, self.start_offsets)
+        ends = _iso_strings(self.ends, self.end_offsets)
+        return [
+            Occurrence(
+                module_id=self.module_id,
+                module_name=self.module_name,
+                date=str(d),
+                start=st,
+                end=en,
+            )
+            for d, st, en in zip(dates, starts, ends)
+        ]
+
+
+def _int_or(v: Any, default: int) -> int:
     try:
-        interval_days = max(1, int(alerts.get("interval", 1)))
+        return int(v)
     except Exception:
-        interval_days = 1
+        return default
 
+
+def _int_or_none(v: Any) -> Optional[int]:
+    if v is None:
+        return None
     try:
-        repeat_count = int(alerts.get("repeatCount", 0))
+        return int(v)
     except Exception:
-        repeat_count = 0
+        return None
+
+
+@dataclass(frozen=True)
+class CompiledModule:
+    """One module's ``alerts`` parsed once: times, offsets, interval, timeout."""
+
+    module_id: str
+    module_name: str
+    repeat: str
+    sticky: bool
+    offset_days: int
+    interval_days: int
+    repeat_count: Optional[int]  # None when missing/invalid in the protocol
+    times: Tuple[str, ...]  # unique, sorted by time of day
+    tod: np.ndarray  # timedelta64[s] per entry of ``times``
+    raw_times_len: int  # len(alerts.times), duplicates included
+    timeout_ms: int  # 0 = window ends at 23:59:59 local
+
+    @property
+    def fire_tod(self) -> np.ndarray:
+        return self.tod[:1] if self.sticky else self.tod
+
+
+@dataclass(frozen=True)
+class CompiledSchedule:
+    study_id: Optional[str]
+    version: Any
+    modules: Tuple[CompiledModule, ...]
+    study_days: int
+    max_offset_days: int
+
+
+def compile_module(module: Dict) -> Optional[CompiledModule]:
+    mid = module.get("id")
+    if not mid:
+        return None
+    alerts = module.get("alerts") or {}
+    times = _unique_times(alerts)
+    timeout_after_ms = _int_or(alerts.get("timeoutAfter") or 0, 0)
+    return CompiledModule(
+        module_id=mid,
+        module_name=module.get("name") or mid,
+        repeat=(alerts.get("repeat") or "").lower(),
+        sticky=bool(alerts.get("sticky", False)),
+        offset_days=_int_or(alerts.get("offsetDays", 0), 0),
+        interval_days=max(1, _int_or(alerts.get("interval", 1), 1)),
+        repeat_count=_int_or_none(alerts.get("repeatCount")),
+        times=tuple(times),
+        tod=np.array([_tod_seconds(t) for t in times], dtype="timedelta64[s]"),
+        raw_times_len=len(alerts.get("times") or ["12:00:00"]),
+        timeout_ms=timeout_after_ms if bool(alerts.get("timeout", False)) and timeout_after_ms > 0 else 0,
+    )
+
+
+def compile_schedule(study: Dict) -> CompiledSchedule:
+    modules = tuple(
+        cm for cm in (compile_module(m) for m in (study.get("modules") or [])) if cm is not None
+    )
+    daily_days = [
+        max(1, cm.repeat_count + 1)
+        for cm in modules
+        if cm.repeat == "daily" and cm.repeat_count is not None
+    ]
+    return CompiledSchedule(
+        study_id=(study.get("properties") or {}).get("study_id"),
+        version=study.get("timestamp"),
+        modules=modules,
+        study_days=max(daily_days) if daily_days else 7,
+        max_offset_days=max([0] + [cm.offset_days for cm in modules]),
+    )
+
+
+SCHEDULE_CACHE_SIZE = int(os.getenv("SCHEDULE_CACHE_SIZE", "128"))
+_schedule_cache: "OrderedDict[Tuple[str, Any], CompiledSchedule]" = OrderedDict()
+
+
+def get_compiled_schedule(study: Union[Dict, CompiledSchedule]) -> CompiledSchedule:
+    """
+    Compiled plan for ``study``, memoised per (study_id, timestamp) in a
+    bounded LRU. Documents without both keys are compiled uncached.
+    """
+    if isinstance(study, CompiledSchedule):
+        return study
+
+    study_id = (study.get("properties") or {}).get("study_id")
+    version = study.get("timestamp")
+    if study_id is None or version is None:
+        return compile_schedule(study)
+
+    key = (study_id, version)
+    plan = _schedule_cache.get(key)
+    if plan is not None:
+        _schedule_cache.move_to_end(key)
+        return plan
+
+    plan = compile_schedule(study)
+    _schedule_cache[key] = plan
+    while len(_schedule_cache) > SCHEDULE_CACHE_SIZE:
+        _schedule_cache.popitem(last=False)
+    return plan
+
+
+def _build_block(cm: CompiledModule, days: np.ndarray, tz: ZoneInfo) -> Optional[OccurrenceBlock]:
+    if days.size == 0:
+        return None
+
+    tod = cm.fire_tod
+
+    # date grid x time-of-day offsets, day-major like the old per-day loop
+    day_ms = days.astype("datetime64[ms]")
+    starts = (day_ms[:, None] + tod[None, :]).ravel()
+    dates = np.repeat(days, tod.size)
+
+    if cm.timeout_ms:
+        ends = starts + np.timedelta64(cm.timeout_ms, "ms")
+    else:
+        ends = dates.astype("datetime64[ms]") + np.timedelta64(_DAY_END_S, "s")
 
-    total_days = max(1, repeat_count + 1)
-    first_day = anchor + timedelta(days=offset_days)
-    last_day = first_day + timedelta(days=(total_days - 1) * interval_days)
+    return OccurrenceBlock(
+        module_id=cm.module_id,
+        module_name=cm.module_name,
+        dates=dates,
+        starts=starts,
+        ends=ends,
+        start_offsets=_tz_offsets(starts, tz),
+        end_offsets=_tz_offsets(ends, tz),
+    )
+
+
+def _expand_daily(
+    cm: CompiledModule,
+    start_date: date,
+    end_date: date,
+    tz: ZoneInfo,
+    baseline_local_date: Optional[date],
+) -> Optional[OccurrenceBlock]:
+    anchor = baseline_local_date or start_date
+    total_days = max(1, (cm.repeat_count or 0) + 1)
+    first_day = anchor + timedelta(days=cm.offset_days)
+    last_day = first_day + timedelta(days=(total_days - 1) * cm.interval_days)
 
     window_start = max(start_date, first_day)
     window_end = min(end_date, last_day)
     if window_end < window_start:
-        return out
+        return None
 
-    sticky = bool(alerts.get("sticky", False))
-    timeout_enabled = bool(alerts.get("timeout", False))
-    timeout_after_ms = int(alerts.get("timeoutAfter") or 0)
+    days = np.arange(
+        np.datetime64(window_start, "D"),
+        np.datetime64(window_end, "D") + 1,
+        cm.interval_days,
+    )
+    return _build_block(cm, days, tz)
 
-    times = _unique_times(alerts)
-    pick_time = times[0]
 
-    d = window_start
-    while d <= window_end:
-        if d < first_day:
-            d += timedelta(days=interval_days)
-            continue
+def _expand_never(
+    cm: CompiledModule,
+    start_date: date,
+    end_date: date,
+    tz: ZoneInfo,
+    baseline_local_date: Optional[date],
+) -> Optional[OccurrenceBlock]:
+    if baseline_local_date is None:
+        return None
 
-        if sticky:
-            tt = _parse_hms(pick_time)
-            start_naive = datetime(d.year, d.month, d.day, tt.hour, tt.minute, tt.second)
-            start_dt = _localize(start_naive, tz)
-            end_dt = _end_dt(start_dt, tz, timeout_enabled, timeout_after_ms)
-
-            out.append(
-                Occurrence(
-                    module_id=module["id"],
-                    module_name=module.get("name") or module["id"],
-                    date=_ymd(d),
-                    start=start_dt.isoformat(),
-                    end=end_dt.isoformat(),
-                )
-            )
-        else:
-            for t in times:
-                tt = _parse_hms(t)
-                start_naive = datetime(d.year, d.month, d.day, tt.hour, tt.minute, tt.second)
-                start_dt = _localize(start_naive, tz)
-                end_dt = _end_dt(start_dt, tz, timeout_enabled, timeout_after_ms)
+    day = baseline_local_date + timedelta(days=cm.offset_days)
+    if not (start_date <= day <= end_date):
+        return None
 
-                out.append(
-                    Occurrence(
-                        module_id=module["id"],
-                        module_name=module.get("name") or module["id"],
-                        date=_ymd(d),
-                        start=start_dt.isoformat(),
-                        end=end_dt.isoformat(),
-                    )
-                )
+    return _build_block(cm, np.array([np.datetime64(day, "D")]), tz)
 
-        d += timedelta(days=interval_days)
 
-    return out
+def expand_compiled_module(
+    cm: CompiledModule,
+    start_date: date,
+    end_date: date,
+    tz: ZoneInfo,
+    baseline_local_date: Optional[date],
+) -> Optional[OccurrenceBlock]:
+    if cm.repeat == "daily":
+        return _expand_daily(cm, start_date, end_date, tz, baseline_local_date)
+    if cm.repeat == "never":
+        return _expand_never(cm, start_date, end_date, tz, baseline_local_date)
+    return None
 
 
-def expand_module_never(
+def expand_module_daily_block(
     module: Dict,
     start_date: date,
     end_date: date,
     tz: ZoneInfo,
     baseline_local_date: Optional[date],
-) -> List[Occurrence]:
-    out: List[Occurrence] = []
-    alerts = module.get("alerts") or {}
-    if (alerts.get("repeat") or "").lower() != "never":
-        return out
+) -> Optional[OccurrenceBlock]:
+    cm = compile_module(module)
+    if cm is None or cm.repeat != "daily":
+        return None
+    return _expand_daily(cm, start_date, end_date, tz, baseline_local_date)
 
-    anchor = baseline_local_date
-    if anchor is None:
-        return out
 
-    try:
-        offset_days = int(alerts.get("offsetDays", 0))
-    except Exception:
-        offset_days = 0
+def expand_module_never_block(
+    module: Dict,
+    start_date: date,
+    end_date: date,
+    tz: ZoneInfo,
+    baseline_local_date: Optional[date],
+) -> Optional[OccurrenceBlock]:
+    cm = compile_module(module)
+    if cm is None or cm.repeat != "never":
+        return None
+    return _expand_never(cm, start_date, end_date, tz, baseline_local_date)
 
-    day = anchor + timedelta(days=offset_days)
-    if not (start_date <= day <= end_date):
-        return out
 
-    times = _unique_times(alerts)
-    sticky = bool(alerts.get("sticky", False))
-    timeout_enabled = bool(alerts.get("timeout", False))
-    timeout_after_ms = int(alerts.get("timeoutAfter") or 0)
-
-    def make_occ(tstr: str) -> Occurrence:
-        tt = _parse_hms(tstr)
-        start_naive = datetime(day.year, day.month, day.day, tt.hour, tt.minute, tt.second)
-        start_dt = _localize(start_naive, tz)
-        end_dt = _end_dt(start_dt, tz, timeout_enabled, timeout_after_ms)
-        return Occurrence(
-            module_id=module["id"],
-            module_name=module.get("name") or module["id"],
-            date=_ymd(day),
-            start=start_dt.isoformat(),
-            end=end_dt.isoformat(),
-        )
-
-    if sticky:
-        out.append(make_occ(times[0]))
-    else:
-        for t in times:
-            out.append(make_occ(t))
+def expand_study_schedule_blocks(
+    study: Union[Dict, CompiledSchedule],
+    start_date: date,
+    end_date: date,
+    tz: ZoneInfo,
+    baseline_local_date: Optional[date] = None,
+) -> List[OccurrenceBlock]:
+    plan = get_compiled_schedule(study)
+    blocks: List[OccurrenceBlock] = []
+    for cm in plan.modules:
+        block = expand_compiled_module(cm, start_date, end_date, tz, baseline_local_date)
+        if block is not None:
+            blocks.append(block)
+    return blocks
+
+
+def expand_module_daily(
+    module: Dict,
+    start_date: date,
+    end_date: date,
+    tz: ZoneInfo,
+    baseline_local_date: Optional[date],
+) -> List[Occurrence]:
+    block = expand_module_daily_block(module, start_date, end_date, tz, baseline_local_date)
+    return block.to_occurrences() if block is not None else []
+
 
-    return out
+def expand_module_never(
+    module: Dict,
+    start_date: date,
+    end_date: date,
+    tz: ZoneInfo,
+    baseline_local_date: Optional[date],
+) -> List[Occurrence]:
+    block = expand_module_never_block(module, start_date, end_date, tz, baseline_local_date)
+    return block.to_occurrences() if block is not None else []
 
 
 def expand_study_schedule(
-    study: Dict,
+    study: Union[Dict, CompiledSchedule],
     start_date: date,
     end_date: date,
     tz: ZoneInfo,
     baseline_local_date: Optional[date] = None,
 ) -> List[Occurrence]:
     occs: List[Occurrence] = []
-    for mod in (study.get("modules") or []):
-        occs.extend(expand_module_daily(mod, start_date, end_date, tz, baseline_local_date))
-        occs.extend(expand_module_never(mod, start_date, end_date, tz, baseline_local_date))
+    for block in expand_study_schedule_blocks(study, start_date, end_date, tz, baseline_local_date):
+        occs.extend(block.to_occurrences())
     occs.sort(key=lambda o: (o.date, o.module_id, o.start))
-    return occs
\ No newline at end of file
+    return occs
@@ -0,0 +1,263 @@
+"""
+Columnar (Parquet / Arrow IPC) export of a study's responses.
+
+One row per response, the response metadata first, then one column per
+question of every module the study ever had, named ``module_id:question_id``
+like the dashboard's variable ids. Numeric questions (``number``, numeric
+text, and ``multi`` questions with an ``option_map``) become ``float64``
+columns, coded through the ``option_map`` the same way the dashboard does;
+everything else is a string column. Field metadata carries the module name,
+question text, type and option map, so labels survive the round trip.
+Answers to questions the protocol does not know, and answers to numeric
+questions that don't code to a number, end up, JSON-encoded, in
+``other_responses``, as does a ``responses`` value that is not a JSON object.
+
+Rows are converted and encoded ``EXPORT_BATCH_ROWS`` at a time on a worker
+thread, and each encoded batch is handed to the HTTP response before the
+next one is read: memory stays at one batch, not one study.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from services.question_catalog import QuestionCatalog, QuestionInfo
+from services.response_docs import parse_responses, parse_time
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "10000"))
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "zstd")
+
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+EXPORT_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "module_id": 1,
+    "module_name": 1,
+    "module_index": 1,
+    "platform": 1,
+    "responses": 1,
+    "response_time": 1,
+    "alert_time": 1,
+}
+
+_TS = pa.timestamp("us", tz="UTC")
+
+_BASE_FIELDS = [
+    pa.field("user_id", pa.string()),
+    pa.field("module_id", pa.string()),
+    pa.field("module_name", pa.string()),
+    pa.field("module_index", pa.int64()),
+    pa.field("platform", pa.string()),
+    pa.field("response_time", _TS),
+    pa.field("alert_time", _TS),
+]
+
+
+def _to_float(v: Any) -> Optional[float]:
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    if isinstance(v, str):
+        try:
+            return float(v.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _to_str(v: Any) -> Optional[str]:
+    if v is None:
+        return None
+    if isinstance(v, str):
+        return v
+    return json.dumps(v, default=str)
+
+
+_INT64_MIN, _INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+
+def _to_int(v: Any) -> Optional[int]:
+    if isinstance(v, bool) or v is None:
+        return None
+    try:
+        n = int(v)
+    except (TypeError, ValueError, OverflowError):
+        return None
+    return n if _INT64_MIN <= n <= _INT64_MAX else None
+
+
+# An answer a numeric column can't hold
+_UNCODED = object()
+
+
+@dataclass(frozen=True)
+class _Column:
+    name: str
+    question: QuestionInfo
+
+    def code(self, v: Any) -> Any:
+        """Column value of answer ``v``, or ``_UNCODED`` if it has none."""
+        q = self.question
+        if not q.is_numeric:
+            return _to_str(v)
+        if v is None:
+            return None
+        if q.option_map and isinstance(v, (str, int, float)):
+            coded = q.option_map.get(str(v))
+            if coded is not None:
+                return coded
+        num = _to_float(v)
+        return _UNCODED if num is None else num
+
+
+class ResponseTableLayout:
+    """Arrow schema of a study export plus the row -> column conversion."""
+
+    def __init__(self, catalog: Optional[QuestionCatalog]):
+        self.columns: Dict[str, Dict[str, _Column]] = {}
+        fields = list(_BASE_FIELDS)
+        for mid, questions in (catalog.by_module if catalog else {}).items():
+            cols = self.columns.setdefault(mid, {})
+            for qid, q in questions.items():
+                col = _Column(f"{mid}:{qid}", q)
+                cols[qid] = col
+                meta = {
+                    "module_id": mid,
+                    "module_name": q.module_name,
+                    "question_id": qid,
+                    "question_text": q.question_text,
+                    "type": q.type or "",
+                    "subtype": q.subtype or "",
+                }
+                if q.option_map:
+                    meta["option_map"] = json.dumps(q.option_map)
+                fields.append(pa.field(col.name, pa.float64() if q.is_numeric else pa.string(), metadata=meta))
+        fields.append(pa.field("other_responses", pa.string()))
+        self.schema = pa.schema(fields)
+
+    def batch(self, docs: List[Dict[str, Any]]) -> pa.RecordBatch:
+        data: Dict[str, List[Any]] = {f.name: [None] * len(docs) for f in self.schema}
+        for i, d in enumerate(docs):
+            mid = d.get("module_id")
+            data["user_id"][i] = _to_str(d.get("user_id"))
+            data["module_id"][i] = mid
+            data["module_name"][i] = d.get("module_name")
+            data["module_index"][i] = _to_int(d.get("module_index"))
+            data["platform"][i] = d.get("platform")
+            data["response_time"][i] = parse_time(d.get("response_time"))
+            data["alert_time"][i] = parse_time(d.get("alert_time"))
+
+            cols = self.columns.get(mid or "", {})
+            raw = d.get("responses")
+            parsed = parse_responses(raw)
+            if parsed is None and raw not in (None, ""):
+                # Keep what we cannot parse rather than dropping it
+                data["other_responses"][i] = _to_str(raw)
+            other = None
+            for qid, v in (parsed or {}).items():
+                col = cols.get(qid)
+                coded = _UNCODED if col is None else col.code(v)
+                if coded is _UNCODED:
+                    if other is None:
+                        other = {}
+                    other[qid] = v
+                else:
+                    data[col.name][i] = coded
+            if other:
+                data["other_responses"][i] = json.dumps(other, default=str)
+
+        return pa.RecordBatch.from_arrays(
+            [pa.array(data[f.name], type=f.type) for f in self.schema], schema=self.schema
+        )
+
+
+class _Drain:
+    """Write-only file object whose contents are taken after every batch."""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, b: Any) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def take(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks = []
+        return out
+
+
+class ExportError(RuntimeError):
+    """A batch could not be encoded; the export stops instead of ending early."""
+
+
+class _ExportWriter:
+    def __init__(self, layout: ResponseTableLayout, fmt: str):
+        self.layout = layout
+        self.sink = _Drain()
+        if fmt == "parquet":
+            self._writer = pq.ParquetWriter(self.sink, layout.schema, compression=EXPORT_COMPRESSION)
+            self._write = lambda b: self._writer.write_batch(b, row_group_size=EXPORT_BATCH_ROWS)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=EXPORT_COMPRESSION)
+            self._writer = pa.ipc.new_stream(self.sink, layout.schema, options=options)
+            self._write = self._writer.write_batch
+
+    def write(self, docs: List[Dict[str, Any]]) -> bytes:
+        try:
+            self._write(self.layout.batch(docs))
+        except (pa.ArrowException, OverflowError, TypeError, ValueError) as exc:
+            raise ExportError(f"Could not encode a batch of {len(docs)} rows: {exc}") from exc
+        return self.sink.take()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self.sink.take()
+
+
+async def export_body(
+    layout: ResponseTableLayout, fmt: str, docs: AsyncIterator[Dict[str, Any]]
+) -> AsyncIterator[bytes]:
+    """
+    Encoded ``fmt`` ("parquet" or "arrow") file, one chunk per batch of rows.
+
+    The status line is long gone when a batch fails to encode, so the
+    failure is logged and raised: the server then aborts the response
+    rather than finishing it, and the client sees a failed download
+    instead of a file that just ends early.
+    """
+    writer = _ExportWriter(layout, fmt)
+    buf: List[Dict[str, Any]] = []
+    try:
+        async for d in docs:
+            buf.append(d)
+            if len(buf) >= EXPORT_BATCH_ROWS:
+                chunk = await asyncio.to_thread(writer.write, buf)
+                buf = []
+                if chunk:
+                    yield chunk
+        if buf:
+            yield await asyncio.to_thread(writer.write, buf)
+    except ExportError as exc:
+        logger.error("%s export aborted: %s", fmt, exc)
+        raise
+    yield await asyncio.to_thread(writer.close)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import DESCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+
+FACET_CACHE_MAX_ENTRIES = int(os.getenv("FACET_CACHE_MAX_ENTRIES", "128"))
+FACET_CACHE_TTL_S = float(os.getenv("FACET_CACHE_TTL_S", "10"))
+
+# (number of responses, (response_time, _id) of the newest one)
+ResponseFingerprint = Tuple[int, Any]
+
+
+async def response_fingerprint(responses_col: AsyncCollection, study_id: str) -> ResponseFingerprint:
+    """
+    Cheap "did this study get new responses" check: an index count plus the
+    newest (response_time, _id), both served by the (study_id, response_time, _id) index.
+    """
+    n = await responses_col.count_documents({"study_id": study_id})
+    newest = await responses_col.find_one(
+        {"study_id": study_id},
+        projection={"_id": 1, "response_time": 1},
+        sort=[("response_time", DESCENDING), ("_id", DESCENDING)],
+    )
+    return (n, (newest.get("response_time"), newest.get("_id")) if newest else None)
+
+
+@dataclass
+class _Entry:
+    value: Dict[str, Any]
+    fingerprint: ResponseFingerprint
+    checked_at: float
+
+
+@dataclass
+class FacetCacheStats:
+    hits: int = 0
+    misses: int = 0
+    revalidations: int = 0
+    reloads: int = 0
+    evictions: int = 0
+
+
+class FacetCache:
+    """
+    Unfiltered ``responses:facets`` result per study (LRU). Within ``ttl_s``
+    an entry is served as-is; after that it is kept only if the study's
+    response fingerprint is unchanged, so new responses invalidate it.
+    """
+
+    def __init__(self, max_entries: int = FACET_CACHE_MAX_ENTRIES, ttl_s: float = FACET_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.stats = FacetCacheStats()
+
+    async def lookup(
+        self, responses_col: AsyncCollection, study_id: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[ResponseFingerprint]]:
+        """
+        Cached value if still valid, else (None, fingerprint) -- pass that
+        fingerprint to ``store`` with the freshly computed value.
+        """
+        entry = self._entries.get(study_id)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < self.ttl_s:
+            self._entries.move_to_end(study_id)
+            self.stats.hits += 1
+            return entry.value, None
+
+        fp = await response_fingerprint(responses_col, study_id)
+        if entry is not None:
+            if fp == entry.fingerprint:
+                entry.checked_at = now
+                self._entries.move_to_end(study_id)
+                self.stats.revalidations += 1
+                return entry.value, None
+            self.stats.reloads += 1
+        else:
+            self.stats.misses += 1
+        return None, fp
+
+    def store(self, study_id: str, value: Dict[str, Any], fingerprint: ResponseFingerprint) -> None:
+        self._entries.pop(study_id, None)
+        self._entries[study_id] = _Entry(value, fingerprint, time.monotonic())
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, study_id: Optional[str] = None) -> None:
+        if study_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(study_id, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        s = self.stats
+        return {
+            "entries": len(self._entries),
+            "hits": s.hits,
+            "misses": s.misses,
+            "revalidations": s.revalidations,
+            "reloads": s.reloads,
+            "evictions": s.evictions,
+        }
+
+
+facet_cache = FacetCache()
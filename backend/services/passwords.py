@@ -0,0 +1,51 @@
+"""
+Async password hashing/verification.
+
+bcrypt costs a few hundred milliseconds of CPU per call; run inline in an
+``async def`` handler it freezes every other request on the worker. Calls
+here run on a small dedicated thread pool (bcrypt releases the GIL) and are
+admitted through a semaphore; when more than ``PASSWORD_HASH_MAX_WAITING``
+callers are already queued, new ones are refused with ``HasherBusy`` so a
+login storm turns into fast 503s instead of an ever-growing backlog.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from crud import pwd_context
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_WAITING = int(os.getenv("PASSWORD_HASH_MAX_WAITING", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+_waiting = 0
+
+
+class HasherBusy(Exception):
+    """Too many password operations queued; the caller should retry later."""
+
+
+async def _run(fn, *args):
+    global _waiting
+    if _slots.locked() and _waiting >= PASSWORD_HASH_MAX_WAITING:
+        raise HasherBusy()
+    _waiting += 1
+    try:
+        await _slots.acquire()
+    finally:
+        _waiting -= 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _slots.release()
+
+
+async def hash_password(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run(pwd_context.verify, password, hashed)
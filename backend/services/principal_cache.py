@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, Optional, Tuple
+
+AUTH_CACHE_TTL_S = float(os.getenv("AUTH_CACHE_TTL_S", "30"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "1024"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """What authorization needs to know about a user; detached from any DB session."""
+
+    id: int
+    username: str
+    role: str
+    studies: FrozenSet[str]
+
+    @classmethod
+    def from_user(cls, user: Any, studies: Iterable[str]) -> "Principal":
+        return cls(
+            id=user.id,
+            username=user.username,
+            role=user.role,
+            studies=frozenset(studies),
+        )
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+    def can_access(self, study_id: str) -> bool:
+        return self.is_admin or study_id in self.studies
+
+
+@dataclass
+class PrincipalCacheStats:
+    hits: int = 0
+    misses: int = 0
+    invalidations: int = 0
+    evictions: int = 0
+
+
+class PrincipalCache:
+    """
+    Principals keyed by token subject (username), LRU-bounded, each entry
+    trusted for ``ttl_s`` seconds. Endpoints that change a user (role,
+    studies, password, details or existence) call ``invalidate``, which only
+    clears this worker's cache: every other worker process keeps serving
+    the old principal for up to ``ttl_s`` (``AUTH_CACHE_TTL_S``, 30 s by
+    default) after the change.
+    """
+
+    def __init__(self, ttl_s: float = AUTH_CACHE_TTL_S, max_entries: int = AUTH_CACHE_MAX_ENTRIES):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self.stats = PrincipalCacheStats()
+
+    def get(self, username: str) -> Optional[Principal]:
+        entry = self._entries.get(username)
+        if entry is not None:
+            principal, stored_at = entry
+            if time.monotonic() - stored_at < self.ttl_s:
+                self._entries.move_to_end(username)
+                self.stats.hits += 1
+                return principal
+            del self._entries[username]
+        self.stats.misses += 1
+        return None
+
+    def put(self, principal: Principal) -> None:
+        self._entries.pop(principal.username, None)
+        self._entries[principal.username] = (principal, time.monotonic())
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def invalidate(self, username: Optional[str] = None) -> None:
+        if username is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(username, None)
+        self.stats.invalidations += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        s = self.stats
+        return {
+            "entries": len(self._entries),
+            "hits": s.hits,
+            "misses": s.misses,
+            "invalidations": s.invalidations,
+            "evictions": s.evictions,
+        }
+
+
+principal_cache = PrincipalCache()
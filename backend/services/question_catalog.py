@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_NUM_RE = re.compile(r"([-+]?\d+(\.\d+)?)")
+
+
+def strip_html(s: str) -> str:
+    return _TAG_RE.sub("", s).strip()
+
+
+def infer_multi_numeric(options: list) -> Optional[Dict[str, float]]:
+    if not options:
+        return None
+
+    parsed: List[Optional[float]] = []
+    labels: List[str] = []
+
+    for opt in options:
+        txt = strip_html(str(opt))
+        labels.append(txt)
+        m = _NUM_RE.search(txt)
+        parsed.append(float(m.group(1)) if m else None)
+
+    if all(v is None for v in parsed):
+        return None
+
+    mapping: Dict[str, float] = {}
+    for idx, (val, lbl) in enumerate(zip(parsed, labels)):
+        score = float(idx) if val is None else float(val)
+        mapping[str(idx)] = score
+        mapping[lbl] = score
+        mapping[str(int(score))] = score
+        if not score.is_integer():
+            mapping[str(score)] = score
+
+    return mapping
+
+
+@dataclass(frozen=True)
+class QuestionInfo:
+    module_id: Optional[str]
+    module_name: str
+    question_id: str
+    question_text: str  # text, label or id -- what the dashboard shows
+    raw_text: Optional[str]  # the protocol's ``text`` as-is
+    type: Optional[str]
+    subtype: Optional[str]
+    is_numeric: bool
+    option_map: Dict[str, float] = field(default_factory=dict)
+    section_index: int = 0
+    section_name: Optional[str] = None
+
+    def to_out(self) -> Dict[str, Any]:
+        return {
+            "module_id": self.module_id,
+            "module_name": self.module_name,
+            "question_id": self.question_id,
+            "question_text": self.question_text,
+            "type": self.type,
+            "subtype": self.subtype,
+            "is_numeric": self.is_numeric,
+            "option_map": self.option_map,
+        }
+
+
+def module_questions(module: Dict[str, Any]) -> List[QuestionInfo]:
+    mid = module.get("id")
+    mname = module.get("name") or module.get("title") or "Unnamed module"
+    params = module.get("params") or {}
+
+    out: List[QuestionInfo] = []
+    for idx, sec in enumerate(params.get("sections") or []):
+        for q in sec.get("questions") or []:
+            qid = q.get("id")
+            if not qid:
+                continue
+
+            qtype = q.get("type")
+            subtype = q.get("subtype")
+            is_schema_numeric = qtype == "number" or (qtype == "text" and subtype == "numeric")
+
+            option_map = None
+            if qtype == "multi":
+                option_map = infer_multi_numeric(q.get("options") or [])
+
+            out.append(
+                QuestionInfo(
+                    module_id=mid,
+                    module_name=mname,
+                    question_id=qid,
+                    question_text=q.get("text") or q.get("label") or qid,
+                    raw_text=q.get("text"),
+                    type=qtype,
+                    subtype=subtype,
+                    is_numeric=bool(is_schema_numeric or option_map),
+                    option_map=option_map or {},
+                    section_index=idx,
+                    section_name=sec.get("name"),
+                )
+            )
+    return out
+
+
+class QuestionCatalog:
+    """
+    Materialised question index for one study version.
+
+    ``questions`` lists the latest version's questions in the order the
+    ``/questions`` endpoint returns them; ``by_module`` covers every module
+    that ever existed (taken from the latest version containing it), so
+    responses to retired modules can still be labeled.
+    """
+
+    def __init__(self, latest_modules: Iterable[Dict[str, Any]], modules_by_id: Dict[str, Dict[str, Any]]):
+        parsed: Dict[int, List[QuestionInfo]] = {}
+
+        def questions_of(m: Dict[str, Any]) -> List[QuestionInfo]:
+            key = id(m)
+            if key not in parsed:
+                parsed[key] = module_questions(m)
+            return parsed[key]
+
+        self.questions: List[QuestionInfo] = [q for m in latest_modules for q in questions_of(m)]
+        self.questions.sort(
+            key=lambda x: (x.module_name or "", x.question_text or "", x.module_id or "", x.question_id or "")
+        )
+
+        self.by_module: Dict[str, Dict[str, QuestionInfo]] = {}
+        for mid, m in modules_by_id.items():
+            self.by_module[mid] = {q.question_id: q for q in questions_of(m)}
+
+    def module(self, module_id: Optional[str]) -> Dict[str, QuestionInfo]:
+        return self.by_module.get(module_id or "", {})
@@ -0,0 +1,286 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
+from pymongo.asynchronous.collection import AsyncCollection
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from core.redis import get_redis
+from services.facet_cache import ResponseFingerprint, facet_cache, response_fingerprint
+from services.single_flight import single_flight
+from services.study_cache import study_cache
+
+RESPONSE_CACHE_TTL_S = int(os.getenv("RESPONSE_CACHE_TTL_S", "600"))
+# Bodies larger than this (uncompressed) are served but not stored
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# How long a worker trusts a study's response fingerprint before re-reading it
+RESPONSE_CACHE_VERSION_TTL_S = float(os.getenv("RESPONSE_CACHE_VERSION_TTL_S", "10"))
+RESPONSE_CACHE_COMPRESS_LEVEL = int(os.getenv("RESPONSE_CACHE_COMPRESS_LEVEL", "6"))
+# After a Redis failure, requests skip Redis for this long (doubling while it keeps failing)
+RESPONSE_CACHE_BREAKER_S = float(os.getenv("RESPONSE_CACHE_BREAKER_S", "5"))
+RESPONSE_CACHE_BREAKER_MAX_S = float(os.getenv("RESPONSE_CACHE_BREAKER_MAX_S", "60"))
+
+_KEY_PREFIX = "rc:v1"
+# Compressing big bodies on the loop would stall it like any other CPU work
+_OFFLOAD_BYTES = 64 * 1024
+# Same for decompressing; JSON bodies shrink about tenfold, so this is ~64 KB inflated
+_OFFLOAD_BLOB_BYTES = _OFFLOAD_BYTES // 10
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_params(params: Mapping[str, Any]) -> str:
+    """Canonical form of a query: None dropped, keys sorted, multi-values sorted."""
+    out: Dict[str, Any] = {}
+    for k, v in params.items():
+        if v is None:
+            continue
+        if isinstance(v, (list, tuple, set, frozenset)):
+            v = sorted(str(x) for x in v)
+        out[k] = v
+    return json.dumps(out, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _json_body(value: Any) -> bytes:
+    # Same encoding as FastAPI's JSONResponse
+    return json.dumps(
+        jsonable_encoder(value), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+@dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    too_large: int = 0
+    errors: int = 0
+    invalidations: int = 0
+    bypassed: int = 0
+
+
+class ResponseCache:
+    """
+    Serialized response bodies of heavy per-study endpoints, shared by all
+    workers through Redis (zlib-compressed, ``ttl_s`` expiry).
+
+    A key is route + normalized query params + the study's data version:
+    the protocol fingerprint (from ``study_cache``) and/or the response
+    fingerprint, depending on what the route reads, plus a per-study
+    generation counter that ``invalidate`` bumps. New versions or responses
+    therefore produce new keys and old entries simply expire.
+
+    Every Redis failure degrades to computing the response locally, and
+    opens a circuit breaker: for ``breaker_s`` seconds (doubled on every
+    consecutive failure, up to ``breaker_max_s``) requests bypass Redis
+    instead of each waiting out the socket timeout. The first request after
+    the window probes Redis again; a success closes the breaker.
+    """
+
+    def __init__(
+        self,
+        client: Optional[Redis] = None,
+        ttl_s: int = RESPONSE_CACHE_TTL_S,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        version_ttl_s: float = RESPONSE_CACHE_VERSION_TTL_S,
+        breaker_s: float = RESPONSE_CACHE_BREAKER_S,
+        breaker_max_s: float = RESPONSE_CACHE_BREAKER_MAX_S,
+    ):
+        self._client = client
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.version_ttl_s = version_ttl_s
+        self.breaker_s = breaker_s
+        self.breaker_max_s = breaker_max_s
+        self._response_versions: Dict[str, Tuple[ResponseFingerprint, float]] = {}
+        self._failures = 0
+        self._open_until = 0.0
+        self.stats = ResponseCacheStats()
+
+    @property
+    def client(self) -> Optional[Redis]:
+        # Explicit client (tests, benchmarks) or the app-wide one from core.redis
+        return self._client if self._client is not None else get_redis()
+
+    def _available(self) -> Optional[Redis]:
+        """The client, or None while the breaker is open."""
+        client = self.client
+        if client is not None and time.monotonic() < self._open_until:
+            self.stats.bypassed += 1
+            return None
+        return client
+
+    def _failed(self, what: str, exc: RedisError) -> None:
+        self.stats.errors += 1
+        self._failures += 1
+        window = min(self.breaker_s * 2 ** (self._failures - 1), self.breaker_max_s)
+        self._open_until = time.monotonic() + window
+        logger.warning("response cache %s failed, bypassing Redis for %.0fs: %s", what, window, exc)
+
+    def _succeeded(self) -> None:
+        self._failures = 0
+        self._open_until = 0.0
+
+    async def _responses_version(self, responses_col: AsyncCollection, study_id: str) -> ResponseFingerprint:
+        cached = self._response_versions.get(study_id)
+        now = time.monotonic()
+        if cached is not None and now - cached[1] < self.version_ttl_s:
+            return cached[0]
+        fp = await response_fingerprint(responses_col, study_id)
+        self._response_versions[study_id] = (fp, now)
+        return fp
+
+    async def data_version(
+        self,
+        study_id: str,
+        studies_col: Optional[AsyncCollection] = None,
+        responses_col: Optional[AsyncCollection] = None,
+    ) -> str:
+        parts = []
+        if studies_col is not None:
+            parts.append(await study_cache.fingerprint(studies_col, study_id))
+        if responses_col is not None:
+            parts.append(await self._responses_version(responses_col, study_id))
+        return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _generation_key(study_id: str) -> str:
+        return f"{_KEY_PREFIX}:gen:{study_id}"
+
+    async def _key(self, client: Redis, route: str, study_id: str, params: Mapping[str, Any], version: str) -> str:
+        generation = int(await client.get(self._generation_key(study_id)) or 0)
+        digest = hashlib.sha1(normalize_params(params).encode()).hexdigest()[:20]
+        return f"{_KEY_PREFIX}:{study_id}:{generation}:{version}:{route}:{digest}"
+
+    async def _store(self, client: Redis, key: str, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            self.stats.too_large += 1
+            return
+        if len(body) > _OFFLOAD_BYTES:
+            blob = await asyncio.to_thread(zlib.compress, body, RESPONSE_CACHE_COMPRESS_LEVEL)
+        else:
+            blob = zlib.compress(body, RESPONSE_CACHE_COMPRESS_LEVEL)
+        try:
+            await client.set(key, blob, ex=self.ttl_s)
+            self.stats.stores += 1
+        except RedisError as exc:
+            self._failed("store", exc)
+
+    async def _tee(self, client: Redis, key: str, body: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        # Stream through unchanged; store only once the whole body was produced
+        chunks = []
+        size = 0
+        async for chunk in body:
+            yield chunk
+            if chunks is not None:
+                chunk = chunk.encode() if isinstance(chunk, str) else bytes(chunk)
+                size += len(chunk)
+                if size > self.max_bytes:
+                    chunks = None
+                    self.stats.too_large += 1
+                else:
+                    chunks.append(chunk)
+        if chunks is not None:
+            await self._store(client, key, b"".join(chunks))
+
+    async def respond(
+        self,
+        route: str,
+        study_id: str,
+        params: Mapping[str, Any],
+        compute: Callable[[], Awaitable[Any]],
+        *,
+        studies_col: Optional[AsyncCollection] = None,
+        responses_col: Optional[AsyncCollection] = None,
+        stream: bool = False,
+    ) -> Response:
+        """
+        Cached body for this request, else ``compute()``'s result (a
+        JSON-able value, or a ``StreamingResponse`` when ``stream``), stored
+        on the way out. Pass the collection(s) whose changes must invalidate
+        the entry. Exceptions from ``compute`` (e.g. 404s) propagate and are
+        not cached.
+
+        Concurrent identical misses share one ``compute`` through
+        ``single_flight``; streams can be consumed only once, so
+        ``stream=True`` routes are not coalesced.
+        """
+        client = self._available()
+        key = None
+        if client is not None:
+            version = await self.data_version(study_id, studies_col, responses_col)
+            try:
+                key = await self._key(client, route, study_id, params, version)
+                blob = await client.get(key)
+                self._succeeded()
+            except RedisError as exc:
+                self._failed("lookup", exc)
+                key, blob = None, None
+            if blob is not None:
+                self.stats.hits += 1
+                if len(blob) > _OFFLOAD_BLOB_BYTES:
+                    body = await asyncio.to_thread(zlib.decompress, blob)
+                else:
+                    body = zlib.decompress(blob)
+                return Response(body, media_type="application/json", headers={"X-Cache": "HIT"})
+            self.stats.misses += 1
+
+        if stream:
+            result: StreamingResponse = await compute()
+            if key is not None:
+                result.body_iterator = self._tee(client, key, result.body_iterator)
+                result.headers["X-Cache"] = "MISS"
+            return result
+
+        async def produce() -> bytes:
+            body = _json_body(await compute())
+            if key is not None:
+                await self._store(client, key, body)
+            return body
+
+        body, _ = await single_flight.do((route, study_id, normalize_params(params)), produce)
+        return Response(body, media_type="application/json", headers={"X-Cache": "MISS"} if key else None)
+
+    async def invalidate(self, study_id: str) -> None:
+        """Drop every cached body of ``study_id`` for all workers (and this worker's local caches)."""
+        self._response_versions.pop(study_id, None)
+        study_cache.invalidate(study_id)
+        facet_cache.invalidate(study_id)
+        self.stats.invalidations += 1
+        client = self.client
+        if client is None:
+            return
+        # Tried even while the breaker is open: a lost bump would serve stale bodies later
+        try:
+            await client.incr(self._generation_key(study_id))
+            self._succeeded()
+        except RedisError as exc:
+            self._failed("invalidation", exc)
+
+    def snapshot(self) -> Dict[str, Any]:
+        s = self.stats
+        return {
+            "enabled": self.client is not None,
+            "breaker_open": time.monotonic() < self._open_until,
+            "hits": s.hits,
+            "misses": s.misses,
+            "stores": s.stores,
+            "too_large": s.too_large,
+            "errors": s.errors,
+            "invalidations": s.invalidations,
+            "bypassed": s.bypassed,
+        }
+
+
+response_cache = ResponseCache()
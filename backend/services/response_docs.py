@@ -0,0 +1,179 @@
+"""
+Storage shapes of documents in the ``responses`` collection.
+
+Current documents carry ``responses`` as a subdocument and
+``response_time`` / ``alert_time`` as BSON dates. Older ones keep the whole
+payload in a ``raw`` JSON string, ``responses`` as a JSON string and times
+as ISO strings in assorted formats; ``normalize_update`` turns those into
+the current shape (see ``migrate_responses.py``). Old-shape documents can
+still arrive after a backfill, so read paths keep their string fallbacks
+and date filters match both encodings.
+"""
+from __future__ import annotations
+
+import json
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Top-level fields a ``raw`` payload may provide
+PAYLOAD_FIELDS = (
+    "data_type",
+    "user_id",
+    "study_id",
+    "module_index",
+    "platform",
+    "module_id",
+    "module_name",
+    "responses",
+    "response_time",
+    "alert_time",
+)
+TIME_FIELDS = ("response_time", "alert_time")
+
+# Any of these means the document still needs normalising
+LEGACY_FILTER: Dict[str, Any] = {
+    "$or": [
+        {"raw": {"$type": "string"}, "study_id": {"$exists": False}},
+        {"responses": {"$type": "string"}},
+        {"response_time": {"$type": ["string", "number"]}},
+        {"alert_time": {"$type": ["string", "number"]}},
+    ]
+}
+
+_FRACTION_RE = re.compile(r"\.(\d+)")
+
+# Checkpoint of ``migrate_responses.py`` in the ``migrations`` collection
+MIGRATION_ID = "normalize_responses_v1"
+
+
+def parse_time(v: Any) -> Optional[datetime]:
+    """
+    Timezone-aware UTC datetime from a stored time value: BSON dates, ISO
+    strings (``Z``/offsets, space separator, any number of fractional
+    digits; naive means UTC) or epoch seconds/milliseconds.
+    """
+    if isinstance(v, datetime):
+        return v.astimezone(timezone.utc) if v.tzinfo else v.replace(tzinfo=timezone.utc)
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        try:
+            return datetime.fromtimestamp(v / 1000.0 if abs(v) >= 1e11 else v, tz=timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            return None
+    if isinstance(v, str):
+        s = v.strip()
+        if not s:
+            return None
+        if s.endswith(("Z", "z")):
+            s = s[:-1] + "+00:00"
+        # fromisoformat (3.10) only takes 3 or 6 fractional digits
+        s = _FRACTION_RE.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), s, count=1)
+        try:
+            return parse_time(datetime.fromisoformat(s))
+        except ValueError:
+            return None
+    return None
+
+
+def json_default(v: Any) -> Any:
+    """
+    ``json.dumps`` default of the streamed response routes.
+
+    The Mongo client is ``tz_aware``, so BSON dates serialise with their
+    UTC offset (``2024-05-01T08:30:15.123000+00:00``); pydantic
+    ``response_model`` routes write the same instant with a ``Z``.
+    """
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return str(v)  # ObjectId etc.
+
+
+def parse_responses(v: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(v, dict):
+        return v
+    if isinstance(v, str):
+        try:
+            obj = json.loads(v)
+        except ValueError:
+            return None
+        return obj if isinstance(obj, dict) else None
+    return None
+
+
+def merge_raw(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """``doc`` with the payload fields it lacks filled in from its ``raw`` JSON."""
+    payload = parse_responses(doc["raw"]) if isinstance(doc.get("raw"), str) else None
+    if not payload:
+        return doc
+    merged = dict(doc)
+    for k in PAYLOAD_FIELDS:
+        if k in payload and merged.get(k) is None:
+            merged[k] = payload[k]
+    return merged
+
+
+def legacy_study_filter(study_id: str) -> Dict[str, Any]:
+    """
+    Documents of ``study_id`` that only name it inside ``raw``. Matching
+    ``study_id: None`` keeps the scan on the null range of the study_id
+    index, i.e. on documents the migration has not reached (or that were
+    written in the old shape since); after a backfill that range is small.
+    """
+    pattern = r'"study_id":\s*"' + re.escape(study_id) + '"'
+    return {"study_id": None, "raw": {"$regex": pattern}}
+
+
+def study_filter(study_id: str) -> Dict[str, Any]:
+    """Documents of ``study_id``, including raw-only ones."""
+    return {"$or": [{"study_id": study_id}, legacy_study_filter(study_id)]}
+
+
+def normalize_update(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    ``$set`` update bringing ``doc`` to the current shape, or None if there
+    is nothing to change. Fields that don't parse are left as they are;
+    ``raw`` is kept (legacy readers still search it).
+    """
+    merged = merge_raw(doc)
+    changes: Dict[str, Any] = {}
+    for k in PAYLOAD_FIELDS:
+        if k in merged and k not in doc:
+            changes[k] = merged[k]
+
+    if isinstance(merged.get("responses"), str):
+        parsed = parse_responses(merged["responses"])
+        if parsed is not None:
+            changes["responses"] = parsed
+
+    for k in TIME_FIELDS:
+        v = merged.get(k)
+        if isinstance(v, (str, int, float)) and not isinstance(v, bool):
+            dt = parse_time(v)
+            if dt is not None:
+                changes[k] = dt
+
+    return {"$set": changes} if changes else None
+
+
+def time_range_filter(field: str, from_: Optional[str], to: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    Range predicate on ``field`` for ISO bounds. Matches BSON dates and, for
+    documents not migrated yet, ISO strings (compared as strings, as before).
+    """
+    bounds = [("$gte", from_), ("$lte", to)]
+    as_date: Dict[str, Any] = {}
+    as_str: Dict[str, Any] = {}
+    for op, raw in bounds:
+        if not raw:
+            continue
+        try:
+            dt = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+        except ValueError:
+            continue
+        as_str[op] = dt.isoformat()
+        as_date[op] = parse_time(dt)
+    if not as_date:
+        return None
+    return {"$or": [{field: as_date}, {field: as_str}]}
@@ -0,0 +1,185 @@
+"""
+Query building blocks of the paged responses endpoint.
+
+Keyset paging: a cursor carries the sort key of the last row served,
+``(response_time, _id)`` as stored in Mongo (``json_util`` keeps
+datetimes/ObjectIds typed), plus the sort direction it was issued for.
+
+Until ``migrate_responses.py`` has run, ``response_time`` holds a mix of
+BSON dates, ISO strings, epoch numbers and nulls. Mongo sorts those by type
+first (null < numbers < strings < dates), but ``$lt``/``$gt`` only match
+values of the same type, so the "after the cursor" predicate also admits
+every value of a type that sorts after the cursor's.
+
+The answer filters are described next to their code below.
+
+Invalid input raises ``ValueError``; routers turn it into a 400.
+"""
+from __future__ import annotations
+
+import base64
+import binascii
+import math
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId, json_util
+from bson.errors import BSONError
+from pymongo import DESCENDING
+
+# BSON sort order of the types response_time can hold
+_TYPE_ORDER = ("null", "number", "string", "date")
+
+
+def encode_cursor(doc: Dict[str, Any], sort: str) -> str:
+    raw = json_util.dumps({"t": doc.get("response_time"), "id": doc["_id"], "s": sort})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, sort: str) -> Tuple[Any, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        obj = json_util.loads(raw)
+        rt, oid, s = obj["t"], obj["id"], obj["s"]
+    except (binascii.Error, BSONError, ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    # Both values end up in the query: anything but a plain sort key could be an operator
+    if isinstance(rt, bool) or not (rt is None or isinstance(rt, (int, float, str, datetime))):
+        raise ValueError("Invalid cursor")
+    if isinstance(oid, bool) or not isinstance(oid, (ObjectId, str, int)):
+        raise ValueError("Invalid cursor")
+    if s != sort:
+        raise ValueError("Cursor was issued for a different sort order")
+    return rt, oid
+
+
+def _type_name(v: Any) -> Optional[str]:
+    if v is None:
+        return "null"
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return "number"
+    if isinstance(v, str):
+        return "string"
+    if isinstance(v, datetime):
+        return "date"
+    return None
+
+
+def _of_types(types: Tuple[str, ...]) -> List[Dict[str, Any]]:
+    # {"response_time": None} also matches documents without the field, which sort with nulls
+    return [{"response_time": None} if t == "null" else {"response_time": {"$type": t}} for t in types]
+
+
+def after_cursor(rt: Any, oid: Any, sort_dir: int) -> Dict[str, Any]:
+    """Rows that come after ``(rt, oid)`` in ``(response_time, _id)`` order ``sort_dir``."""
+    op = "$lt" if sort_dir == DESCENDING else "$gt"
+    tie = {"response_time": rt, "_id": {op: oid}}
+    kind = _type_name(rt)
+    if kind is None:
+        return {"$or": [{"response_time": {op: rt}}, tie]}
+
+    clauses: List[Dict[str, Any]] = []
+    if kind != "null":
+        clauses.append({"response_time": {op: rt}})
+    clauses.append(tie)
+    rank = _TYPE_ORDER.index(kind)
+    later = _TYPE_ORDER[:rank] if sort_dir == DESCENDING else _TYPE_ORDER[rank + 1:]
+    clauses.extend(_of_types(later))
+    return {"$or": clauses}
+
+
+# Answer filters: ``qid:value`` (exact) and ``qid:substring`` (contains).
+#
+# ``answer_matches`` defines what matches, as it always has: the answer's
+# Python ``str()`` equals the value or contains the substring (``5.0`` is
+# "5.0", ``True`` is "True", a list is its repr, an absent answer is "").
+# ``answer_filter`` is the Mongo side, a superset of that used to narrow the
+# scan: it can't render str() of numbers, lists or objects exactly, so
+# candidates of those types are let through, as are documents whose
+# ``responses`` is still a JSON string. Every row it returns is checked with
+# ``answer_matches``, so both storage shapes get the same semantics.
+# Question ids that aren't usable as a field path ("." or a leading "$")
+# are left out of the Mongo side and only checked in Python.
+
+_NUMERIC_SUBSTR_RE = re.compile(r"[0-9.eE+-]+")
+
+
+def answer_field(qid: str) -> Optional[str]:
+    """Field path of ``qid``'s answer, or None when ``qid`` can't be one."""
+    if not qid or qid.startswith("$") or "." in qid:
+        return None
+    return f"responses.{qid}"
+
+
+def _number(v: str) -> Optional[float]:
+    try:
+        num = float(v)
+    except ValueError:
+        return None
+    return num if math.isfinite(num) else None
+
+
+def _exact_candidates(field: str, v: str) -> Dict[str, Any]:
+    clauses: List[Dict[str, Any]] = [{field: v}]
+    num = _number(v)
+    if num is not None:
+        clauses.append({field: num})
+    if v in ("True", "False"):
+        clauses.append({field: v == "True"})
+    if v == "None":
+        clauses.append({field: None})  # also matches absent answers, which answer_matches drops
+    if v[:1] in ("[", "{"):
+        clauses.extend({field: {"$type": t}} for t in ("array", "object"))
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def _contains_candidates(field: str, substr: str) -> Dict[str, Any]:
+    clauses: List[Dict[str, Any]] = [
+        {field: {"$regex": re.escape(substr)}},
+        # str() of a list or object also shows quotes, brackets and separators
+        {field: {"$type": "array"}},
+        {field: {"$type": "object"}},
+    ]
+    if _NUMERIC_SUBSTR_RE.fullmatch(substr):
+        clauses.append({field: {"$type": "number"}})
+    for word, value in (("True", True), ("False", False)):
+        if substr in word:
+            clauses.append({field: value})
+    if substr in "None":
+        clauses.append({field: None})  # also matches absent answers, which answer_matches drops
+    return {"$or": clauses}
+
+
+def answer_filter(exact: List[Tuple[str, str]], contains: List[Tuple[str, str]]) -> Optional[Dict[str, Any]]:
+    """
+    Mongo predicate narrowing the scan for match/contains on subdocument
+    ``responses``, or None when none of the question ids can be pushed
+    down. Legacy documents store ``responses`` as a JSON string, which
+    Mongo can't look into; those are let through.
+    """
+    preds: List[Dict[str, Any]] = []
+    for qid, v in exact:
+        field = answer_field(qid)
+        if field:
+            preds.append(_exact_candidates(field, v))
+    for qid, substr in contains:
+        field = answer_field(qid)
+        if field:
+            preds.append(_contains_candidates(field, substr))
+    if not preds:
+        return None
+
+    return {"$or": [{"responses": {"$type": "string"}}, {"$and": preds}]}
+
+
+def answer_matches(resp_map: Dict[str, Any], exact: List[Tuple[str, str]], contains: List[Tuple[str, str]]) -> bool:
+    for qid, v in exact:
+        if str(resp_map.get(qid, "")) != v:
+            return False
+    for qid, substr in contains:
+        if substr not in str(resp_map.get(qid, "")):
+            return False
+    return True
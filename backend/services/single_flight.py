@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+@dataclass
+class SingleFlightStats:
+    leaders: int = 0
+    coalesced: int = 0
+    errors: int = 0
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one in-flight computation.
+
+    The first caller starts ``compute`` as its own task; callers arriving
+    before it finishes await the same task and get the same result (or
+    exception). Nothing is kept afterwards -- this is not a cache.
+
+    The task is shielded, so a caller that disconnects does not cancel the
+    work the others are waiting for. Keys must include everything the
+    result depends on; callers authorize *before* joining, so sharing a
+    result between users who may both see the study is safe.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = SingleFlightStats()
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """``(result, shared)``; ``shared`` is True for callers that joined an existing flight."""
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.stats.coalesced += 1
+        else:
+            self.stats.leaders += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.stats.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        s = self.stats
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": s.leaders,
+            "coalesced": s.coalesced,
+            "errors": s.errors,
+        }
+
+
+single_flight = SingleFlight()
@@ -0,0 +1,165 @@
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import bson
+from pymongo.asynchronous.collection import AsyncCollection
+
+from services.single_flight import single_flight
+from services.study_versions import StudyVersions, load_study_versions
+
+STUDY_CACHE_MAX_ENTRIES = int(os.getenv("STUDY_CACHE_MAX_ENTRIES", "64"))
+STUDY_CACHE_MAX_BYTES = int(os.getenv("STUDY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+STUDY_CACHE_TTL_S = float(os.getenv("STUDY_CACHE_TTL_S", "30"))
+
+
+# (max timestamp, number of versions) -- changes whenever a version is added or removed
+Fingerprint = Tuple[Any, int]
+
+
+@dataclass
+class _Entry:
+    resolver: StudyVersions
+    fingerprint: Fingerprint
+    size: int
+    checked_at: float
+
+
+@dataclass
+class StudyCacheStats:
+    hits: int = 0
+    misses: int = 0
+    revalidations: int = 0
+    reloads: int = 0
+    evictions: int = 0
+
+
+class StudyCache:
+    """
+    In-process cache of study protocol documents (all versions of a study).
+
+    Bounded by entry count and total BSON size (LRU eviction). Entries are
+    served without touching Mongo for ``ttl_s`` seconds; after that a single
+    aggregate compares the study's (max ``timestamp``, version count) with
+    the cached one and only reloads the documents when it changed.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = STUDY_CACHE_MAX_ENTRIES,
+        max_bytes: int = STUDY_CACHE_MAX_BYTES,
+        ttl_s: float = STUDY_CACHE_TTL_S,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.stats = StudyCacheStats()
+
+    async def _fingerprint(self, studies_col: AsyncCollection, study_id: str) -> Fingerprint:
+        pipeline = [
+            {"$match": {"properties.study_id": study_id}},
+            {"$group": {"_id": None, "v": {"$max": "$timestamp"}, "n": {"$sum": 1}}},
+        ]
+        rows = await (await studies_col.aggregate(pipeline)).to_list(1)
+        if not rows:
+            return (None, 0)
+        return (rows[0].get("v"), int(rows[0].get("n") or 0))
+
+    def _drop(self, study_id: str) -> None:
+        entry = self._entries.pop(study_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _store(self, study_id: str, resolver: StudyVersions, fingerprint: Fingerprint) -> None:
+        self._drop(study_id)
+        size = sum(len(bson.encode(d)) for d in resolver.versions)
+        if size > self.max_bytes:
+            return
+        self._entries[study_id] = _Entry(resolver, fingerprint, size, time.monotonic())
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old.size
+            self.stats.evictions += 1
+
+    async def get_resolver(self, studies_col: AsyncCollection, study_id: str) -> StudyVersions:
+        """Version resolver for ``study_id``. Documents are shared; do not mutate."""
+        entry = self._entries.get(study_id)
+        if entry is not None and time.monotonic() - entry.checked_at < self.ttl_s:
+            self._entries.move_to_end(study_id)
+            self.stats.hits += 1
+            return entry.resolver
+
+        # Concurrent misses / revalidations of a study share one round trip
+        resolver, _ = await single_flight.do(
+            ("study_cache", id(self), study_id), lambda: self._revalidate(studies_col, study_id)
+        )
+        return resolver
+
+    async def _revalidate(self, studies_col: AsyncCollection, study_id: str) -> StudyVersions:
+        entry = self._entries.get(study_id)
+        now = time.monotonic()
+
+        # Fingerprint first: a version written in between only causes an extra reload later
+        fp = await self._fingerprint(studies_col, study_id)
+        if entry is not None:
+            if fp == entry.fingerprint:
+                entry.checked_at = now
+                self._entries.move_to_end(study_id)
+                self.stats.revalidations += 1
+                return entry.resolver
+            self.stats.reloads += 1
+        else:
+            self.stats.misses += 1
+
+        resolver = await load_study_versions(studies_col, study_id)
+        if resolver:
+            self._store(study_id, resolver, fp)
+        else:
+            self._drop(study_id)
+        return resolver
+
+    async def fingerprint(self, studies_col: AsyncCollection, study_id: str) -> Fingerprint:
+        """Protocol version of ``study_id`` as of the last (re)validation."""
+        await self.get_resolver(studies_col, study_id)
+        entry = self._entries.get(study_id)
+        if entry is not None:
+            return entry.fingerprint
+        # Missing or too large to cache
+        return await self._fingerprint(studies_col, study_id)
+
+    async def get_versions(self, studies_col: AsyncCollection, study_id: str) -> List[Dict[str, Any]]:
+        """All versions of ``study_id``, oldest first."""
+        return (await self.get_resolver(studies_col, study_id)).versions
+
+    async def get_study(self, studies_col: AsyncCollection, study_id: str) -> Optional[Dict[str, Any]]:
+        """Latest version of ``study_id``."""
+        return (await self.get_resolver(studies_col, study_id)).latest()
+
+    def invalidate(self, study_id: Optional[str] = None) -> None:
+        if study_id is None:
+            self._entries.clear()
+            self._bytes = 0
+        else:
+            self._drop(study_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        s = self.stats
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": s.hits,
+            "misses": s.misses,
+            "revalidations": s.revalidations,
+            "reloads": s.reloads,
+            "evictions": s.evictions,
+        }
+
+
+study_cache = StudyCache()
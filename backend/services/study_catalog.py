@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.asynchronous.collection import AsyncCollection
+
+from services.study_versions import version_key
+
+STUDY_CATALOG_TTL_S = float(os.getenv("STUDY_CATALOG_TTL_S", "30"))
+
+# Every version per study, only the fields the catalog shows. The latest one
+# is picked in Python with version_key, like everywhere else: a $sort on the
+# raw timestamp would order mixed strings/numbers/dates by BSON type.
+_VERSIONS_PIPELINE = [
+    {"$project": {
+        "id": 1,
+        "title": 1,
+        "description": 1,
+        "timestamp": 1,
+        "properties.study_id": 1,
+        "properties.study_name": 1,
+        "properties.description": 1,
+    }},
+    {"$group": {"_id": {"$ifNull": ["$properties.study_id", "$id"]}, "docs": {"$push": "$$ROOT"}}},
+    {"$sort": {"_id": 1}},
+]
+
+_VERSION_PIPELINE = [
+    {"$group": {"_id": None, "v": {"$max": "$timestamp"}, "n": {"$sum": 1}}},
+]
+
+
+def _entry(doc: Dict[str, Any]) -> Dict[str, Any]:
+    props = doc.get("properties") or {}
+    return {
+        "id": doc.get("id") or props.get("study_id") or "",
+        "title": doc.get("title") or props.get("study_name") or "Untitled Study",
+        "description": doc.get("description") or props.get("description") or "",
+    }
+
+
+class StudyCatalog:
+    """
+    ``/api/studies`` listing (latest version of each study) with its
+    version tag, the (max ``timestamp``, count) of the studies collection.
+
+    Within ``ttl_s`` both are served from memory, so conditional requests
+    are answered without Mongo; after that the tag is re-read and the
+    listing rebuilt only if it changed.
+    """
+
+    def __init__(self, ttl_s: float = STUDY_CATALOG_TTL_S):
+        self.ttl_s = ttl_s
+        self._version: Optional[Tuple[Any, int]] = None
+        self._studies: List[Dict[str, Any]] = []
+        self._checked_at = 0.0
+
+    async def _read_version(self, studies_col: AsyncCollection) -> Tuple[Any, int]:
+        rows = await (await studies_col.aggregate(_VERSION_PIPELINE)).to_list(1)
+        if not rows:
+            return (None, 0)
+        return (rows[0].get("v"), int(rows[0].get("n") or 0))
+
+    async def refresh(self, studies_col: AsyncCollection) -> None:
+        now = time.monotonic()
+        if self._version is not None and now - self._checked_at < self.ttl_s:
+            return
+        version = await self._read_version(studies_col)
+        if version != self._version:
+            rows = await (await studies_col.aggregate(_VERSIONS_PIPELINE)).to_list(None)
+            self._studies = [_entry(max(r["docs"], key=version_key)) for r in rows]
+            self._version = version
+        self._checked_at = now
+
+    def etag(self, skip: int, limit: Optional[int]) -> str:
+        # Strong validator: same collection version + same page => identical body
+        raw = f"{self._version!r}|{skip}|{limit}"
+        return '"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+    def page(self, skip: int, limit: Optional[int]) -> List[Dict[str, Any]]:
+        end = None if limit is None else skip + limit
+        return self._studies[skip:end]
+
+    def invalidate(self) -> None:
+        self._version = None
+
+
+study_catalog = StudyCatalog()
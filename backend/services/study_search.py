@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import heapq
+import logging
+import os
+import re
+import sys
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo.asynchronous.collection import AsyncCollection
+
+from services.single_flight import single_flight
+from services.study_versions import version_key
+
+logger = logging.getLogger(__name__)
+
+STUDY_SEARCH_REFRESH_S = float(os.getenv("STUDY_SEARCH_REFRESH_S", "60"))
+STUDY_SEARCH_MAX_RESULTS = int(os.getenv("STUDY_SEARCH_MAX_RESULTS", "50"))
+
+_PROJECTION = {
+    "_id": 1,
+    "properties.study_id": 1,
+    "properties.study_name": 1,
+    "properties.name": 1,
+    "timestamp": 1,
+}
+
+
+_WORD_SPLIT_RE = re.compile(r"[\s_\-./]+")
+
+
+def normalize(s: str) -> str:
+    """Case-folded, accent-stripped, whitespace-collapsed."""
+    decomposed = unicodedata.normalize("NFKD", s)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+def _successor(prefix: str) -> Optional[str]:
+    """Smallest string greater than every string starting with ``prefix`` (None: no bound)."""
+    while prefix and prefix[-1] == chr(sys.maxunicode):
+        prefix = prefix[:-1]
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _trigrams(s: str) -> Set[str]:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+@dataclass(frozen=True)
+class _Entry:
+    study_id: str
+    name: Optional[str]
+    norm_id: str
+    norm_name: str
+
+
+class StudySearchIndex:
+    """
+    Study id/name catalog for autocomplete, held in memory.
+
+    Matches are ranked exact > prefix > word prefix > substring, id before
+    name, then shorter id first. Exact/prefix/word-prefix tiers are bisect
+    ranges over sorted keys; the substring tier, only consulted when the
+    better tiers leave room in the top-k, goes through a trigram posting
+    list (queries under three characters scan the catalog instead). The
+    catalog is rebuilt from a projected query every ``refresh_s`` seconds
+    in the background; callers only wait for the very first build. Builds
+    go through ``single_flight``, so a cold start under load runs one query.
+    """
+
+    def __init__(self, refresh_s: float = STUDY_SEARCH_REFRESH_S):
+        self.refresh_s = refresh_s
+        self._entries: List[_Entry] = []
+        self._postings: Dict[str, Set[int]] = {}
+        # (key, entry index) sorted by key, per matchable field
+        self._ids: List[Tuple[str, int]] = []
+        self._names: List[Tuple[str, int]] = []
+        self._words: List[Tuple[str, int]] = []
+        self._built_at: Optional[float] = None
+        self._refreshing: Optional[asyncio.Task] = None
+
+    async def refresh(self, studies_col: AsyncCollection) -> None:
+        # Latest version per study, ordered like StudyVersions / the catalog
+        latest: Dict[str, Tuple[Tuple[float, str], Dict[str, Any]]] = {}
+        async for doc in studies_col.find({}, projection=_PROJECTION):
+            props = doc.get("properties") or {}
+            sid = props.get("study_id")
+            if not isinstance(sid, str) or not sid:
+                continue
+            key = version_key(doc)
+            if sid not in latest or key >= latest[sid][0]:
+                latest[sid] = (key, props)
+
+        entries: List[_Entry] = []
+        postings: Dict[str, Set[int]] = {}
+        words: List[Tuple[str, int]] = []
+        # Entry index doubles as the tie-break: shorter id first, then alphabetical
+        for sid in sorted(latest, key=lambda x: (len(normalize(x)), normalize(x))):
+            props = latest[sid][1]
+            name = props.get("study_name") or props.get("name")
+            name = name if isinstance(name, str) else None
+            entry = _Entry(sid, name, normalize(sid), normalize(name or ""))
+            idx = len(entries)
+            entries.append(entry)
+            for g in _trigrams(entry.norm_id) | _trigrams(entry.norm_name):
+                postings.setdefault(g, set()).add(idx)
+            for w in set(_WORD_SPLIT_RE.split(entry.norm_id) + _WORD_SPLIT_RE.split(entry.norm_name)):
+                if w:
+                    words.append((w, idx))
+
+        ids = sorted((e.norm_id, i) for i, e in enumerate(entries))
+        names = sorted((e.norm_name, i) for i, e in enumerate(entries) if e.norm_name)
+        words.sort()
+
+        # Swap in one step; concurrent searches see either the old or the new catalog
+        self._entries, self._postings = entries, postings
+        self._ids, self._names, self._words = ids, names, words
+        self._built_at = time.monotonic()
+
+    async def _build(self, studies_col: AsyncCollection) -> None:
+        await single_flight.do(("study_search", id(self)), lambda: self.refresh(studies_col))
+
+    async def _background_refresh(self, studies_col: AsyncCollection) -> None:
+        try:
+            await self._build(studies_col)
+        except Exception as e:  # keep serving the previous catalog
+            logger.warning("Study search refresh failed: %s", e)
+        finally:
+            self._refreshing = None
+
+    async def ensure_fresh(self, studies_col: AsyncCollection) -> None:
+        if self._built_at is None:
+            await self._build(studies_col)
+        elif time.monotonic() - self._built_at >= self.refresh_s and self._refreshing is None:
+            self._refreshing = asyncio.create_task(self._background_refresh(studies_col))
+
+    @staticmethod
+    def _prefixed(keys: List[Tuple[str, int]], q: str) -> List[Tuple[str, int]]:
+        lo = bisect.bisect_left(keys, (q,))
+        end = _successor(q)
+        hi = len(keys) if end is None else bisect.bisect_left(keys, (end,))
+        return keys[lo:hi]
+
+    def _substring_hits(self, q: str) -> Iterable[int]:
+        if len(q) < 3:
+            return (i for i, e in enumerate(self._entries) if q in e.norm_id or q in e.norm_name)
+        hits: Optional[Set[int]] = None
+        for g in sorted(_trigrams(q), key=lambda g: len(self._postings.get(g, ()))):
+            posting = self._postings.get(g)
+            if not posting:
+                return ()
+            hits = set(posting) if hits is None else hits & posting
+            if not hits:
+                return ()
+        # Trigrams only narrow; confirm the actual substring
+        return (i for i in hits or () if q in self._entries[i].norm_id or q in self._entries[i].norm_name)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Optional[str]]]:
+        q = normalize(query)
+        if not q:
+            return []
+        limit = max(1, min(STUDY_SEARCH_MAX_RESULTS, limit))
+
+        id_prefix = self._prefixed(self._ids, q)
+        name_prefix = self._prefixed(self._names, q)
+        tiers: List[Iterable[int]] = [
+            (i for k, i in id_prefix if k == q),
+            (i for k, i in name_prefix if k == q),
+            (i for k, i in id_prefix if k != q),
+            (i for k, i in name_prefix if k != q),
+            (i for _, i in self._prefixed(self._words, q)),
+        ]
+
+        rank: Dict[int, int] = {}
+        for r, tier in enumerate(tiers):
+            # Everything in a worse tier ranks below a full top-k
+            if len(rank) >= limit:
+                break
+            for i in tier:
+                rank.setdefault(i, r)
+        if len(rank) < limit:
+            for i in self._substring_hits(q):
+                rank.setdefault(i, len(tiers))
+
+        top = heapq.nsmallest(limit, rank, key=lambda i: (rank[i], i))
+        return [{"study_id": self._entries[i].study_id, "name": self._entries[i].name} for i in top]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "studies": len(self._entries),
+            "trigrams": len(self._postings),
+            "age_s": None if self._built_at is None else round(time.monotonic() - self._built_at, 1),
+        }
+
+
+study_search = StudySearchIndex()
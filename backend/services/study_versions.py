@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import bisect
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+
+from services.question_catalog import QuestionCatalog, QuestionInfo, module_questions
+
+# Serves "all versions of a study" and the (max timestamp, count) check;
+# registered in core.mongo_indexes
+STUDY_VERSION_INDEX = [("properties.study_id", ASCENDING), ("timestamp", DESCENDING)]
+
+
+def timestamp_key(v: Any) -> float:
+    """
+    Study ``timestamp`` as epoch seconds for ordering. Accepts epoch
+    seconds/milliseconds, ISO strings and datetimes; unknown sorts first.
+    """
+    if isinstance(v, bool):
+        return float("-inf")
+    if isinstance(v, (int, float)):
+        return v / 1000.0 if abs(v) >= 1e11 else float(v)
+    if isinstance(v, datetime):
+        return (v if v.tzinfo else v.replace(tzinfo=timezone.utc)).timestamp()
+    if isinstance(v, str):
+        try:
+            return timestamp_key(float(v))
+        except ValueError:
+            pass
+        try:
+            return timestamp_key(datetime.fromisoformat(v.replace("Z", "+00:00")))
+        except ValueError:
+            return float("-inf")
+    return float("-inf")
+
+
+def version_key(doc: Dict[str, Any]) -> Tuple[float, str]:
+    """Order of a study's versions: ``timestamp_key``, then ``_id``; the last one is the latest."""
+    return (timestamp_key(doc.get("timestamp")), str(doc.get("_id", "")))
+
+
+class StudyVersions:
+    """
+    All versions of one study in a deterministic order (timestamp, then
+    ``_id``), with each version's modules and the module -> latest
+    definition map precomputed once.
+    """
+
+    def __init__(self, study_id: str, docs: List[Dict[str, Any]]):
+        self.study_id = study_id
+        self.versions = sorted(docs, key=version_key)
+        self._keys = [timestamp_key(d.get("timestamp")) for d in self.versions]
+
+        # Later versions overwrite earlier ones
+        self.module_by_id: Dict[str, Dict[str, Any]] = {}
+        self._modules: List[Dict[str, Dict[str, Any]]] = []
+        for doc in self.versions:
+            modules = {m["id"]: m for m in doc.get("modules") or [] if m.get("id")}
+            self._modules.append(modules)
+            self.module_by_id.update(modules)
+        self._questions: Dict[int, Dict[str, QuestionInfo]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.versions)
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        return self.versions[-1] if self.versions else None
+
+    def _index_at(self, when: Any) -> int:
+        return max(0, bisect.bisect_right(self._keys, timestamp_key(when)) - 1)
+
+    def at(self, when: Any) -> Optional[Dict[str, Any]]:
+        """Version active at ``when`` (last one published at or before it; else the first)."""
+        if not self.versions:
+            return None
+        return self.versions[self._index_at(when)]
+
+    def module_at(self, module_id: Optional[str], when: Any) -> Optional[Dict[str, Any]]:
+        """
+        ``module_id`` as defined in the version active at ``when``. Falls back
+        to its latest definition when ``when`` doesn't parse or that version
+        doesn't have the module.
+        """
+        if self.versions and timestamp_key(when) != float("-inf"):
+            m = self._modules[self._index_at(when)].get(module_id or "")
+            if m is not None:
+                return m
+        return self.module_by_id.get(module_id or "")
+
+    def questions_at(self, module_id: Optional[str], when: Any) -> Dict[str, QuestionInfo]:
+        """question_id -> QuestionInfo of ``module_at(module_id, when)``."""
+        m = self.module_at(module_id, when)
+        if m is None:
+            return {}
+        if m is self.module_by_id.get(module_id or ""):
+            return self.question_catalog.module(module_id)
+        key = id(m)
+        if key not in self._questions:
+            self._questions[key] = {q.question_id: q for q in module_questions(m)}
+        return self._questions[key]
+
+    @cached_property
+    def question_catalog(self) -> QuestionCatalog:
+        # Built on first use, then lives as long as this (cached) version set
+        latest = self.latest()
+        return QuestionCatalog((latest or {}).get("modules") or [], self.module_by_id)
+
+
+async def load_study_versions(studies_col: AsyncCollection, study_id: str) -> StudyVersions:
+    # No server-side sort: StudyVersions orders by version_key, which BSON order can't express
+    docs = await studies_col.find({"properties.study_id": study_id}).to_list(None)
+    return StudyVersions(study_id, docs)
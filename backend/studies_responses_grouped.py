@@ -1,150 +1,258 @@
 import json
-import os
-import re
-from fastapi import APIRouter, HTTPException
-from pymongo import MongoClient
-from bson import ObjectId
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+
+from auth import require_study_access
+from core.mongo import get_responses_col, get_studies_col, iter_docs
+from services.principal_cache import Principal
+from services.response_cache import response_cache
+from services.response_docs import (
+    PAYLOAD_FIELDS,
+    json_default,
+    legacy_study_filter,
+    merge_raw,
+    parse_responses,
+    parse_time,
+)
+from services.study_cache import study_cache
+from services.study_versions import StudyVersions
 
 router = APIRouter()
 
-MONGO_URL = os.getenv("MONGO_URL")
-MONGO_DB = os.getenv("MONGO_DB")
+# raw_responses of unknown modules echo the payload, never the legacy `raw` blob
+_PROJECTION = {"_id": 1, **{k: 1 for k in PAYLOAD_FIELDS}}
+# First "user_id" string in a raw payload
+_RAW_USER_ID = r'"user_id":\s*"([^"]*)"'
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+class _ModuleLayout:
+    """Sections of one module plus question_id -> [(section key, question text)]."""
+
+    def __init__(self, module: Dict[str, Any]):
+        self.module_name = module.get("name", "Unknown Module")
+        sections = module.get("params", {}).get("sections", [])
+        self.sections: Dict[str, str] = {}
+        self.questions: Dict[str, List[Tuple[str, Any]]] = {}
+        for idx, section in enumerate(sections):
+            sec_key = str(idx)
+            self.sections[sec_key] = section.get("name", f"Section {idx + 1}")
+            for q in section.get("questions", []):
+                q_id = q.get("id")
+                if q_id:
+                    self.questions.setdefault(q_id, []).append((sec_key, q.get("text", "No question text")))
+
+
+class _Layouts:
+    """Layout of a module as defined in the study version active at a response's time."""
+
+    def __init__(self, versions: StudyVersions):
+        self.versions = versions
+        self._by_module: Dict[int, _ModuleLayout] = {}
+
+    def get(self, module_id: str, when: Any) -> Optional[_ModuleLayout]:
+        module = self.versions.module_at(module_id, when)
+        if module is None:
+            return None
+        layout = self._by_module.get(id(module))
+        if layout is None:
+            layout = self._by_module[id(module)] = _ModuleLayout(module)
+        return layout
+
+
+def _extract_study_id(modules: Dict[str, Any]) -> str:
+    for mod in modules.values():
+        if mod.get("module_name", "").strip() == "Study ID" and "sections" in mod:
+            section0 = mod["sections"].get("0")
+            if section0 and section0.get("qa"):
+                answers = []
+                for ans in section0["qa"].values():
+                    if isinstance(ans, list):
+                        answers.extend(ans)
+                    else:
+                        answers.append(ans)
+                if answers:
+                    return str(answers[0].get("answer") or answers[0]).strip()
+    return "Unknown"
+
+
+def _add_response(modules: Dict[str, Any], doc: Dict[str, Any], layouts: _Layouts) -> None:
+    mod_id = doc.get("module_id") or "unknown_module"
+    response_time = doc.get("response_time", "Unknown")
+    layout = layouts.get(mod_id, doc.get("response_time"))
+
+    if layout is None:
+        if "unknown_module" not in modules:
+            modules["unknown_module"] = {
+                "module_name": doc.get("module_name", "Unknown Module"),
+                "raw_responses": [],
+            }
+        modules["unknown_module"]["raw_responses"].append(doc)
+        return
+
+    entry = modules.get(mod_id)
+    if entry is None:
+        # Every section is listed, stamped with the first response's time
+        entry = modules[mod_id] = {
+            "module_name": layout.module_name,
+            "sections": {
+                sec_key: {"section_name": name, "qa": {}, "response_time": response_time}
+                for sec_key, name in layout.sections.items()
+            },
+        }
+    sections = entry["sections"]
+
+    responses_data = parse_responses(doc.get("responses")) or {}
+    for q_id, answer in responses_data.items():
+        for sec_key, q_text in layout.questions.get(q_id, ()):
+            if sec_key not in sections:
+                # A later version of the module added this section
+                sections[sec_key] = {
+                    "section_name": layout.sections[sec_key], "qa": {}, "response_time": response_time,
+                }
+            sections[sec_key]["qa"].setdefault(q_text, []).append(
+                {"answer": answer, "response_time": response_time}
+            )
+
 
-if not MONGO_URL or not MONGO_DB:
-    raise Exception("MongoDB connection details are missing.")
+class _Peek:
+    """Async document stream with one document of lookahead."""
 
-client = MongoClient(MONGO_URL)
-db = client[MONGO_DB]
-responses_collection = db["responses"]
-studies_collection = db["studies"]
+    def __init__(self, docs: AsyncIterator[Dict[str, Any]]):
+        self._docs = docs
+        self.head: Optional[Dict[str, Any]] = None
+
+    async def start(self) -> "_Peek":
+        self.head = await anext(self._docs, None)
+        return self
+
+    async def pop(self) -> Dict[str, Any]:
+        doc = self.head
+        self.head = await anext(self._docs, None)
+        return doc
+
+
+def _user_order(user_id: Any) -> Tuple[int, Any]:
+    # How Mongo sorts the user ids that occur: missing/null < numbers < strings < the rest
+    if user_id is None:
+        return (0, 0)
+    if isinstance(user_id, (int, float)) and not isinstance(user_id, bool):
+        return (1, user_id)
+    if isinstance(user_id, str):
+        return (2, user_id)
+    return (3, str(user_id))
+
+
+def _legacy_pipeline(study_id: str) -> List[Dict[str, Any]]:
+    # Raw-only documents ordered by the user_id found in raw, so they can be
+    # merged per user with the current ones
+    uid = {"$regexFind": {"input": "$raw", "regex": _RAW_USER_ID}}
+    return [
+        {"$match": legacy_study_filter(study_id)},
+        {"$project": {
+            **_PROJECTION,
+            "raw": 1,
+            "_uid": {"$let": {"vars": {"m": uid}, "in": {"$arrayElemAt": ["$$m.captures", 0]}}},
+        }},
+        {"$sort": {"_uid": 1, "_id": 1}},
+    ]
+
+
+def _from_raw(doc: Dict[str, Any]) -> Dict[str, Any]:
+    doc = merge_raw(doc)
+    doc.pop("raw", None)
+    doc.pop("_uid", None)
+    return doc
+
+
+async def _grouped_body(
+    study_id: str,
+    current: _Peek,
+    legacy: _Peek,
+    layouts: _Layouts,
+) -> AsyncIterator[bytes]:
+    # Both streams arrive ordered by user, so each user is merged from the two,
+    # written out and dropped once complete.
+    yield ('{"study_id":' + json.dumps(study_id) + ',"grouped_responses":{').encode()
+
+    def user_chunk(user_id: Any, modules: Dict[str, Any], sep: str) -> bytes:
+        modules["extracted_study_id"] = _extract_study_id(modules)
+        body = json.dumps(modules, default=json_default, separators=(",", ":"))
+        return (sep + json.dumps(str(user_id)) + ":" + body).encode()
+
+    sep = ""
+    while current.head is not None or legacy.head is not None:
+        heads = []
+        if current.head is not None:
+            heads.append(_user_order(current.head.get("user_id")))
+        if legacy.head is not None:
+            heads.append(_user_order(legacy.head.get("_uid")))
+        user = min(heads)
+
+        # A user's raw-only documents go in ahead of their current ones, in alert_time order
+        old: List[Dict[str, Any]] = []
+        while legacy.head is not None and _user_order(legacy.head.get("_uid")) == user:
+            old.append(_from_raw(await legacy.pop()))
+        old.sort(key=lambda d: parse_time(d.get("alert_time")) or _EPOCH)
+
+        modules: Dict[str, Any] = {}
+        for doc in old:
+            _add_response(modules, doc, layouts)
+        name = None
+        while current.head is not None and _user_order(current.head.get("user_id")) == user:
+            doc = await current.pop()
+            if name is None:
+                name = doc.get("user_id", "unknown")
+            _add_response(modules, doc, layouts)
+        if name is None:
+            name = old[0].get("user_id", "unknown")
+        yield user_chunk(name, modules, sep)
+        sep = ","
+
+    yield b"}}"
 
-def convert_object_ids(obj):
-    if isinstance(obj, dict):
-        return {k: convert_object_ids(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_object_ids(i) for i in obj]
-    elif isinstance(obj, ObjectId):
-        return str(obj)
-    return obj
 
 @router.get("/studies_responses_grouped/{study_id}")
-def get_grouped_study_responses(study_id: str):
-    try:
-        # Fetch responses
-        pattern = rf'"study_id":"{study_id}"'
-        regex = re.compile(pattern)
-        query = {"$or": [{"raw": {"$regex": regex}}, {"study_id": study_id}]}
-        response_docs = list(responses_collection.find(query))
-        if not response_docs:
+async def get_grouped_study_responses(
+    study_id: str,
+    _user: Principal = Depends(require_study_access),
+    responses_collection: AsyncCollection = Depends(get_responses_col),
+    studies_collection: AsyncCollection = Depends(get_studies_col),
+):
+    """
+    Responses of ``study_id`` grouped per user, module and section.
+
+    Reads documents by their top-level ``study_id``, plus those that only
+    name it inside ``raw`` (not migrated yet, or written in the old shape
+    since), streamed per user from two user-ordered queries.
+    """
+    async def compute():
+        # (study_id, user_id, alert_time) index: users arrive contiguously
+        cursor = responses_collection.find({"study_id": study_id}, projection=_PROJECTION).sort(
+            [("user_id", ASCENDING), ("alert_time", ASCENDING)]
+        )
+        current = await _Peek(iter_docs(cursor)).start()
+        # Sorting on a computed field can't use an index; the server spills to disk if it must
+        legacy_cursor = await responses_collection.aggregate(_legacy_pipeline(study_id), allowDiskUse=True)
+        legacy = await _Peek(iter_docs(legacy_cursor)).start()
+        if current.head is None and legacy.head is None:
             raise HTTPException(status_code=404, detail=f"No responses found for study_id {study_id}")
 
-        parsed_responses = []
-        encountered_module_ids = set()
-
-        for doc in response_docs:
-            if "raw" in doc and isinstance(doc["raw"], str):
-                try:
-                    raw_data = json.loads(doc["raw"])
-                    doc.update(raw_data)
-                except Exception as e:
-                    raise HTTPException(status_code=500, detail=f"Error parsing raw field: {e}")
-            parsed_responses.append(doc)
-            if "module_id" in doc:
-                encountered_module_ids.add(doc["module_id"])
-
-        matching_studies = list(studies_collection.find({"properties.study_id": study_id}))
-        if not matching_studies:
+        versions = await study_cache.get_resolver(studies_collection, study_id)
+        if not versions:
             raise HTTPException(status_code=404, detail=f"No study documents found for study_id {study_id}")
 
-        module_to_study_map = {}
-        for mod_id in encountered_module_ids:
-            studies_with_module = [
-                s for s in matching_studies if any(m.get("id") == mod_id for m in s.get("modules", []))
-            ]
-            if studies_with_module:
-                latest = max(studies_with_module, key=lambda s: s.get("timestamp", 0))
-                module_to_study_map[mod_id] = latest
-
-        grouped = {}
-
-        for doc in parsed_responses:
-            user_id = doc.get("user_id", "unknown")
-            mod_id = doc.get("module_id") or "unknown_module"
-            module_name = doc.get("module_name", "Unknown Module")
-            response_time = doc.get("response_time", "Unknown")
-
-            responses_data = doc.get("responses", {})
-            if isinstance(responses_data, str):
-                try:
-                    responses_data = json.loads(responses_data)
-                except Exception:
-                    responses_data = {}
-
-            if user_id not in grouped:
-                grouped[user_id] = {}
-
-            if mod_id in module_to_study_map:
-                study_doc = module_to_study_map[mod_id]
-                module = next((m for m in study_doc.get("modules", []) if m.get("id") == mod_id), None)
-                if not module:
-                    continue
-                sections = module.get("params", {}).get("sections", [])
-                if mod_id not in grouped[user_id]:
-                    grouped[user_id][mod_id] = {
-                        "module_name": module.get("name", "Unknown Module"),
-                        "sections": {}
-                    }
-                for idx, section in enumerate(sections):
-                    sec_key = str(idx)
-                    section_name = section.get("name", f"Section {idx + 1}")
-                    questions = section.get("questions", [])
-                    if sec_key not in grouped[user_id][mod_id]["sections"]:
-                        grouped[user_id][mod_id]["sections"][sec_key] = {
-                            "section_name": section_name,
-                            "qa": {},
-                            "response_time": response_time
-                        }
-                    for q in questions:
-                        q_id = q.get("id")
-                        q_text = q.get("text", "No question text")
-                        if q_id and q_id in responses_data:
-                            answer = responses_data[q_id]
-                            answer_entry = {"answer": answer, "response_time": response_time}
-                            if q_text not in grouped[user_id][mod_id]["sections"][sec_key]["qa"]:
-                                grouped[user_id][mod_id]["sections"][sec_key]["qa"][q_text] = []
-                            grouped[user_id][mod_id]["sections"][sec_key]["qa"][q_text].append(answer_entry)
-            else:
-                if "unknown_module" not in grouped[user_id]:
-                    grouped[user_id]["unknown_module"] = {
-                        "module_name": module_name,
-                        "raw_responses": []
-                    }
-                grouped[user_id]["unknown_module"]["raw_responses"].append(doc)
-
-        # Extract Study ID for each user
-        for user_id, modules in grouped.items():
-            extracted_study_id = None
-            for key, mod in modules.items():
-                if key == "extracted_study_id":
-                    continue
-                if mod.get("module_name", "").strip() == "Study ID" and "sections" in mod:
-                    section0 = mod["sections"].get("0")
-                    if section0 and section0.get("qa"):
-                        answers = []
-                        for ans in section0["qa"].values():
-                            if isinstance(ans, list):
-                                answers.extend(ans)
-                            else:
-                                answers.append(ans)
-                        if answers:
-                            extracted_study_id = str(answers[0].get("answer") or answers[0]).strip()
-                            break
-            modules["extracted_study_id"] = extracted_study_id or "Unknown"
-
-        return convert_object_ids({
-            "study_id": study_id,
-            "grouped_responses": grouped
-        })
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        return StreamingResponse(
+            _grouped_body(study_id, current, legacy, _Layouts(versions)),
+            media_type="application/json",
+        )
+
+    return await response_cache.respond(
+        "grouped", study_id, {}, compute,
+        studies_col=studies_collection, responses_col=responses_collection, stream=True,
+    )
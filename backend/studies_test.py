@@ -1,56 +1,81 @@
 import json
-import os
-import re
-from fastapi import APIRouter, HTTPException
-from pymongo import MongoClient
+from datetime import datetime
+from typing import Any, Dict, List
+
+from fastapi import APIRouter, HTTPException, Depends
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+
+from auth import require_study_access
+from core.mongo import MONGO_BATCH_SIZE, get_responses_col, iter_docs
+from services.principal_cache import Principal
+from services.response_docs import PAYLOAD_FIELDS, study_filter
 
 router = APIRouter()
 
-# Get the MongoDB connection string and database name from environment variables.
-MONGO_URL = os.getenv("MONGO_URL")
-if not MONGO_URL:
-    raise Exception("MONGO_URL is not set in environment variables")
-MONGO_DB = os.getenv("MONGO_DB")
-if not MONGO_DB:
-    raise Exception("MONGO_DB is not set in environment variables")
+_PROJECTION = {"_id": 0, "raw": 1, **{k: 1 for k in PAYLOAD_FIELDS}}
+
+
+def _payload(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # Shaped like a decoded `raw` string: times as ISO strings
+    return {k: v.isoformat() if isinstance(v, datetime) else v for k, v in doc.items() if k != "raw"}
+
+
+def _decode_batch(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Payload of each document: ``raw`` decoded where present (documents with
+    a malformed ``raw`` are skipped), otherwise the extracted top-level fields.
+    """
+    out: List[Dict[str, Any]] = []
+    for d in docs:
+        raw = d.get("raw")
+        if isinstance(raw, str):
+            try:
+                parsed = json.loads(raw)
+            except ValueError:
+                continue
+            if isinstance(parsed, dict):
+                out.append(parsed)
+        else:
+            out.append(_payload(d))
+    return out
 
-# Create a MongoDB client and select the database and collection.
-client = MongoClient(MONGO_URL)
-db = client[MONGO_DB]
-# Change "responses" to the actual collection name if different.
-collection = db["responses"]
 
 @router.get("/study-id={study_id}")
-def get_study_responses(study_id: str):
+async def get_study_responses(
+    study_id: str,
+    _user: Principal = Depends(require_study_access),
+    collection: AsyncCollection = Depends(get_responses_col),
+):
     """
     Retrieve and render all responses for a given study_id.
-    Searches for documents where the "raw" field contains the study_id,
-    then parses the JSON string in "raw" and groups the results by user_id.
+    Looks documents up by their indexed top-level study_id (and, for
+    documents that have none, by study_id inside "raw"), decodes
+    the JSON string in "raw" where it is still present and groups the
+    results by user_id.
     """
-    try:
-        # regex that matches the substring: "study_id":"<study_id>"
-        pattern = rf'"study_id":"{study_id}"'
-        regex = re.compile(pattern)
-        query = {"raw": {"$regex": regex}}
-        docs = list(collection.find(query))
-        print("Using regex pattern:", pattern)
-        if not docs:
-            raise HTTPException(status_code=404, detail=f"No responses found for study_id {study_id}")
-        
-        # Group responses by user_id
-        grouped = {}
-        for doc in docs:
-            raw_data = doc.get("raw")
-            if raw_data:
-                try:
-                    parsed = json.loads(raw_data)
-                    user_id = parsed.get("user_id", "unknown")
-                    if user_id not in grouped:
-                        grouped[user_id] = []
-                    grouped[user_id].append(parsed)
-                except Exception as e:
-                    continue
-        
-        return {"study_id": study_id, "grouped_responses": grouped}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    cursor = collection.find(study_filter(study_id), projection=_PROJECTION).sort(
+        [("response_time", ASCENDING), ("_id", ASCENDING)]
+    )
+
+    # Group responses by user_id
+    grouped: Dict[str, List[Dict[str, Any]]] = {}
+    found = False
+    batch: List[Dict[str, Any]] = []
+
+    def flush() -> None:
+        for parsed in _decode_batch(batch):
+            grouped.setdefault(parsed.get("user_id", "unknown"), []).append(parsed)
+        batch.clear()
+
+    async for doc in iter_docs(cursor):
+        found = True
+        batch.append(doc)
+        if len(batch) >= MONGO_BATCH_SIZE:
+            flush()
+    flush()
+
+    if not found:
+        raise HTTPException(status_code=404, detail=f"No responses found for study_id {study_id}")
+
+    return {"study_id": study_id, "grouped_responses": grouped}
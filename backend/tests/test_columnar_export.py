@@ -0,0 +1,81 @@
+import asyncio
+import io
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from services.columnar_export import ExportError, ResponseTableLayout, export_body
+from services.question_catalog import QuestionCatalog
+
+MODULE = {
+    "id": "m1",
+    "name": "Daily",
+    "params": {"sections": [{"questions": [
+        {"id": "q1", "type": "number", "text": "Mood"},
+        {"id": "q2", "type": "multi", "text": "Sleep", "options": ["1 bad", "2 ok", "3 good"]},
+    ]}]},
+}
+
+
+def _layout():
+    return ResponseTableLayout(QuestionCatalog([MODULE], {"m1": MODULE}))
+
+
+def _export(docs, layout=None):
+    layout = layout or _layout()
+
+    async def rows():
+        for d in docs:
+            yield d
+
+    async def collect():
+        return b"".join([chunk async for chunk in export_body(layout, "parquet", rows())])
+
+    return pq.read_table(io.BytesIO(asyncio.run(collect())))
+
+
+def test_export_survives_missing_and_unparseable_responses():
+    table = _export(
+        [
+            {"user_id": "u1", "module_id": "m1", "responses": {"q1": 3, "extra": "x"}},
+            {"user_id": "u2", "module_id": "m1", "responses": None},
+            {"user_id": "u3", "module_id": "m1", "responses": "{not json"},
+            {"user_id": "u4", "module_id": "m1"},
+        ]
+    ).to_pydict()
+
+    assert table["user_id"] == ["u1", "u2", "u3", "u4"]
+    assert table["m1:q1"] == [3.0, None, None, None]
+    assert json.loads(table["other_responses"][0]) == {"extra": "x"}
+    assert table["other_responses"][1:] == [None, "{not json", None]
+
+
+def test_uncodable_numeric_answers_go_to_other_responses():
+    table = _export(
+        [
+            {"user_id": "u1", "module_id": "m1", "responses": {"q1": "n/a", "q2": ["1", "2"]}},
+            {"user_id": "u2", "module_id": "m1", "responses": {"q1": "4", "q2": "2 ok"}},
+        ]
+    ).to_pydict()
+
+    assert table["m1:q1"] == [None, 4.0] and table["m1:q2"] == [None, 2.0]
+    assert json.loads(table["other_responses"][0]) == {"q1": "n/a", "q2": ["1", "2"]}
+    assert table["other_responses"][1] is None
+
+
+def test_out_of_range_module_index_is_dropped():
+    table = _export([{"user_id": "u1", "module_id": "m1", "module_index": 2 ** 70}]).to_pydict()
+    assert table["module_index"] == [None]
+
+
+def test_encoding_failure_aborts_the_export():
+    layout = _layout()
+
+    def broken(docs):
+        raise pa.ArrowInvalid("boom")
+
+    layout.batch = broken
+    with pytest.raises(ExportError):
+        _export([{"user_id": "u1", "module_id": "m1"}], layout)
@@ -0,0 +1,69 @@
+import asyncio
+import json
+import time
+
+import fakeredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from services.response_cache import ResponseCache
+
+
+class FailingRedis:
+    """Every command fails, as if Redis were down."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def _fail(self, *args, **kwargs):
+        self.calls += 1
+        raise RedisConnectionError("Timeout connecting to server")
+
+    get = set = incr = _fail
+
+
+def _respond(cache, value=None):
+    async def compute():
+        return value or {"ok": True}
+
+    return asyncio.run(cache.respond("route", "s1", {"a": 1}, compute))
+
+
+def test_breaker_bypasses_redis_after_a_failure():
+    client = FailingRedis()
+    cache = ResponseCache(client=client, breaker_s=60)
+
+    first = _respond(cache)
+    assert json.loads(first.body) == {"ok": True}
+    assert client.calls == 1 and cache.stats.errors == 1
+
+    for _ in range(5):
+        assert json.loads(_respond(cache).body) == {"ok": True}
+    assert client.calls == 1
+    assert cache.stats.bypassed == 5
+    assert cache.snapshot()["breaker_open"]
+
+
+def test_breaker_probes_again_with_growing_backoff():
+    client = FailingRedis()
+    cache = ResponseCache(client=client, breaker_s=10, breaker_max_s=25)
+
+    windows = []
+    for _ in range(4):
+        _respond(cache)
+        windows.append(cache._open_until - time.monotonic())
+        cache._open_until = 0.0  # let the window elapse
+    assert client.calls == 4
+    assert [round(w) for w in windows] == [10, 20, 25, 25]
+
+
+def test_breaker_closes_once_redis_answers_again():
+    cache = ResponseCache(client=FailingRedis(), breaker_s=60)
+    _respond(cache)
+    assert cache.snapshot()["breaker_open"]
+
+    cache._client = fakeredis.FakeAsyncRedis()
+    cache._open_until = 0.0
+    assert _respond(cache).headers["X-Cache"] == "MISS"
+    assert _respond(cache).headers["X-Cache"] == "HIT"
+    assert not cache.snapshot()["breaker_open"]
+    assert cache._failures == 0
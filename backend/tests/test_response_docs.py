@@ -0,0 +1,26 @@
+import json
+from datetime import datetime
+
+import bson
+from bson.codec_options import CodecOptions
+from pydantic import TypeAdapter
+
+from services.response_docs import json_default, parse_time
+
+# What the tz_aware client in core/mongo.py hands the routes for a BSON date
+STORED = bson.decode(
+    bson.encode({"t": datetime(2024, 5, 1, 8, 30, 15, 123000)}),
+    codec_options=CodecOptions(tz_aware=True),
+)["t"]
+
+
+def test_streamed_routes_write_dates_with_a_utc_offset():
+    assert json.dumps({"t": STORED}, default=json_default) == '{"t": "2024-05-01T08:30:15.123000+00:00"}'
+
+
+def test_response_models_write_dates_with_z():
+    assert TypeAdapter(datetime).dump_json(STORED) == b'"2024-05-01T08:30:15.123000Z"'
+
+
+def test_string_and_bson_times_serialise_alike():
+    assert json_default(parse_time("2024-05-01 08:30:15.123Z")) == json_default(STORED)
@@ -0,0 +1,146 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from services.response_docs import parse_responses
+from services.response_query import after_cursor, answer_filter, answer_matches, decode_cursor, encode_cursor
+
+
+def _mixed_collection():
+    col = mongomock.MongoClient().db.responses
+    times = [
+        datetime(2024, 1, 3, tzinfo=timezone.utc),
+        "2024-01-02T08:00:00Z",
+        None,
+        datetime(2024, 1, 1, tzinfo=timezone.utc),
+        "2024-01-02T08:00:00Z",
+        1704067200,
+        "2023-12-31T23:00:00+00:00",
+        datetime(2024, 1, 3, tzinfo=timezone.utc),
+        None,
+    ]
+    docs = [{"_id": ObjectId(), "response_time": t} for t in times]
+    docs.append({"_id": ObjectId()})  # no response_time at all
+    col.insert_many(docs)
+    return col
+
+
+def _pages(col, sort: str, limit: int):
+    sort_dir = DESCENDING if sort == "desc" else ASCENDING
+    seen, cursor = [], None
+    while True:
+        q = {} if cursor is None else after_cursor(*decode_cursor(cursor, sort), sort_dir)
+        page = list(col.find(q).sort([("response_time", sort_dir), ("_id", sort_dir)]).limit(limit))
+        seen.extend(d["_id"] for d in page)
+        if len(page) < limit:
+            return seen
+        cursor = encode_cursor(page[-1], sort)
+
+
+@pytest.mark.parametrize("sort", ["asc", "desc"])
+@pytest.mark.parametrize("limit", [1, 2, 3, 4])
+def test_keyset_paging_crosses_mixed_response_time_types(sort, limit):
+    col = _mixed_collection()
+    sort_dir = DESCENDING if sort == "desc" else ASCENDING
+    expected = [d["_id"] for d in col.find().sort([("response_time", sort_dir), ("_id", sort_dir)])]
+
+    assert _pages(col, sort, limit) == expected
+
+
+def test_cursor_rejects_other_sort_and_garbage():
+    token = encode_cursor({"_id": ObjectId(), "response_time": datetime(2024, 1, 1, tzinfo=timezone.utc)}, "asc")
+    with pytest.raises(ValueError):
+        decode_cursor(token, "desc")
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor", "asc")
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        '{"t": null, "id": {"$oid": "zz"}, "s": "asc"}',
+        '{"t": {"$ne": null}, "id": {"$oid": "5f0000000000000000000000"}, "s": "asc"}',
+        '{"t": null, "id": {"$gt": ""}, "s": "asc"}',
+        '{"t": [1], "id": 1, "s": "asc"}',
+        '{"t": true, "id": 1, "s": "asc"}',
+    ],
+)
+def test_cursor_rejects_forged_values(payload):
+    token = base64.urlsafe_b64encode(payload.encode()).decode()
+    with pytest.raises(ValueError):
+        decode_cursor(token, "asc")
+
+
+ANSWERS = [5, 5.0, 1.5, 15, 0, True, False, "5", "5.0", "a5b", "True", "true", "", None, ["x5", 2], [1, 2], {"k": 5}]
+FILTERS = [
+    ([("q", "5")], []),
+    ([("q", "None")], []),
+    ([("q", "['x5', 2]")], []),
+    ([], [("q", "Tru")]),
+    ([], [("q", "'k'")]),
+    ([], [("q", "5.0")]),
+    ([("q", "5.0")], []),
+    ([("q", "True")], []),
+    ([("q", "2")], []),
+    ([("q", "a5b")], []),
+    ([], [("q", "5")]),
+    ([], [("q", "1.")]),
+    ([], [("q", "a5")]),
+    ([], [("q", "true")]),
+    ([("q", "5")], [("q", "5")]),
+]
+
+
+def _selected(col, exact, contains):
+    """What the labeled endpoint returns: the Mongo prefilter, then answer_matches on every row."""
+    q = answer_filter(exact, contains)
+    return {
+        d["_id"]
+        for d in col.find(q)
+        if answer_matches(parse_responses(d["responses"]) or {}, exact, contains)
+    }
+
+
+@pytest.mark.parametrize("exact,contains", FILTERS)
+def test_answer_filters_agree_across_storage_shapes(exact, contains):
+    col = mongomock.MongoClient().db.responses
+    for i, answer in enumerate(ANSWERS):
+        col.insert_one({"_id": f"doc{i}", "responses": {"q": answer}})
+        col.insert_one({"_id": f"str{i}", "responses": json.dumps({"q": answer})})
+
+    selected = _selected(col, exact, contains)
+    as_doc = {i for i in range(len(ANSWERS)) if f"doc{i}" in selected}
+    as_str = {i for i in range(len(ANSWERS)) if f"str{i}" in selected}
+    assert as_doc == as_str
+    assert as_doc == {i for i, a in enumerate(ANSWERS) if answer_matches({"q": a}, exact, contains)}
+
+
+def test_answer_semantics_are_str_of_the_answer():
+    def hit(answer, exact=(), contains=()):
+        return answer_matches({"q": answer}, list(exact), list(contains))
+
+    assert hit(5.0, exact=[("q", "5.0")]) and not hit(5.0, exact=[("q", "5")])
+    assert hit(5, exact=[("q", "5")]) and not hit(5, exact=[("q", "5.0")])
+    assert hit(5.0, contains=[("q", "5.0")]) and hit(15, contains=[("q", "5")])
+    assert hit(True, exact=[("q", "True")]) and hit(True, contains=[("q", "Tru")])
+    assert not hit(1, exact=[("q", "True")])
+    assert hit(["a", "b"], exact=[("q", "['a', 'b']")]) and not hit(["a", "b"], exact=[("q", "b")])
+    assert hit(["a", "b"], contains=[("q", "'b'")])
+    assert hit(None, exact=[("q", "None")])
+    assert not answer_matches({}, [("q", "None")], [])
+
+
+def test_unpathable_question_ids_are_filtered_in_python():
+    col = mongomock.MongoClient().db.responses
+    col.insert_one({"_id": "hit", "responses": {"1.a": "yes", "q": "x"}})
+    col.insert_one({"_id": "miss", "responses": {"1.a": "no", "q": "x"}})
+
+    assert answer_filter([("1.a", "yes")], []) is None
+    assert _selected(col, [("1.a", "yes")], []) == {"hit"}
+    assert _selected(col, [("q", "x")], [("$x", "y")]) == set()
+    assert _selected(col, [("q", "x")], [("1.a", "ye")]) == {"hit"}
@@ -0,0 +1,40 @@
+import asyncio
+
+from services.study_cache import StudyCache
+
+
+class _Rows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length=None):
+        await asyncio.sleep(0.01)
+        return self.rows
+
+
+class _CountingCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.aggregates = 0
+        self.finds = 0
+
+    async def aggregate(self, pipeline):
+        self.aggregates += 1
+        return _Rows([{"_id": None, "v": max(d["timestamp"] for d in self.docs), "n": len(self.docs)}])
+
+    def find(self, *args, **kwargs):
+        self.finds += 1
+        return _Rows(list(self.docs))
+
+
+def test_concurrent_misses_load_the_study_once():
+    col = _CountingCollection([{"_id": "a", "properties": {"study_id": "s1"}, "timestamp": 1}])
+    cache = StudyCache()
+
+    async def burst():
+        return await asyncio.gather(*(cache.get_resolver(col, "s1") for _ in range(20)))
+
+    resolvers = asyncio.run(burst())
+    assert col.aggregates == 1 and col.finds == 1
+    assert all(r is resolvers[0] for r in resolvers)
+    assert cache.stats.misses == 1
@@ -0,0 +1,40 @@
+import asyncio
+from datetime import datetime, timezone
+
+import mongomock
+
+from services.study_catalog import _VERSION_PIPELINE, StudyCatalog
+
+
+class _Rows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def to_list(self, length=None):
+        return self.rows if length is None else self.rows[:length]
+
+
+class _AsyncCollection:
+    def __init__(self, col):
+        self.col = col
+
+    async def aggregate(self, pipeline):
+        if pipeline is _VERSION_PIPELINE:
+            # mongomock can't $max across BSON types
+            return _Rows([{"v": None, "n": self.col.count_documents({})}])
+        return _Rows(list(self.col.aggregate(pipeline)))
+
+
+def test_latest_version_follows_timestamp_key_across_types():
+    col = mongomock.MongoClient().db.studies
+    col.insert_many([
+        # BSON order would rank the date first; by time the epoch number is newest
+        {"properties": {"study_id": "s1"}, "title": "Old", "timestamp": datetime(2023, 1, 1, tzinfo=timezone.utc)},
+        {"properties": {"study_id": "s1"}, "title": "Middle", "timestamp": "2024-01-01T00:00:00Z"},
+        {"properties": {"study_id": "s1"}, "title": "New", "timestamp": 1735689600000},  # 2025-01-01, ms
+        {"properties": {"study_id": "s2"}, "title": "Other", "timestamp": 1},
+    ])
+    catalog = StudyCatalog()
+    asyncio.run(catalog.refresh(_AsyncCollection(col)))
+
+    assert [s["title"] for s in catalog.page(0, None)] == ["New", "Other"]
@@ -0,0 +1,47 @@
+import asyncio
+
+from services.study_search import StudySearchIndex
+
+
+class _CountingCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.finds = 0
+
+    def find(self, *args, **kwargs):
+        self.finds += 1
+
+        async def rows():
+            await asyncio.sleep(0.01)
+            for d in self.docs:
+                yield d
+
+        return rows()
+
+
+def test_cold_start_builds_the_index_once():
+    col = _CountingCollection([{"properties": {"study_id": "sleep-study", "study_name": "Sleep"}, "timestamp": 1}])
+    index = StudySearchIndex()
+
+    async def burst():
+        await asyncio.gather(*(index.ensure_fresh(col) for _ in range(20)))
+
+    asyncio.run(burst())
+    assert col.finds == 1
+    assert index.search("sle") == [{"study_id": "sleep-study", "name": "Sleep"}]
+
+
+def test_same_timestamp_versions_resolve_by_id():
+    col = _CountingCollection([
+        {"_id": "b", "properties": {"study_id": "s1", "study_name": "Newer"}, "timestamp": 5},
+        {"_id": "a", "properties": {"study_id": "s1", "study_name": "Older"}, "timestamp": 5},
+    ])
+    index = StudySearchIndex()
+    asyncio.run(index.refresh(col))
+    assert index.search("s1") == [{"study_id": "s1", "name": "Newer"}]
+
+
+def test_prefix_range_covers_characters_past_the_bmp():
+    keys = sorted([("ab", 0), ("ab\uffff", 1), ("ab\U0001F600", 2), ("ac", 3)])
+    assert StudySearchIndex._prefixed(keys, "ab") == keys[:3]
+    assert StudySearchIndex._prefixed(keys, "ab\U0010FFFF") == []
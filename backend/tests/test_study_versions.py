@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+
+from services.study_versions import StudyVersions
+
+
+def _module(text, extra=()):
+    questions = [{"id": "q1", "type": "text", "text": text}] + [{"id": q, "type": "text"} for q in extra]
+    return {"id": "m1", "name": "Daily", "params": {"sections": [{"questions": questions}]}}
+
+
+def _versions():
+    return StudyVersions(
+        "s1",
+        [
+            {"_id": "b", "timestamp": "2024-03-01T00:00:00Z", "modules": [_module("How are you now?", ["q2"])]},
+            {"_id": "a", "timestamp": 1704067200, "modules": [_module("How are you?")]},  # 2024-01-01
+        ],
+    )
+
+
+def test_responses_are_labeled_with_the_version_active_at_their_time():
+    versions = _versions()
+    old = versions.questions_at("m1", datetime(2024, 2, 1, tzinfo=timezone.utc))
+    new = versions.questions_at("m1", "2024-03-02T10:00:00Z")
+
+    assert old["q1"].question_text == "How are you?" and "q2" not in old
+    assert new["q1"].question_text == "How are you now?" and "q2" in new
+    assert versions.at("2024-02-01T00:00:00Z")["_id"] == "a"
+
+
+def test_unknown_times_and_modules_fall_back_to_the_latest_definition():
+    versions = _versions()
+    assert versions.questions_at("m1", None)["q1"].question_text == "How are you now?"
+    assert versions.questions_at("m1", "not a time") is versions.question_catalog.module("m1")
+    assert versions.questions_at("m9", "2024-02-01T00:00:00Z") == {}
@@ -3,6 +3,7 @@
 import { useEffect, useMemo, useState } from "react";
 import {
   fetchLabeledResponses,
+  fetchAllLabeledResponses,
   fetchFacets,
   fetchStudyQuestions,
   fetchUserMapping,
@@ -106,17 +107,23 @@ export default function StudyResultsViewV2({ studyId }: Props) {
     setLoading(true);
     setError(null);
     try {
-      const isCalendar = activeView === "calendar";
-      const res = await fetchLabeledResponses(studyId, {
+      const filters = {
         user_id: effectiveUserIds.length ? effectiveUserIds : undefined,
         module_id: moduleIds.length ? moduleIds : undefined,
         from: from || undefined,
         to: to || undefined,
-        sort: "desc",
-        skip: isCalendar ? 0 : (pageArg - 1) * TABLE_PAGE_SIZE,
-        limit: isCalendar ? CALENDAR_LIMIT : TABLE_PAGE_SIZE,
-      });
-      setRows(res);
+        sort: "desc" as const,
+      };
+      if (activeView === "calendar") {
+        setRows(await fetchAllLabeledResponses(studyId, { ...filters, limit: CALENDAR_LIMIT }));
+      } else {
+        const res = await fetchLabeledResponses(studyId, {
+          ...filters,
+          skip: (pageArg - 1) * TABLE_PAGE_SIZE,
+          limit: TABLE_PAGE_SIZE,
+        });
+        setRows(res.items);
+      }
     } catch (e: any) {
       setError(e?.message ?? "Failed to load data");
       setRows([]);
@@ -1,7 +1,7 @@
 "use client";
 
 import { useMemo, useState } from "react";
-import { fetchLabeledResponses, LabeledSurveyResponseOut } from "@/app/lib/responses";
+import { fetchAllLabeledResponses, LabeledSurveyResponseOut } from "@/app/lib/responses";
 import { RoleKey, SleepRow } from "../lib/types";
 import { toDate, toInt } from "../lib/vizUtils";
 
@@ -49,7 +49,7 @@ export function useSleep(studyId: string, roles: Record<RoleKey, string>, opts:
 
     setLoading(true);
     try {
-      const res = await fetchLabeledResponses(studyId, {
+      const res = await fetchAllLabeledResponses(studyId, {
         user_id: opts.userIds && opts.userIds.length ? opts.userIds : undefined,
         module_id: chosenModules,
         from: opts.from || undefined,
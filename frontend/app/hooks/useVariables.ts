@@ -1,6 +1,6 @@
 "use client";
 import { useEffect, useMemo, useState } from "react";
-import { fetchLabeledResponses } from "@/app/lib/responses";
+import { fetchAllLabeledResponses } from "@/app/lib/responses";
 import { InferredStudyQuestion, VarRow } from "../lib/types";
 import { isSelectableNumeric, toNumberLoose } from "../lib/vizUtils";
 
@@ -44,7 +44,7 @@ export function useVariables(
     }
     setLoading(true);
     try {
-      const docs = await fetchLabeledResponses(studyId, {
+      const docs = await fetchAllLabeledResponses(studyId, {
         user_id: opts.userIds && opts.userIds.length ? opts.userIds : undefined,
         module_id: selectedModules,
         from: opts.from || undefined,
@@ -20,6 +20,26 @@ export type StructureCountOut = {
   per_module: Record<string, number>;
   per_module_meta: Record<string, ModuleMeta>;
   total: number;
+  max_offset_days: number;
+};
+
+export type ModuleAdherenceOut = {
+  module_name: string;
+  expected: number;
+  completed: number;
+};
+
+export type UserAdherenceOut = {
+  user_id: string;
+  expected: number;
+  completed: number;
+  per_module: Record<string, ModuleAdherenceOut>;
+};
+
+export type AdherenceSummaryOut = {
+  study_id: string;
+  tz: string;
+  users: UserAdherenceOut[];
 };
 
 export function safeTZ(): string {
@@ -102,4 +122,34 @@ export async function fetchAdherenceStructureCount(
   }
 
   return res.json();
-}
\ No newline at end of file
+}
+export async function fetchAdherenceSummary(params: {
+  studyId: string;
+  tz: string;
+  userIds?: string[];
+  moduleIds?: string[];
+  from?: string; // ISO datetime (response_time)
+  to?: string;
+  token?: string;
+}): Promise<AdherenceSummaryOut> {
+  const qs = new URLSearchParams({ study_id: params.studyId, tz: params.tz });
+  if (params.userIds?.length) qs.set("user_ids", params.userIds.join(","));
+  if (params.moduleIds?.length) qs.set("module_ids", params.moduleIds.join(","));
+  if (params.from) qs.set("from", params.from);
+  if (params.to) qs.set("to", params.to);
+
+  const res = await fetch(`${BASE}/summary?${qs.toString()}`, {
+    headers: {
+      Accept: "application/json",
+      ...authHeader(params.token),
+    },
+    cache: "no-store",
+  });
+
+  if (!res.ok) {
+    const text = await res.text().catch(() => "");
+    throw new Error(`summary: ${res.status} ${res.statusText} ${text}`);
+  }
+
+  return res.json();
+}
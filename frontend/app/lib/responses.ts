@@ -1,9 +1,11 @@
-import { LabeledSurveyResponseOut } from "@/app/types/schemas";
+import { LabeledResponsesPage, LabeledSurveyResponseOut } from "@/app/types/schemas";
 
 /* ---------------------------------- */
 /* Config                             */
 /* ---------------------------------- */
 const API_BASE = process.env.NEXT_PUBLIC_API_BASE ?? "";
+/** Server-side cap on rows per responses:labeled page */
+const PAGE_LIMIT = 1000;
 
 /* ---------------------------------- */
 /* Types                              */
@@ -33,6 +35,7 @@ type FetchOptions = {
   sort?: "asc" | "desc";
   skip?: number;
   limit?: number;
+  cursor?: string;
 };
 
 /* ---------------------------------- */
@@ -49,6 +52,7 @@ function buildQuery(opts: FetchOptions = {}) {
   p.append("sort", opts.sort ?? "desc");
   p.append("skip", String(opts.skip ?? 0));
   p.append("limit", String(opts.limit ?? 200));
+  if (opts.cursor) p.append("cursor", opts.cursor);
   return p.toString();
 }
 
@@ -92,7 +96,7 @@ export async function fetchStudyQuestions(
 export async function fetchLabeledResponses(
   studyId: string,
   opts: FetchOptions = {}
-): Promise<LabeledSurveyResponseOut[]> {
+): Promise<LabeledResponsesPage> {
   const qs = buildQuery(opts);
   const url = `${API_BASE}/api/studies/${encodeURIComponent(studyId)}/responses:labeled?${qs}`;
   const res = await fetch(url, {
@@ -110,9 +114,31 @@ export async function fetchLabeledResponses(
   return res.json();
 }
 
+/** Follows next_cursor until `limit` rows (or the end) are collected. */
+export async function fetchAllLabeledResponses(
+  studyId: string,
+  opts: Omit<FetchOptions, "skip" | "cursor"> = {}
+): Promise<LabeledSurveyResponseOut[]> {
+  const total = opts.limit ?? Infinity;
+  const rows: LabeledSurveyResponseOut[] = [];
+  let cursor: string | undefined;
+  do {
+    const page = await fetchLabeledResponses(studyId, {
+      ...opts,
+      limit: Math.min(PAGE_LIMIT, total - rows.length),
+      cursor,
+    });
+    rows.push(...page.items);
+    cursor = page.next_cursor ?? undefined;
+  } while (cursor && rows.length < total);
+  return rows;
+}
+
 export type Facets = {
   users: string[];
-  modules: { id: string; name: string }[];
+  modules: { id: string; name: string; count?: number }[];
+  user_counts?: Record<string, number>;
+  total?: number;
 };
 
 export async function fetchFacets(
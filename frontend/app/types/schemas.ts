@@ -20,6 +20,11 @@ export interface LabeledSurveyResponseOut {
   answers: QuestionAnswer[];
 }
 
+export interface LabeledResponsesPage {
+  items: LabeledSurveyResponseOut[];
+  next_cursor?: string | null;
+}
+
 export type FacetsOut = {
     users: string[];
     modules: { id: string; name: string }[];